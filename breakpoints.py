@@ -0,0 +1,141 @@
+import ast
+from typing import Callable, Collection, Iterator
+
+from registers import Registers
+
+import logging
+logger = logging.getLogger(__name__)
+
+# names that can be used in conditions (hits = how many times PC reached the breakpoint's address)
+conditionNames: set[str] = {"A", "X", "L", "B", "S", "T", "F", "PC", "SW", "hits"}
+
+# python syntax allowed in conditions
+conditionNodes: tuple[type, ...] = (
+	ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.Invert,
+	ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.FloorDiv, ast.Mod, ast.BitAnd, ast.BitOr, ast.BitXor, ast.LShift, ast.RShift,
+	ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+	ast.Name, ast.Load, ast.Constant
+)
+
+# breakpoint that only stops the machine if its condition is true
+class ConditionalBreakpoint():
+
+	address: int
+	condition: Callable[[Registers, int], bool]		# compiled condition (registers, hits)
+	source: str										# condition as entered by the user
+	hits: int										# how many times PC reached address
+
+	def __init__(self, address: int, condition: Callable[[Registers, int], bool], source: str):
+		self.address = address
+		self.condition = condition
+		self.source = source
+		self.hits = 0
+
+	def triggered(self, registers: Registers) -> bool:
+		self.hits += 1
+		try:
+			return bool(self.condition(registers, self.hits))
+		except ArithmeticError as error:
+			# stop, so the user can see what happened
+			logger.error("breakpoint condition failed (" + self.source + "): " + str(error))
+			return True
+
+# set of breakpoints, plain addresses and/or conditions like "PC == 0x1234 and A > 10" or "PC == 0x30 and hits == 500"
+# membership test is done by address, conditions are only evaluated when the address matches
+class Breakpoints():
+
+	addresses: set[int]
+	conditional: dict[int, list[ConditionalBreakpoint]]
+
+	# specs: addresses in decimal or hexadecimal form (0x...) or conditions, raises ValueError if invalid
+	def __init__(self, specs: Collection[str] = ()):
+		self.addresses = set()
+		self.conditional = {}
+		unconditional: set[int] = set()
+		for spec in specs:
+			breakpoint: int|ConditionalBreakpoint = Breakpoints.parse(spec)
+			if isinstance(breakpoint, int):
+				unconditional.add(breakpoint)
+				self.addresses.add(breakpoint)
+			else:
+				self.conditional.setdefault(breakpoint.address, []).append(breakpoint)
+				self.addresses.add(breakpoint.address)
+		# unconditional breakpoint makes conditions at the same address pointless
+		for address in unconditional:
+			self.conditional.pop(address, None)
+
+	def __contains__(self, address: object) -> bool:
+		return address in self.addresses
+	def __iter__(self) -> Iterator[int]:
+		return iter(self.addresses)
+	def __len__(self) -> int:
+		return len(self.addresses)
+
+	def __str__(self) -> str:
+		items: list[str] = []
+		for address in sorted(self.addresses):
+			if address in self.conditional:
+				items += [breakpoint.source for breakpoint in self.conditional[address]]
+			else:
+				items.append(hex(address))
+		return "[" + ", ".join(items) + "]"
+
+	# should the machine stop (PC must already be one of the addresses)
+	def triggered(self, registers: Registers) -> bool:
+		breakpoints: list[ConditionalBreakpoint]|None = self.conditional.get(registers.PC)
+		if breakpoints is None:
+			return True
+		# every condition counts its hits
+		triggered: bool = False
+		for breakpoint in breakpoints:
+			triggered = breakpoint.triggered(registers) or triggered
+		return triggered
+
+	@staticmethod
+	def parse(spec: str) -> int|ConditionalBreakpoint:
+		spec = spec.strip()
+		try:
+			return int(spec, 16) if spec.startswith("0x") else int(spec)
+		except ValueError:
+			pass
+
+		try:
+			tree: ast.Expression = ast.parse(spec, mode="eval")
+		except SyntaxError:
+			raise ValueError("invalid breakpoint (" + spec + ")")
+		for node in ast.walk(tree):
+			if not isinstance(node, conditionNodes):
+				raise ValueError("unsupported syntax in breakpoint (" + spec + ")")
+			if isinstance(node, ast.Name) and node.id not in conditionNames:
+				raise ValueError("unknown name in breakpoint (" + node.id + ")")
+
+		# condition must contain "PC == address" (alone or as part of "and")
+		terms: list[ast.expr] = tree.body.values if isinstance(tree.body, ast.BoolOp) and isinstance(tree.body.op, ast.And) else [tree.body]
+		address: int|None = None
+		for term in terms:
+			if isinstance(term, ast.Compare) and len(term.ops) == 1 and isinstance(term.ops[0], ast.Eq) \
+				and isinstance(term.left, ast.Name) and term.left.id == "PC" \
+				and isinstance(term.comparators[0], ast.Constant) and type(term.comparators[0].value) is int:
+				address = term.comparators[0].value
+				break
+		if address is None:
+			raise ValueError("breakpoint condition needs \"PC == address\" (" + spec + ")")
+
+		return ConditionalBreakpoint(address, Breakpoints.compile(tree), spec)
+
+	# compile condition to a function of (registers, hits)
+	@staticmethod
+	def compile(tree: ast.Expression) -> Callable[[Registers, int], bool]:
+
+		# registers are read from the register file
+		class RegisterAccess(ast.NodeTransformer):
+			def visit_Name(self, node: ast.Name) -> ast.expr:
+				if node.id == "hits":
+					return node
+				return ast.copy_location(ast.Attribute(value=ast.Name(id="r", ctx=ast.Load()), attr=node.id, ctx=ast.Load()), node)
+
+		body: ast.expr = RegisterAccess().visit(tree).body
+		arguments: ast.arguments = ast.arguments(posonlyargs=[], args=[ast.arg(arg="r"), ast.arg(arg="hits")], kwonlyargs=[], kw_defaults=[], defaults=[])
+		function: ast.Expression = ast.Expression(body=ast.Lambda(args=arguments, body=body))
+		ast.fix_missing_locations(function)
+		return eval(compile(function, "<breakpoint>", "eval"), {"__builtins__": {}})
@@ -0,0 +1,69 @@
+import io
+from typing import BinaryIO
+
+import logging
+logger = logging.getLogger(__name__)
+
+# single bytes by value (reading a byte doesn't allocate)
+singleBytes: list[bytes] = [bytes([i]) for i in range(256)]
+
+# read-ahead buffer of a device's input file
+# bytes are read from the file in chunks and returned from the buffer,
+# at the end of file reads return b"" like file.read, but more data is picked up if the file grows
+class BufferedInput():
+
+	# bytes read from the file at once
+	chunkSize: int = 65536
+
+	file: BinaryIO
+	buffer: bytes
+	position: int					# next byte in buffer
+	stream: bool					# pipe or terminal, read1 returns what is available instead of waiting for a whole chunk
+									# (regular files use read, read1 of BufferedRandom can return stale data after a write)
+
+	def __init__(self, file: BinaryIO):
+		self.file = file
+		self.buffer = b""
+		self.position = 0
+		try:
+			self.stream = hasattr(file, "read1") and not file.seekable()
+		except (OSError, ValueError):
+			self.stream = False
+
+	def read(self, num: int) -> bytes:
+		position: int = self.position
+		buffer: bytes = self.buffer
+		if num == 1 and position < len(buffer):
+			self.position = position + 1
+			return singleBytes[buffer[position]]
+		if position + num <= len(buffer):
+			self.position = position + num
+			return bytes(buffer[position:position+num])
+		return self.fill(num)
+
+	# slow path: take rest of buffer and refill it
+	def fill(self, num: int) -> bytes:
+		val: bytes = self.buffer[self.position:]
+		self.buffer = b""
+		self.position = 0
+		while len(val) < num:
+			size: int = max(num - len(val), BufferedInput.chunkSize)
+			chunk: bytes = self.file.read1(size) if self.stream else self.file.read(size)
+			if len(chunk) == 0:
+				break
+			need: int = num - len(val)
+			val += chunk[:need]
+			self.buffer = chunk[need:]
+		return val
+
+	# number of bytes that were read from the file, but not returned yet
+	def getPending(self) -> int:
+		return len(self.buffer) - self.position
+
+	# move file position back to the first pending byte and drop the buffer (before writing to the file)
+	def discard(self):
+		pending: int = self.getPending()
+		if pending > 0:
+			self.file.seek(-pending, io.SEEK_CUR)
+		self.buffer = b""
+		self.position = 0
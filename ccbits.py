@@ -1,6 +1,12 @@
 # enum for CC bits
 from enum import Enum
+
+# CC bits as plain ints (value kept in SW)
+ccGT: int = 0x80
+ccEQ: int = 0x00
+ccLT: int = 0x40
+
 class CCBits(Enum):
-	GT = 0x80
-	EQ = 0x00
-	LT = 0x40
+	GT = ccGT
+	EQ = ccEQ
+	LT = ccLT
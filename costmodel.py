@@ -0,0 +1,115 @@
+from opc import Opcode
+from decoded import Cost, Decoded
+import instructionsSICF3F4 as isicf3f4
+
+import logging
+logger = logging.getLogger(__name__)
+
+# cycles of an instruction = cycles of its format + extra cycles of its opcode + cycles of each memory access
+# memory accesses follow from the opcode and addressing mode (indirection costs an extra read)
+# everything is configurable, changes apply to instructions decoded afterwards (see Machine.setCostModel)
+class CostModel():
+
+	# defaults (longer instructions take longer to fetch)
+	defaultFormatCycles: dict[str, int] = {"F1": 1, "F2": 1, "SIC": 2, "F3": 2, "F4": 3, "": 1}
+	defaultOpcodeCycles: dict[Opcode, int] = {
+		Opcode.MUL: 3, Opcode.MULR: 3, Opcode.DIV: 6, Opcode.DIVR: 6,
+		Opcode.ADDF: 2, Opcode.SUBF: 2, Opcode.COMPF: 2, Opcode.MULF: 4, Opcode.DIVF: 8,
+		Opcode.FIX: 1, Opcode.FLOAT: 1, Opcode.NORM: 1,
+		Opcode.RD: 4, Opcode.WD: 4, Opcode.TD: 4
+	}
+	defaultMemoryCycles: int = 1
+
+	formatCycles: dict[str, int]
+	opcodeCycles: dict[Opcode, int]
+	memoryCycles: int
+
+	def __init__(self):
+		self.formatCycles = dict(CostModel.defaultFormatCycles)
+		self.opcodeCycles = dict(CostModel.defaultOpcodeCycles)
+		self.memoryCycles = CostModel.defaultMemoryCycles
+
+	def getFormatCycles(self, format: str) -> int:
+		return self.formatCycles.get(format, 0)
+	def getOpcodeCycles(self, opcode: Opcode) -> int:
+		return self.opcodeCycles.get(opcode, 0)
+	def getMemoryCycles(self) -> int:
+		return self.memoryCycles
+
+	def setFormatCycles(self, format: str, cycles: int):
+		if format not in CostModel.defaultFormatCycles or cycles < 0:
+			logger.error("invalid format cycles (" + format + " " + str(cycles) + ")")
+			return
+		self.formatCycles[format] = cycles
+	def setOpcodeCycles(self, opcode: Opcode, cycles: int):
+		if cycles < 0:
+			logger.error("invalid opcode cycles (" + str(opcode) + " " + str(cycles) + ")")
+			return
+		self.opcodeCycles[opcode] = cycles
+	def setMemoryCycles(self, cycles: int):
+		if cycles < 0:
+			logger.error("invalid memory cycles (" + str(cycles) + ")")
+			return
+		self.memoryCycles = cycles
+
+	# cost of a single decoded instruction (not a superinstruction)
+	def cost(self, decoded: Decoded) -> Cost:
+		reads, writes = CostModel.memoryAccesses(decoded)
+		cycles: int = self.getFormatCycles(decoded.format) + (self.memoryCycles * (reads + writes))
+		if decoded.opcode is not None:
+			cycles += self.getOpcodeCycles(decoded.opcode)
+		return Cost(cycles, reads, writes)
+
+	# number of memory reads and writes of an instruction
+	@staticmethod
+	def memoryAccesses(decoded: Decoded) -> tuple[int, int]:
+		# F1, F2, invalid opcodes and invalid addressing don't access memory
+		if decoded.addressing is None or decoded.addressing.targetAddress is None:
+			return (0, 0)
+		opcode: Opcode = decoded.opcode
+		if opcode == Opcode.RSUB:
+			return (0, 0)
+		n, i = decoded.nixbpe.getN(), decoded.nixbpe.getI()
+		# store/jump/float instructions take an address, @ reads it from memory
+		if opcode in isicf3f4.opcodeStoreJump or opcode in isicf3f4.opcodeFloatOperand:
+			reads: int = 1 if (n, i) == (1, 0) else 0
+			if opcode in isicf3f4.opcodeFloatOperand:
+				return (reads + 1, 0)
+			if opcode in opcodesJump:
+				return (reads, 0)
+			return (reads, 1)
+		# other instructions read their operand (none with #, two reads with @)
+		match (n, i):
+			case (0, 1):
+				return (0, 0)
+			case (1, 0):
+				return (2, 0)
+			case _:
+				return (1, 0)
+
+	# cost model from a file with lines "<format|opcode|memory> <cycles>", e.g. "F4 3", "MUL 5", "memory 2"
+	# empty lines and comments (#) are ignored, raises ValueError if a line is invalid
+	@staticmethod
+	def load(fileName: str) -> "CostModel":
+		model: CostModel = CostModel()
+		with open(fileName, "rt") as file:
+			for line in file:
+				line = line.split("#")[0].strip()
+				if len(line) == 0:
+					continue
+				fields: list[str] = line.split()
+				if len(fields) != 2 or not fields[1].isdigit():
+					raise ValueError("invalid cost (" + line + ")")
+				name, cycles = fields[0], int(fields[1])
+				if name == "memory":
+					model.setMemoryCycles(cycles)
+				elif name in CostModel.defaultFormatCycles:
+					model.setFormatCycles(name, cycles)
+				elif name in Opcode.__members__:
+					model.setOpcodeCycles(Opcode[name], cycles)
+				else:
+					raise ValueError("unknown instruction or format (" + name + ")")
+		return model
+
+# instructions that use their address as the new PC
+opcodesJump: set[Opcode] = {Opcode.J, Opcode.JEQ, Opcode.JGT, Opcode.JLT, Opcode.JSUB}
@@ -0,0 +1,94 @@
+from decoded import Cost, Decoded
+
+# hardware-style performance counters of a machine
+# cycles and memory accesses come from the costs of executed instructions (see CostModel),
+# so they don't depend on the engine or the speed of the host
+class Counters():
+
+	instructions: int			# instructions retired (superinstructions count as two)
+	cycles: int
+	memoryReads: int
+	memoryWrites: int
+	branchesTaken: int			# instructions that didn't continue with the next one
+	deviceReads: int			# RD instructions
+	deviceWrites: int			# WD instructions
+	devicePolls: int			# TD instructions that found the device not ready
+	formats: dict[str, int]		# instructions retired per format
+
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.instructions = 0
+		self.cycles = 0
+		self.memoryReads = 0
+		self.memoryWrites = 0
+		self.branchesTaken = 0
+		self.deviceReads = 0
+		self.deviceWrites = 0
+		self.devicePolls = 0
+		self.formats = {"F1": 0, "F2": 0, "SIC": 0, "F3": 0, "F4": 0, "": 0}
+
+	def getInstructions(self) -> int:
+		return self.instructions
+	def getCycles(self) -> int:
+		return self.cycles
+	def getMemoryReads(self) -> int:
+		return self.memoryReads
+	def getMemoryWrites(self) -> int:
+		return self.memoryWrites
+	def getBranchesTaken(self) -> int:
+		return self.branchesTaken
+	def getDeviceReads(self) -> int:
+		return self.deviceReads
+	def getDeviceWrites(self) -> int:
+		return self.deviceWrites
+	def getDevicePolls(self) -> int:
+		return self.devicePolls
+	def getFormats(self) -> dict[str, int]:
+		return dict(self.formats)
+
+	# count executed instruction (or superinstruction)
+	def count(self, decoded: Decoded, taken: bool):
+		if decoded.format == "fused":
+			first, second = decoded.operand
+			self.count(first, False)
+			self.count(second, taken)
+			return
+		cost: Cost = decoded.cost
+		self.instructions += 1
+		self.cycles += cost.cycles
+		self.memoryReads += cost.reads
+		self.memoryWrites += cost.writes
+		self.formats[decoded.format] += 1
+		if taken:
+			self.branchesTaken += 1
+
+	# count several instructions at once (cost, formats and taken branches are their sums)
+	def add(self, instructions: int, cost: Cost, formats: dict[str, int], taken: int):
+		self.instructions += instructions
+		self.cycles += cost.cycles
+		self.memoryReads += cost.reads
+		self.memoryWrites += cost.writes
+		for format, count in formats.items():
+			self.formats[format] += count
+		self.branchesTaken += taken
+
+	# flat dictionary of all counters (e.g. for csv or json)
+	def export(self) -> dict[str, int]:
+		counters: dict[str, int] = {
+			"instructions": self.instructions,
+			"cycles": self.cycles,
+			"memoryReads": self.memoryReads,
+			"memoryWrites": self.memoryWrites,
+			"branchesTaken": self.branchesTaken,
+			"deviceReads": self.deviceReads,
+			"deviceWrites": self.deviceWrites,
+			"devicePolls": self.devicePolls
+		}
+		for format, count in self.formats.items():
+			counters["instructions" + (format if format else "Invalid")] = count
+		return counters
+
+	def __str__(self) -> str:
+		return ", ".join([name + "=" + str(value) for name, value in self.export().items()])
@@ -0,0 +1,52 @@
+from typing import Callable, NamedTuple
+
+from opc import Opcode
+from nixpbebits import Nixbpe
+
+# how SIC/F3/F4 instructions get their operand (see addressingTable in machine.py)
+class AddressingMode(NamedTuple):
+	targetAddress: Callable|None	# Machine method calculating TA, None if indexing is not allowed
+	indexed: bool					# add X to TA
+	finalize: Callable|None			# Machine method that turns TA into the instruction's parameter
+
+# cycles and memory accesses of an instruction according to the machine's CostModel
+class Cost(NamedTuple):
+	cycles: int
+	reads: int					# memory reads (including indirection)
+	writes: int					# memory writes
+
+	# cost of two instructions executed one after the other
+	def plus(self, other: "Cost") -> "Cost":
+		return Cost(self.cycles + other.cycles, self.reads + other.reads, self.writes + other.writes)
+
+	# cost of the same instruction(s) executed count times
+	def times(self, count: int) -> "Cost":
+		return Cost(self.cycles * count, self.reads * count, self.writes * count)
+
+# instruction as it was decoded from memory (cached by Machine per address)
+class Decoded(NamedTuple):
+	handler: Callable|None		# instruction from opcode2instruction* dict
+	executor: Callable			# Machine method that executes this format
+	format: str					# "F1", "F2", "SIC", "F3", "F4", "fused" or "" (invalid)
+	opcode: Opcode|None
+	nixbpe: Nixbpe|None			# only used by SIC, F3 and F4
+	addressing: AddressingMode|None	# only used by SIC, F3 and F4
+	operand: tuple				# (r1, r2) for F2, (uOperand, sOperand) for SIC/F3/F4,
+								# (byte1, 0) if invalid, (first, second) decoded if fused
+	length: int					# number of bytes the instruction occupies
+	cost: Cost = Cost(0, 0, 0)	# filled in by Machine.decode
+
+# entry of the dispatch table, indexed by the first byte of an instruction
+class DispatchEntry(NamedTuple):
+	decoder: Callable			# Machine method that decodes this format
+	executor: Callable			# Machine method that executes this format
+	opcode: Opcode|None			# None for invalid op. codes
+	handler: Callable|None		# instruction from opcode2instruction* dict
+	addressingClass: int		# offset into addressingTable (store/jump instructions)
+
+# event emitted by the tracing engine for every executed instruction (see Machine.executeTraced)
+class TraceEvent(NamedTuple):
+	address: int				# address of the instruction
+	decoded: Decoded
+	targetAddress: int|None		# only for SIC, F3 and F4 (None if TA could not be calculated)
+	parameter: int|None			# operand passed to the instruction (SIC, F3 and F4)
@@ -1,62 +1,126 @@
 import sys
-from typing import BinaryIO
-from random import random
-from time import time
+from typing import BinaryIO, Callable
+from random import Random
+from time import perf_counter_ns, monotonic, sleep
+
+from flushpolicy import FlushPolicy
+from bufferedinput import BufferedInput
 
 import logging
 logger = logging.getLogger(__name__)
 
 class Device:
+
+	# output buffering
+	flushPolicy: FlushPolicy = FlushPolicy.UNBUFFERED
+	bufferSize: int = 4096
+	# bytes written since last flush
+	pending: int = 0
+	# reading waits for the user (output should be flushed before)
+	interactive: bool = False
+	# fed by the asyncio event loop, read returns None if there is no input yet (see StreamInputDevice)
+	asynchronous: bool = False
+
 	def test(self) -> bool:
 		return True
 	def read(self) -> bytes:
 		return b'\x00'
 	def write(self, val: bytes):
 		pass
+	def flush(self):
+		pass
+
+	def getFlushPolicy(self) -> FlushPolicy:
+		return self.flushPolicy
+	def setFlushPolicy(self, flushPolicy: FlushPolicy, bufferSize: int|None = None):
+		self.flushPolicy = flushPolicy
+		if bufferSize is not None:
+			self.bufferSize = bufferSize
+		if flushPolicy == FlushPolicy.UNBUFFERED:
+			self.flush()
+
+	# flush after write according to flushPolicy
+	def written(self, val: bytes):
+		self.pending += len(val)
+		if self.flushPolicy == FlushPolicy.UNBUFFERED or self.pending >= self.bufferSize \
+			or (self.flushPolicy == FlushPolicy.LINE and b"\n" in val):
+			self.flush()
 	def isInitialized(self) -> bool:	# default: device is initialized
 		return True
+	# next read has to wait for input (output is flushed before it, like C stdio does for interactive input)
+	# default: input is always there
+	def wouldBlock(self) -> bool:
+		return False
+	# block until TD would report the device as ready or timeout [s] passes, returns readiness
+	# default: readiness doesn't change while the machine spins on TD, so there is nothing to wait for
+	def waitReady(self, timeout: float) -> bool:
+		return self.isInitialized() and self.test()
+	# look for the device's file again on next access (if it was missing)
+	def rescan(self):
+		pass
 
 # read randomized byte(s) from device
+# bytes come from the device's own generator (seeded for reproducible runs), InputDevice reads them in bulk
 class Stdrng(BinaryIO):
+	generator: Random
+	def __init__(self, seed: int|None = None):
+		self.generator = Random(seed)
 	def read(self, n: int) -> bytes:
-		return b"".join([int.to_bytes(int(random() * 256), length=1, byteorder="big", signed=False) for i in range(n)])
+		return self.generator.randbytes(n)
 	def write(self, *args, **kvargs):
 		pass
 
 # write 0x01 to start timer and 0x02 to stop it
-# read 24-bit time in milliseconds, starting from MSB to LSB
+# read 24-bit time in milliseconds, starting from MSB to LSB (zeros after LSB)
+# time comes from clock [ns], host time by default (see TimerMode for virtual time)
 class Stdtimer(BinaryIO):
 
-	timer: float = 0						# time counter in ms
-	timerBytes: list[bytes] = [b"\x00"] * 3	# same but in bytes format
+	clock: Callable[[], int]
+	start: int = 0							# time of start [ns]
+	timerBytes: bytes = bytes(3)			# measured time in ms
+	position: int = 0						# next byte of timerBytes to read
+
+	def __init__(self, clock: Callable[[], int] = perf_counter_ns):
+		self.clock = clock
 
 	def write(self, n: bytes):
 		if n == b"\x01":				# start timer
-			self.timer = time()
+			self.start = self.clock()
 		elif n == b"\x02":				# stop timer
-			self.timer = (time() - self.timer) * 1000.0
-			self.timer %= 0x1000000
-			self.timerBytes = [bytes([x]) for x in int.to_bytes(int(self.timer), length=3, byteorder="big", signed=False)]
+			timer: int = (self.clock() - self.start) // 1_000_000 % 0x1000000
+			self.timerBytes = int.to_bytes(timer, length=3, byteorder="big", signed=False)
+			self.position = 0
 	def read(self, n: int) -> bytes:
-		if len(self.timerBytes) > 0:
-			return self.timerBytes.pop(0)
-		else:
-			return b"\x00"
+		position: int = self.position
+		val: bytes = self.timerBytes[position:position+n]
+		self.position = position + len(val)
+		return val + bytes(n - len(val))
 
 # used for stdin, stdrng
+# input is read ahead, seed is used by stdrng
 class InputDevice(Device):
 	file: BinaryIO
-	def __init__(self, fileName: str):
+	input: BufferedInput|None = None
+	def __init__(self, fileName: str, seed: int|None = None):
 		if fileName == "stdin":
 			self.file = sys.stdin.buffer
+			self.interactive = True
+			self.input = BufferedInput(self.file)
 		elif fileName == "stdrng":
-			self.file = Stdrng()
+			self.file = Stdrng(seed)
+			self.input = BufferedInput(self.file)
 		else:
 			self.file = open(fileName, "rb")
+			self.input = BufferedInput(self.file)
 	def read(self) -> bytes:
 		return self.readn(1)
 	def readn(self, num: int) -> bytes:
+		if self.input is not None:
+			return self.input.read(num)
 		return self.file.read(num)
+	# read-ahead buffer is empty
+	def wouldBlock(self) -> bool:
+		return self.input is None or self.input.getPending() == 0
 
 # used for stdout, stderr
 class OutputDevice(Device):
@@ -64,39 +128,99 @@ class OutputDevice(Device):
 	def __init__(self, fileName: str):
 		if fileName == "stdout":
 			self.file = sys.stdout.buffer
+			self.flushPolicy = FlushPolicy.LINE
 		elif fileName == "stderr":
 			self.file = sys.stderr.buffer
 		else:
 			self.file = open(fileName, "wb")	# open file and clear content
 			self.file = open(fileName, "ab")	# open for appending
+			self.flushPolicy = FlushPolicy.BLOCK
 	def write(self, val: bytes):
 		self.file.write(val)
+		self.written(val)
 	def flush(self):
 		self.file.flush()
+		self.pending = 0
 
 # used for stdtimer and XX.dev files
+# XX.dev files are read ahead, writes continue where the guest stopped reading
+# missing file is remembered (no open per access), opening is retried every retryInterval or after rescan
 class FileDevice(Device):
+
+	# seconds between attempts to open a missing file (None = only after rescan)
+	retryInterval: float|None = 1.0
+	# seconds between errors about a missing file
+	logInterval: float = 5.0
+
 	file: BinaryIO
+	fileName: str
 	initialized: bool = False
-	def __init__(self, fileName: str):
+	input: BufferedInput|None = None
+	nextRetry: float = 0.0			# monotonic time of next attempt to open a missing file
+	nextLog: float = 0.0			# monotonic time when an error may be logged again
+	suppressed: int = 0				# errors not logged since nextLog was set
+	# clock is used by stdtimer
+	def __init__(self, fileName: str, clock: Callable[[], int] = perf_counter_ns):
+		self.fileName = fileName
 		self.initialized = False
 		if fileName == "stdtimer":
-			self.file = Stdtimer()
+			self.file = Stdtimer(clock)
 			self.initialized = True
 		else:
-			try:
-				self.file = open(fileName, "r+b")		# open file for R&W without truncating
-				self.initialized = True
-			except FileNotFoundError:
+			# default policy of files, a policy set later (see Machine.setDevice) is kept when a missing file is found
+			self.flushPolicy = FlushPolicy.BLOCK
+			if not self.open():
 				logger.error("file not found (" + fileName + ")")
+	# try to open the file, returns success
+	def open(self) -> bool:
+		try:
+			self.file = open(self.fileName, "r+b")		# open file for R&W without truncating
+		except FileNotFoundError:
+			if FileDevice.retryInterval is not None:
+				self.nextRetry = monotonic() + FileDevice.retryInterval
+			else:
+				self.nextRetry = float("inf")
+			return False
+		self.initialized = True
+		self.input = BufferedInput(self.file)
+		return True
+	def rescan(self):
+		if not self.initialized:
+			self.nextRetry = 0.0
 	def read(self) -> bytes:
 		return self.readn(1)
 	def readn(self, num: int) -> bytes:
+		if self.input is not None:
+			return self.input.read(num)
 		return self.file.read(num)
 	def write(self, val: bytes):
+		if self.input is not None and self.input.getPending():
+			self.input.discard()
 		self.file.write(val)
+		self.written(val)
 	def flush(self):
-		self.file.flush()
+		if self.initialized:
+			self.file.flush()
+		self.pending = 0
 	def isInitialized(self) -> bool:
+		if not self.initialized and monotonic() >= self.nextRetry and self.open():
+			logger.info("file found (" + self.fileName + ")")
 		return self.initialized
+	# missing file can't become ready before the next attempt to open it
+	def waitReady(self, timeout: float) -> bool:
+		if not self.initialized:
+			delay: float = min(self.nextRetry - monotonic(), timeout)
+			if delay > 0:
+				sleep(delay)
+		return self.isInitialized() and self.test()
+	# should an error about the missing file be logged now, returns number of errors suppressed before it or None
+	def reportMissing(self) -> int|None:
+		now: float = monotonic()
+		if now < self.nextLog:
+			self.suppressed += 1
+			return None
+		suppressed: int = self.suppressed
+		self.nextLog = now + FileDevice.logInterval
+		self.suppressed = 0
+		return suppressed
 		
@@ -0,0 +1,7 @@
+# enum for policies of flushing device output (see Device.setFlushPolicy)
+# buffered output is also flushed when the machine stops (see Machine.flushDevices)
+from enum import Enum
+class FlushPolicy(Enum):
+	UNBUFFERED = 0		# after every written byte
+	LINE = 1			# after newline or when bufferSize bytes are waiting
+	BLOCK = 2			# when bufferSize bytes are waiting
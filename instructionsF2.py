@@ -1,6 +1,7 @@
 from opc import Opcode
 from typing import Callable, Any
-from ccbits import CCBits
+from ccbits import ccGT, ccEQ, ccLT
+from registers import Registers
 from misc import uns2sgn
 
 def sicxeAddr(self, r1: int, r2: int):
@@ -10,9 +11,9 @@ def sicxeClear(self, r1: int, r2: int):
 	self.setReg(r1, 0)
 
 def sicxeCompr(self, r1: int, r2: int):
-	diff: int = uns2sgn(self.getReg(r1), 3) - uns2sgn(self.getReg(r2), 3)
-	cc: CCBits = CCBits.GT if diff > 0 else (CCBits.LT if diff < 0 else CCBits.EQ)
-	self.setCC(cc)
+	registers: Registers = self.registers
+	diff: int = uns2sgn(registers.get(r1), 3) - uns2sgn(registers.get(r2), 3)
+	registers.SW = ccGT if diff > 0 else (ccLT if diff < 0 else ccEQ)
 
 def sicxeDivr(self, r1: int, r2: int):
 	self.setReg(r2, self.getReg(r2) // self.getReg(r1))
@@ -37,10 +38,11 @@ def sicxeSvc(self, r1: int, r2: int):
 	pass
 
 def sicxeTixr(self, r1: int, r2: int):
-	self.setX(self.getX() + 1)
-	diff: int = self.getX() - self.getReg(r1)
-	cc: CCBits = CCBits.GT if diff > 0 else (CCBits.LT if diff < 0 else CCBits.EQ)
-	self.setCC(cc)
+	registers: Registers = self.registers
+	valX: int = (registers.X + 1) & 0xFFFFFF
+	registers.X = valX
+	diff: int = valX - registers.get(r1)
+	registers.SW = ccGT if diff > 0 else (ccLT if diff < 0 else ccEQ)
 
 opcode2instructionF2: dict[Opcode, Callable[[Any, int, int], None]] = {
 
@@ -1,124 +1,135 @@
 from opc import Opcode
-from ccbits import CCBits
+from ccbits import CCBits, ccGT, ccEQ, ccLT
+from registers import Registers
 from typing import Callable, Any
 from device import FileDevice
 from nixpbebits import Nixbpe
-from misc import int2bytes, bytes2float, float2bytes, uns2sgn
+from misc import int2bytes
 
 import logging
 logger = logging.getLogger(__name__)
 
-def signed(parameter: bytes) -> int:
-	return int.from_bytes(bytes=parameter, byteorder="big", signed=True)
+# registers are accessed directly (values are masked to 24 bits, CC is kept as int in SW)
+# operands are passed as ints:
+# - value (24 bits) for most instructions
+# - address for store/jump and float instructions (see opcodeStoreJump, opcodeFloatOperand)
 
-def unsigned(parameter: bytes) -> int:
-	return int.from_bytes(bytes=parameter, byteorder="big", signed=False)
+# interpret 24-bit value as two's complement
+def signed(parameter: int) -> int:
+	return parameter - 0x1000000 if parameter & 0x800000 else parameter
+
+# device number of RD, TD and WD (immediate value or first byte of the word)
+def deviceNumber(nixbpe: Nixbpe, parameter: int) -> int:
+	return parameter & 0xFF if nixbpe.isImmediate() else parameter >> 16
 
 ########################################################################################
 
-def sicAdd(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setA(self.getA() + unsigned(parameter))
+def sicAdd(self, nixbpe: Nixbpe, parameter: int):
+	registers: Registers = self.registers
+	registers.A = (registers.A + parameter) & 0xFFFFFF
 
-def sicAnd(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setA(self.getA() & unsigned(parameter))
+def sicAnd(self, nixbpe: Nixbpe, parameter: int):
+	self.registers.A &= parameter
 
-def sicComp(self, nixbpe: Nixbpe, parameter: bytes):
-	diff: int = uns2sgn(self.getA(), 3) - signed(parameter)
-	cc: CCBits = CCBits.GT if diff > 0 else (CCBits.LT if diff < 0 else CCBits.EQ)
-	self.setCC(cc)
+def sicComp(self, nixbpe: Nixbpe, parameter: int):
+	diff: int = signed(self.registers.A) - signed(parameter)
+	self.registers.SW = ccGT if diff > 0 else (ccLT if diff < 0 else ccEQ)
 
-def sicDiv(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setA(self.getA() // unsigned(parameter))
+def sicDiv(self, nixbpe: Nixbpe, parameter: int):
+	self.registers.A //= parameter
 
-def sicJ(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setPC(unsigned(parameter))
+def sicJ(self, nixbpe: Nixbpe, parameter: int):
+	self.registers.PC = parameter
 
-def sicJeq(self, nixbpe: Nixbpe, parameter: bytes):
-	newPC: int = unsigned(parameter) if self.getCC() == CCBits.EQ else self.getPC()
-	self.setPC(newPC)
+def sicJeq(self, nixbpe: Nixbpe, parameter: int):
+	if self.registers.SW == ccEQ:
+		self.registers.PC = parameter
 
-def sicJgt(self, nixbpe: Nixbpe, parameter: bytes):
-	newPC: int = unsigned(parameter) if self.getCC() == CCBits.GT else self.getPC()
-	self.setPC(newPC)
+def sicJgt(self, nixbpe: Nixbpe, parameter: int):
+	if self.registers.SW == ccGT:
+		self.registers.PC = parameter
 
-def sicJlt(self, nixbpe: Nixbpe, parameter: bytes):
-	newPC: int = unsigned(parameter) if self.getCC() == CCBits.LT else self.getPC()
-	self.setPC(newPC)
+def sicJlt(self, nixbpe: Nixbpe, parameter: int):
+	if self.registers.SW == ccLT:
+		self.registers.PC = parameter
 
-def sicJsub(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setL(self.getPC())
-	self.setPC(unsigned(parameter))
+def sicJsub(self, nixbpe: Nixbpe, parameter: int):
+	registers: Registers = self.registers
+	registers.L = registers.PC
+	registers.PC = parameter
 
-def sicLda(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setA(unsigned(parameter))
+def sicLda(self, nixbpe: Nixbpe, parameter: int):
+	self.registers.A = parameter
 
-def sicLdch(self, nixbpe: Nixbpe, parameter: bytes):
-	valA: bytes = int.to_bytes(self.getA(), length=3, byteorder="big", signed=False)
-	newVal: bytes = valA[:2]						# keep upper 2 bytes of A
-	match nixbpe.getTuple():
-		case (0, 1, _, _, _, _):					# immediate addressing -> append upper byte
-			newVal += parameter[-1:]
-		case _:										# simple/indirect addr. -> append lower byte
-			newVal += parameter[:1]
-	self.setA(unsigned(newVal))
+def sicLdch(self, nixbpe: Nixbpe, parameter: int):
+	newVal: int = self.registers.A & 0xFFFF00		# keep upper 2 bytes of A
+	if nixbpe.isImmediate():						# immediate addressing -> append lower byte
+		newVal |= parameter & 0xFF
+	else:											# simple/indirect addr. -> append byte at TA
+		newVal |= parameter >> 16
+	self.registers.A = newVal
 
-def sicLdl(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setL(unsigned(parameter))
+def sicLdl(self, nixbpe: Nixbpe, parameter: int):
+	self.registers.L = parameter
 
-def sicLds(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setS(unsigned(parameter))
+def sicLds(self, nixbpe: Nixbpe, parameter: int):
+	self.registers.S = parameter
 
-def sicLdt(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setT(unsigned(parameter))
+def sicLdt(self, nixbpe: Nixbpe, parameter: int):
+	self.registers.T = parameter
 
-def sicLdx(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setX(unsigned(parameter))
+def sicLdx(self, nixbpe: Nixbpe, parameter: int):
+	self.registers.X = parameter
 
-def sicMul(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setA(self.getA() * unsigned(parameter))
+def sicMul(self, nixbpe: Nixbpe, parameter: int):
+	registers: Registers = self.registers
+	registers.A = (registers.A * parameter) & 0xFFFFFF
 
-def sicOr(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setA(self.getA() | unsigned(parameter))
+def sicOr(self, nixbpe: Nixbpe, parameter: int):
+	self.registers.A |= parameter
 
-def sicRsub(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setPC(self.getL())
+def sicRsub(self, nixbpe: Nixbpe, parameter: int):
+	registers: Registers = self.registers
+	registers.PC = registers.L
 
-def sicSta(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setWord(addr=unsigned(parameter), val=int2bytes(self.getA(), 3))
+def sicSta(self, nixbpe: Nixbpe, parameter: int):
+	self.setUint24(parameter, self.registers.A)
 
-def sicStch(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setByte(addr=unsigned(parameter), val=int2bytes(self.getA(), 3)[-1:])
+def sicStch(self, nixbpe: Nixbpe, parameter: int):
+	self.setUint8(parameter, self.registers.A)
 
-def sicStl(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setWord(addr=unsigned(parameter), val=int2bytes(self.getL(), 3))
+def sicStl(self, nixbpe: Nixbpe, parameter: int):
+	self.setUint24(parameter, self.registers.L)
 
-def sicStsw(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setWord(addr=unsigned(parameter), val=int2bytes(self.getSW(), 3))
+def sicStsw(self, nixbpe: Nixbpe, parameter: int):
+	self.setUint24(parameter, self.registers.SW)
 
-def sicStx(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setWord(addr=unsigned(parameter), val=int2bytes(self.getX(), 3))
+def sicStx(self, nixbpe: Nixbpe, parameter: int):
+	self.setUint24(parameter, self.registers.X)
 
-def sicSub(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setA(self.getA() - unsigned(parameter))
+def sicSub(self, nixbpe: Nixbpe, parameter: int):
+	registers: Registers = self.registers
+	registers.A = (registers.A - parameter) & 0xFFFFFF
 
-def sicTix(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setX(self.getX() + 1)
-	diff: int = self.getX() - unsigned(parameter)
-	cc: CCBits = CCBits.GT if diff > 0 else (CCBits.LT if diff < 0 else CCBits.EQ)
-	self.setCC(cc)
+def sicTix(self, nixbpe: Nixbpe, parameter: int):
+	registers: Registers = self.registers
+	valX: int = (registers.X + 1) & 0xFFFFFF
+	registers.X = valX
+	diff: int = valX - parameter
+	registers.SW = ccGT if diff > 0 else (ccLT if diff < 0 else ccEQ)
 
-def sicRd(self, nixbpe: Nixbpe, parameter: bytes):
+# log error about inaccessible device (missing files are reported at most every FileDevice.logInterval)
+def notAccessible(device: FileDevice, deviceId: int):
+	suppressed: int|None = device.reportMissing() if isinstance(device, FileDevice) else 0
+	if suppressed is None:
+		return
+	logger.error("device is not accessible (" + str(deviceId) + ")" + (", " + str(suppressed) + " similar errors suppressed" if suppressed else ""))
 
-	# check for immediate addressing
-	match nixbpe.getTuple():
-		case (0, 1, _, _, _, _):
-			parameter = parameter[-1:]
-		case _:
-			parameter = parameter[:1]
+def sicRd(self, nixbpe: Nixbpe, parameter: int):
 
 	# check if device is available for reading
-	deviceId: int = unsigned(parameter)
-	if not (0 <= deviceId <= 256) or deviceId in (1, 2):
+	deviceId: int = deviceNumber(nixbpe, parameter)
+	if not (0 <= deviceId <= 0xFF) or deviceId in (1, 2):
 		logger.error("invalid device id (" + str(deviceId) + ")")
 		return
 
@@ -132,7 +143,14 @@ def sicRd(self, nixbpe: Nixbpe, parameter: bytes):
 		device = self.getDevice(deviceId)
 	
 	if device.isInitialized():
-		readByte: bytes = device.read()
+		# e.g. prompt must be visible before waiting for the user (not before every byte of input that is already there)
+		if device.interactive and device.wouldBlock():
+			self.flushDevices()
+		readByte: bytes|None = device.read()
+		if readByte is None:		# no input yet: execute RD again when there is some
+			self.waitForDevice(device, 3 if nixbpe.getN() == nixbpe.getI() == 0 or not nixbpe.getE() else 4)
+			return
+		self.counters.deviceReads += 1
 		if len(readByte) < 1:		# on end: read zeros
 			readByte = b"\x00"
 		valA: int = self.getA()
@@ -140,20 +158,13 @@ def sicRd(self, nixbpe: Nixbpe, parameter: bytes):
 		valA += readByte[0]
 		self.setA(valA)
 	else:				# file is not accessible
-		logger.error("device is not accessible (" + str(deviceId) + ")")
-
-def sicTd(self, nixbpe: Nixbpe, parameter: bytes):
+		notAccessible(device, deviceId)
 
-	# check for immediate addressing
-	match nixbpe.getTuple():
-		case (0, 1, _, _, _, _):
-			parameter = parameter[-1:]
-		case _:
-			parameter = parameter[:1]
+def sicTd(self, nixbpe: Nixbpe, parameter: int):
 
 	# check if device id is valid
-	deviceId: int = unsigned(parameter)
-	if not (0 <= deviceId <= 256):
+	deviceId: int = deviceNumber(nixbpe, parameter)
+	if not (0 <= deviceId <= 0xFF):
 		logger.error("invalid device id (" + str(deviceId) + ")")
 		return
 
@@ -166,23 +177,17 @@ def sicTd(self, nixbpe: Nixbpe, parameter: bytes):
 	else:
 		device = self.getDevice(deviceId)
 
-	if device.isInitialized():
-		self.setCC(CCBits.LT)
+	if device.isInitialized() and device.test():
+		self.registers.SW = ccLT
 	else:
-		self.setCC(CCBits.EQ)
-
-def sicWd(self, nixbpe: Nixbpe, parameter: bytes):
+		self.registers.SW = ccEQ
+		self.counters.devicePolls += 1
 
-	# check for immediate addressing
-	match nixbpe.getTuple():
-		case (0, 1, _, _, _, _):
-			parameter = parameter[-1:]
-		case _:
-			parameter = parameter[:1]
+def sicWd(self, nixbpe: Nixbpe, parameter: int):
 
 	# check if device is available for writing
-	deviceId: int = unsigned(parameter)
-	if not (0 <= deviceId <= 256) or deviceId == 0:
+	deviceId: int = deviceNumber(nixbpe, parameter)
+	if not (0 <= deviceId <= 0xFF) or deviceId == 0:
 		logger.error("invalid device id (" + str(deviceId) + ")")
 		return
 
@@ -198,72 +203,64 @@ def sicWd(self, nixbpe: Nixbpe, parameter: bytes):
 	if device.isInitialized():
 		valA: int = self.getA()
 		valA &= 0x0000FF
-		device.write(int2bytes(valA, 1))
-		device.flush()
+		self.counters.deviceWrites += 1
+		device.write(int2bytes(valA, 1))		# device flushes according to its policy
 	else:				# file is not accessible
-		logger.error("device is not accessible (" + str(deviceId) + ")")
+		notAccessible(device, deviceId)
 
-def sicxeAddf(self, nixbpe: Nixbpe, parameter: bytes):
-	byteList: list[bytes] = [bytes([x]) for x in parameter]
-	parameterFloat: float = bytes2float(byteList)
+def sicxeAddf(self, nixbpe: Nixbpe, parameter: int):
+	parameterFloat: float = self.getFloat(parameter)
 	self.setF(self.getF() + parameterFloat)
 
-def sicxeCompf(self, nixbpe: Nixbpe, parameter: bytes):
-	byteList: list[bytes] = [bytes([x]) for x in parameter]
-	parameterFloat: float = bytes2float(byteList)
+def sicxeCompf(self, nixbpe: Nixbpe, parameter: int):
+	parameterFloat: float = self.getFloat(parameter)
 	cc: CCBits = CCBits.GT if self.getF() > parameterFloat else (CCBits.LT if self.getF() < parameterFloat else CCBits.EQ)
 	self.setCC(cc)
 
-def sicxeDivf(self, nixbpe: Nixbpe, parameter: bytes):
-	byteList: list[bytes] = [bytes([x]) for x in parameter]
-	parameterFloat: float = bytes2float(byteList)
+def sicxeDivf(self, nixbpe: Nixbpe, parameter: int):
+	parameterFloat: float = self.getFloat(parameter)
 	self.setF(self.getF() / parameterFloat)
 
-def sicxeLdb(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setB(unsigned(parameter))
+def sicxeLdb(self, nixbpe: Nixbpe, parameter: int):
+	self.registers.B = parameter
 
-def sicxeLdf(self, nixbpe: Nixbpe, parameter: bytes):
-	byteList: list[bytes] = [bytes([x]) for x in parameter]
-	parameterFloat: float = bytes2float(byteList)
+def sicxeLdf(self, nixbpe: Nixbpe, parameter: int):
+	parameterFloat: float = self.getFloat(parameter)
 	self.setF(parameterFloat)
 
 # not implemented
-def sicxeLps(self, nixbpe: Nixbpe, parameter: bytes):
+def sicxeLps(self, nixbpe: Nixbpe, parameter: int):
 	pass
 
-def sicxeMulf(self, nixbpe: Nixbpe, parameter: bytes):
-	byteList: list[bytes] = [bytes([x]) for x in parameter]
-	parameterFloat: float = bytes2float(byteList)
+def sicxeMulf(self, nixbpe: Nixbpe, parameter: int):
+	parameterFloat: float = self.getFloat(parameter)
 	self.setF(self.getF() * parameterFloat)
 
 # not implemented
-def sicxeSsk(self, nixbpe: Nixbpe, parameter: bytes):
+def sicxeSsk(self, nixbpe: Nixbpe, parameter: int):
 	pass
 
-def sicxeStb(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setWord(addr=unsigned(parameter), val=int2bytes(self.getB(), 3))
+def sicxeStb(self, nixbpe: Nixbpe, parameter: int):
+	self.setUint24(parameter, self.registers.B)
 
-def sicxeStf(self, nixbpe: Nixbpe, parameter: bytes):
-	byteList = float2bytes(self.getF())
-	self.setWord(addr=(unsigned(parameter) + 0), val=b"".join(byteList[:3]))
-	self.setWord(addr=(unsigned(parameter) + 3), val=b"".join(byteList[3:]))
+def sicxeStf(self, nixbpe: Nixbpe, parameter: int):
+	self.setFloat(parameter, self.getF())
 
 # not implemented
-def sicxeSti(self, nixbpe: Nixbpe, parameter: bytes):
+def sicxeSti(self, nixbpe: Nixbpe, parameter: int):
 	pass
 
-def sicxeSts(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setWord(addr=unsigned(parameter), val=int2bytes(self.getS(), 3))
+def sicxeSts(self, nixbpe: Nixbpe, parameter: int):
+	self.setUint24(parameter, self.registers.S)
 
-def sicxeStt(self, nixbpe: Nixbpe, parameter: bytes):
-	self.setWord(addr=unsigned(parameter), val=int2bytes(self.getT(), 3))
+def sicxeStt(self, nixbpe: Nixbpe, parameter: int):
+	self.setUint24(parameter, self.registers.T)
 
-def sicxeSubf(self, nixbpe: Nixbpe, parameter: bytes):
-	byteList: list[bytes] = [bytes([x]) for x in parameter]
-	parameterFloat: float = bytes2float(byteList)
+def sicxeSubf(self, nixbpe: Nixbpe, parameter: int):
+	parameterFloat: float = self.getFloat(parameter)
 	self.setF(self.getF() - parameterFloat)
 
-opcode2instructionSICF3F4: dict[Opcode, Callable[[Any, Nixbpe, bytes], None]] = {
+opcode2instructionSICF3F4: dict[Opcode, Callable[[Any, Nixbpe, int], None]] = {
 	
 	# legacy SIC instructions
 	Opcode.ADD:		sicAdd,
@@ -330,3 +327,13 @@ opcodeStoreJump: set[Opcode] = {
 	Opcode.JLT,
 	Opcode.JSUB
 }
+
+# float instructions read 6 bytes, so they get the address of the operand instead of its value
+opcodeFloatOperand: set[Opcode] = {
+	Opcode.ADDF,
+	Opcode.COMPF,
+	Opcode.DIVF,
+	Opcode.LDF,
+	Opcode.MULF,
+	Opcode.SUBF
+}
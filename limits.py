@@ -0,0 +1,32 @@
+# limits of a whole simulation run (see Machine.runLimited)
+class Limits():
+
+	# instructions executed per Machine.run call when loop detection is off
+	defaultBatchSteps: int = 100000
+
+	maxInstructions: int|None		# instruction budget, None = unlimited
+	timeout: float|None				# wall time [s], None = unlimited
+	loopCheckInterval: int			# instructions between samples of the machine state, 0 = no loop detection
+
+	def __init__(self, maxInstructions: int|None = None, timeout: float|None = None, loopCheckInterval: int = 0):
+		self.maxInstructions = maxInstructions
+		self.timeout = timeout
+		self.loopCheckInterval = loopCheckInterval
+
+	def getMaxInstructions(self) -> int|None:
+		return self.maxInstructions
+	def getTimeout(self) -> float|None:
+		return self.timeout
+	def getLoopCheckInterval(self) -> int:
+		return self.loopCheckInterval
+
+	def setMaxInstructions(self, maxInstructions: int|None):
+		self.maxInstructions = maxInstructions
+	def setTimeout(self, timeout: float|None):
+		self.timeout = timeout
+	def setLoopCheckInterval(self, loopCheckInterval: int):
+		self.loopCheckInterval = loopCheckInterval
+
+	# instructions between checks of the limits
+	def getBatchSteps(self) -> int:
+		return self.loopCheckInterval if self.loopCheckInterval > 0 else Limits.defaultBatchSteps
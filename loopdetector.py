@@ -0,0 +1,59 @@
+import hashlib
+
+import logging
+logger = logging.getLogger(__name__)
+
+# detects that a machine came back to a state it was already in, which means it will loop forever
+# state = registers, memory and number of device reads/writes/polls (states separated by I/O are never equal,
+# because a device can return something else next time, and a TD loop waits for a device that can become ready)
+# memory is hashed per page and only pages stored to since the last sample are hashed again (see Machine.dirtyPages),
+# so a machine has at most one detector at a time
+# states are only sampled (see Limits.loopCheckInterval), so a loop of p instructions is found after at most p samples
+# (loops that wait without changing anything are found at the second sample)
+class LoopDetector():
+
+	# samples remembered before starting over
+	maxStates: int = 4096
+
+	states: dict[bytes, int]		# digest of state -> instructions executed when it was sampled
+	pageDigests: list[bytes]|None	# digest of each memory page (None before the first sample)
+
+	def __init__(self):
+		self.states = {}
+		self.pageDigests = None
+
+	# forget sampled states (e.g. input arrived while the machine was waiting for it)
+	def reset(self):
+		self.states.clear()
+
+	# sample state of machine m after executed instructions
+	# returns instructions executed when the same state was seen first, None if it is new
+	def check(self, m, executed: int) -> int|None:
+		digest: bytes = self.digest(m)
+		first: int|None = self.states.get(digest)
+		if first is not None:
+			return first
+		if len(self.states) >= LoopDetector.maxStates:
+			self.states.clear()
+		self.states[digest] = executed
+		return None
+
+	# digest of the state of machine m
+	def digest(self, m) -> bytes:
+		dirtyPages: bytearray = m.dirtyPages
+		pageSize: int = len(m.mem) // len(dirtyPages)
+		with memoryview(m.mem) as mem:
+			first: bool = self.pageDigests is None
+			if first:
+				self.pageDigests = [b""] * len(dirtyPages)
+			for page in range(len(dirtyPages)):
+				if first or dirtyPages[page] & m.dirtyLoop:
+					self.pageDigests[page] = hashlib.blake2b(mem[page*pageSize:(page+1)*pageSize], digest_size=16).digest()
+					dirtyPages[page] &= ~m.dirtyLoop
+
+		r = m.registers
+		counters = m.counters
+		state: hashlib.blake2b = hashlib.blake2b(digest_size=16)
+		state.update(repr((r.A, r.X, r.L, r.B, r.S, r.T, r.R6, r.R7, r.PC, r.SW, r.F, counters.deviceReads, counters.deviceWrites, counters.devicePolls)).encode())
+		state.update(b"".join(self.pageDigests))
+		return state.digest()
@@ -1,11 +1,26 @@
-from collections import defaultdict, deque
-from typing import Callable
+from collections import deque
+import asyncio
+import time
+from typing import Callable, Collection
 
 from ccbits import CCBits
 from device import Device, InputDevice, OutputDevice, FileDevice
+from flushpolicy import FlushPolicy
+from timermode import TimerMode
 from opc import *
 from nixpbebits import Nixbpe
-from misc import bytes2int, bytes2float, float2bytes
+from decoded import Decoded, DispatchEntry, AddressingMode, TraceEvent, Cost
+from registers import Registers
+from stopreason import StopReason
+from breakpoints import Breakpoints
+from watchpoints import Watchpoint, Watchpoints, WatchHit
+from limits import Limits
+from loopdetector import LoopDetector
+from translator import Translator
+from costmodel import CostModel
+from mappedregion import MappedRegion
+from counters import Counters
+from misc import float2bytes, int2float, float2int
 import instructionsSICF3F4 as isicf3f4
 import instructionsF1 as if1
 import instructionsF2 as if2
@@ -25,6 +40,14 @@ class Machine():
 		return "{:06x}".format(val)
 
 	# constants
+	# longest time run waits for a device that a TD/JEQ loop spins on [s]
+	spinTimeout: float = 0.01
+	# clock period of virtual time (see TimerMode) [ns]
+	virtualClockPeriodNs: int = 1000
+	# bits of dirtyPages (4 KiB pages, see Watchpoints.pageBits)
+	dirtyLoop: int = 0x01			# see LoopDetector
+	dirtyMapped: int = 0x02			# see syncMapped
+
 	regMaxVal: 	Reg = 0xFFFFFF
 	regMinVal: 	Reg = 0x000000
 	maxAddress:	int = 0xFFFFF
@@ -38,22 +61,55 @@ class Machine():
 		self.devices[2] = OutputDevice("stderr")
 		self.devices[3] = InputDevice("stdrng")
 		self.devices[4] = FileDevice("stdtimer")
+		self.timerMode: TimerMode = TimerMode.HOST
+		# seed of stdrng (None = seeded from the system)
+		self.rngSeed: int|None = None
+		# flush policy given to all devices (None = default policy of each device)
+		self.flushPolicy: FlushPolicy|None = None
+		self.flushBufferSize: int|None = None
 
 		# initialize registers
-		# A, X, L, B, S, T, F, _, PC, SW <-> 0..9
-		# list of 10 registers, initialized to zeros
-		self.registers: list[Machine.Reg] = [0] * 10
-		self.regF: Machine.RegF = 0.0
+		# A, X, L, B, S, T, F, _, PC, SW <-> 0..9, initialized to zeros
+		self.registers: Registers = Registers()
 
 		# initialize memory
-		# memory: memory address (int) -> content at memory address (bytes (1))
-		# defaultdict: we don't want to initialize the entire memory on startup
-		# -> make default value at any memory location a byte of 0s
-		self.mem: defaultdict[int, Machine.Mem] = defaultdict(lambda: b'\x00')
-
-		# initialize instructions history string
-		self.instructionsStr = deque([])
-		self.instructionsStrSize = 10
+		# memory: contiguous buffer covering the whole 20-bit address space (1 MiB)
+		# zero-filled on startup, reads never allocate
+		self.mem: bytearray = bytearray(Machine.maxAddress + 1)
+		# pages changed since their users last looked at them (stores set all bits, each user clears its own)
+		self.dirtyPages: bytearray = bytearray(b"\xff" * ((Machine.maxAddress >> Watchpoints.pageBits) + 1))
+		# host files mapped into memory (see mapFile)
+		self.mappedRegions: list[MappedRegion] = []
+
+		# initialize decoded instructions cache
+		# address of instruction -> decoded instruction
+		self.decodeCache: dict[int, Decoded] = {}
+		# number of cached instructions covering each memory byte (for invalidation on stores)
+		self.decodeRefs: bytearray = bytearray(Machine.maxAddress + 1)
+		# execute pairs of common instructions as one (see setOpcodesFused)
+		self.fusion: bool = False
+		self.fusionCount: int = 0
+		# cycles and memory accesses of instructions (stored in decoded instructions)
+		self.costModel: CostModel = CostModel()
+		# performance counters updated by all engines
+		self.counters: Counters = Counters()
+		# counts of a run in progress (see getCurrentCounts)
+		self.pendingCounts: Callable[[], tuple[int, int]] = Machine.noPendingCounts
+		# translated basic blocks (built from cached instructions)
+		self.translator: Translator = Translator(self)
+		# memory watchpoints (accessors check them only on flagged pages)
+		self.watchpoints: Watchpoints = Watchpoints(Machine.maxAddress + 1)
+		self.watchPages: bytearray = self.watchpoints.pages
+		# first access that hit a watchpoint since the start of run
+		self.watchHit: WatchHit|None = None
+		# asynchronous device that stopped run (see StopReason.WAIT)
+		self.waitingDevice: Device|None = None
+		# receives events of the tracing engine (see executeTraced)
+		self.tracer: Callable[[TraceEvent], None] = Machine.logTraceEvent
+
+		# initialize instructions history (ring of decoded instructions, formatted on demand)
+		self.historySize = 10
+		self.history = deque(maxlen=self.historySize)
 
 		# machine is running until infinite loop
 		self.isRunning = True
@@ -75,10 +131,10 @@ class Machine():
 	# machine's clock period (minimum time per instruction)
 	clockPeriod: float
 
-	# list of instructions in string format (for displaying only)
-	instructionsStr: deque[str]
+	# last executed instructions (for displaying only), 0 disables it
+	history: deque[Decoded]
 	# size of array above
-	instructionsStrSize: int
+	historySize: int
 
 	def getProgName(self) -> str:
 		return self.progName
@@ -92,6 +148,22 @@ class Machine():
 		return self.isRunning
 	def getClockPeriod(self) -> float:
 		return self.clockPeriod
+	def getFusion(self) -> bool:
+		return self.fusion
+	def getFusionCount(self) -> int:
+		return self.fusionCount
+	def getHistorySize(self) -> int:
+		return self.historySize
+	def getWatchHit(self) -> WatchHit|None:
+		return self.watchHit
+	def getWaitingDevice(self) -> Device|None:
+		return self.waitingDevice
+	def getTracer(self) -> Callable[[TraceEvent], None]:
+		return self.tracer
+	def getCostModel(self) -> CostModel:
+		return self.costModel
+	def getCounters(self) -> Counters:
+		return self.counters
 	
 	def setProgName(self, progName: str):
 		self.progName = progName
@@ -105,65 +177,94 @@ class Machine():
 		self.isRunning = isRunning
 	def setClockPeriod(self, clockPeriod: float):
 		self.clockPeriod = clockPeriod
+	def addWatchpoint(self, start: int, end: int, read: bool = False, write: bool = True):
+		if not (Machine.minAddress <= start < end <= Machine.maxAddress + 1):
+			logger.error("invalid watchpoint range (" + hex(start) + ", " + hex(end) + ")")
+			return
+		self.watchpoints.add(Watchpoint(start, end, read, write))
+	def clearWatchpoints(self):
+		self.watchpoints.clear()
+	def setTracer(self, tracer: Callable[[TraceEvent], None]):
+		self.tracer = tracer
+	def setHistorySize(self, historySize: int):
+		if historySize < 0:
+			logger.error("invalid history size (" + str(historySize) + ")")
+			return
+		self.historySize = historySize
+		self.history = deque(self.history, maxlen=historySize)
+		# translated blocks record instructions into the history they were built with
+		self.translator.flush()
+	def setCostModel(self, costModel: CostModel):
+		self.costModel = costModel
+		# cached instructions carry costs of the previous model
+		self.flushDecoded()
+	def setFusion(self, fusion: bool):
+		if fusion != self.fusion:
+			self.fusion = fusion
+			self.flushDecoded()
 
 	# getters
 	def getA(self) -> Reg:
-		return self.registers[0]
+		return self.registers.A
 	def getX(self) -> Reg:
-		return self.registers[1]
+		return self.registers.X
 	def getL(self) -> Reg:
-		return self.registers[2]
+		return self.registers.L
 	def getB(self) -> Reg:
-		return self.registers[3]
+		return self.registers.B
 	def getS(self) -> Reg:
-		return self.registers[4]
+		return self.registers.S
 	def getT(self) -> Reg:
-		return self.registers[5]
+		return self.registers.T
 	def getF(self) -> RegF:
-		return self.regF
+		return self.registers.F
 	def getPC(self) -> Reg:
-		return self.registers[8]
+		return self.registers.PC
 	def getSW(self) -> Reg:
-		return self.registers[9]
+		return self.registers.SW
 
 	# setters
 	def setA(self, val: Reg):
-		self.registers[0] = val % (Machine.regMaxVal + 1)
+		self.registers.A = val & Machine.regMaxVal
 	def setX(self, val: Reg):
-		self.registers[1] = val % (Machine.regMaxVal + 1)
+		self.registers.X = val & Machine.regMaxVal
 	def setL(self, val: Reg):
-		self.registers[2] = val % (Machine.regMaxVal + 1)
+		self.registers.L = val & Machine.regMaxVal
 	def setB(self, val: Reg):
-		self.registers[3] = val % (Machine.regMaxVal + 1)
+		self.registers.B = val & Machine.regMaxVal
 	def setS(self, val: Reg):
-		self.registers[4] = val % (Machine.regMaxVal + 1)
+		self.registers.S = val & Machine.regMaxVal
 	def setT(self, val: Reg):
-		self.registers[5] = val % (Machine.regMaxVal + 1)
+		self.registers.T = val & Machine.regMaxVal
 	def setF(self, val: RegF):
-		self.regF = val
+		self.registers.F = val
 	def setPC(self, val: Reg):
-		self.registers[8] = val % (Machine.regMaxVal + 1)
+		self.registers.PC = val & Machine.regMaxVal
 	def setSW(self, val: Reg):
-		self.registers[9] = val % (Machine.regMaxVal + 1)
+		self.registers.SW = val & Machine.regMaxVal
 
 	# CC bits (needs CCBits class)
+	# instructions use registers.SW with ccGT/ccEQ/ccLT directly
 	def getCC(self) -> CCBits:
-		return CCBits(self.getSW())
+		return CCBits(self.registers.SW)
 	def setCC(self, cc: CCBits):
-		self.setSW(cc.value)
+		self.registers.SW = cc.value
 
 	# set and get via index	(use setF and getF for reg. F)
 	def getReg(self, reg: int) -> Reg:
-		return self.registers[reg]
+		return self.registers.get(reg)
 	def setReg(self, reg: int, val: Reg):
 		if self.regMinVal <= val <= self.regMaxVal:
-			self.registers[reg] = val
+			self.registers.set(reg, val)
 		else:
 			logger.error("value " + str(val) + " is not valid for register with index " + str(reg))
 
+	# all accessors check watchpoints, but only on pages that are watched (see Watchpoints)
 	def getByte(self, addr: int) -> Mem:
 		if self.minAddress <= addr <= self.maxAddress:
-			return self.mem[addr]
+			if self.watchPages[addr >> 12] & Watchpoints.read:
+				self.watchAccess(addr, 1, False, self.mem[addr])
+			return bytes(self.mem[addr:addr+1])
 		else:
 			logger.error("invalid address (" + str(addr) + ")")
 			# default: return byte with zeros
@@ -171,7 +272,12 @@ class Machine():
 	def setByte(self, addr: int, val: Mem):
 		if len(val) == 1:
 			if self.minAddress <= addr <= self.maxAddress:
-				self.mem[addr] = val
+				if self.watchPages[addr >> 12] & Watchpoints.write:
+					self.watchAccess(addr, 1, True, val[0])
+				self.mem[addr] = val[0]
+				self.dirtyPages[addr >> 12] = 0xFF
+				if self.decodeRefs[addr]:
+					self.invalidateDecoded(addr, 1)
 			else:
 				logger.error("invalid address (" + str(addr) + ")")
 		else:
@@ -183,7 +289,9 @@ class Machine():
 			logger.error("invalid address (" + str(addr) + ")")
 			return self.Mem(3)
 
-		return (self.mem[addr] + self.mem[addr+1] + self.mem[addr+2])
+		if self.watchPages[addr >> 12] & Watchpoints.read:
+			self.watchAccess(addr, 3, False, int.from_bytes(self.mem[addr:addr+3], "big"))
+		return bytes(self.mem[addr:addr+3])
 
 	def setWord(self, addr: int, val: Mem):
 
@@ -195,8 +303,71 @@ class Machine():
 			logger.error("3 bytes required, got (" + str(len(val)) + ")")
 			return
 
-		for i in range(3):
-			self.mem[addr+i] = val[i:i+1]
+		if self.watchPages[addr >> 12] & Watchpoints.write:
+			self.watchAccess(addr, 3, True, int.from_bytes(val, "big"))
+		self.mem[addr:addr+3] = val
+		self.dirtyPages[addr >> 12] = self.dirtyPages[(addr+2) >> 12] = 0xFF
+		decodeRefs: bytearray = self.decodeRefs
+		if decodeRefs[addr] or decodeRefs[addr+1] or decodeRefs[addr+2]:
+			self.invalidateDecoded(addr, 3)
+
+	# fast accessors: same checks as above, but work with ints instead of bytes
+	def getUint8(self, addr: int) -> int:
+		if self.minAddress <= addr <= self.maxAddress:
+			if self.watchPages[addr >> 12] & Watchpoints.read:
+				self.watchAccess(addr, 1, False, self.mem[addr])
+			return self.mem[addr]
+		logger.error("invalid address (" + str(addr) + ")")
+		return 0
+	def setUint8(self, addr: int, val: int):
+		if self.minAddress <= addr <= self.maxAddress:
+			if self.watchPages[addr >> 12] & Watchpoints.write:
+				self.watchAccess(addr, 1, True, val & 0xFF)
+			self.mem[addr] = val & 0xFF
+			self.dirtyPages[addr >> 12] = 0xFF
+			if self.decodeRefs[addr]:
+				self.invalidateDecoded(addr, 1)
+		else:
+			logger.error("invalid address (" + str(addr) + ")")
+
+	def getUint24(self, addr: int) -> int:
+		if self.minAddress <= addr and (addr+2) <= self.maxAddress:
+			mem = self.mem
+			val: int = (mem[addr] << 16) | (mem[addr+1] << 8) | mem[addr+2]
+			if self.watchPages[addr >> 12] & Watchpoints.read:
+				self.watchAccess(addr, 3, False, val)
+			return val
+		logger.error("invalid address (" + str(addr) + ")")
+		return 0
+	def setUint24(self, addr: int, val: int):
+		if self.minAddress <= addr and (addr+2) <= self.maxAddress:
+			if self.watchPages[addr >> 12] & Watchpoints.write:
+				self.watchAccess(addr, 3, True, val & 0xFFFFFF)
+			mem = self.mem
+			mem[addr] = (val >> 16) & 0xFF
+			mem[addr+1] = (val >> 8) & 0xFF
+			mem[addr+2] = val & 0xFF
+			self.dirtyPages[addr >> 12] = self.dirtyPages[(addr+2) >> 12] = 0xFF
+			decodeRefs: bytearray = self.decodeRefs
+			if decodeRefs[addr] or decodeRefs[addr+1] or decodeRefs[addr+2]:
+				self.invalidateDecoded(addr, 3)
+		else:
+			logger.error("invalid address (" + str(addr) + ")")
+
+	# instruction fetch: same as getUint8, but ignores watchpoints
+	def peekUint8(self, addr: int) -> int:
+		if self.minAddress <= addr <= self.maxAddress:
+			return self.mem[addr]
+		logger.error("invalid address (" + str(addr) + ")")
+		return 0
+
+	# slow path of accessors on watched pages (value is the new value for writes)
+	# only the first hit is kept until Machine.run reports it
+	def watchAccess(self, addr: int, length: int, write: bool, value: int):
+		if self.watchHit is not None or not self.watchpoints.match(addr, length, write):
+			return
+		oldValue: int = int.from_bytes(self.mem[addr:addr+length], "big")
+		self.watchHit = WatchHit(write, addr, length, oldValue, value if write else oldValue)
 
 	def getFloat(self, addr: int) -> float:
 
@@ -204,9 +375,11 @@ class Machine():
 			logger.error("invalid address (" + str(addr) + ")")
 			return 0.0
 
-		byteList: list[bytes] = [self.getByte(addr+i) for i in range(6)]
-
-		return bytes2float(byteList)
+		val: int = int.from_bytes(self.mem[addr:addr+6], "big")
+		# operand can span two pages
+		if (self.watchPages[addr >> 12] | self.watchPages[(addr+5) >> 12]) & Watchpoints.read:
+			self.watchAccess(addr, 6, False, val)
+		return int2float(val)
 
 	def setFloat(self, addr: int, val: float):
 
@@ -214,10 +387,13 @@ class Machine():
 			logger.error("invalid address (" + str(addr) + ")")
 			return
 
-		bytesFloat: list[bytes] = float2bytes(val)
-
-		for i in range(6):
-			self.setByte(addr+i, bytesFloat[i])
+		valInt: int = float2int(val)
+		if (self.watchPages[addr >> 12] | self.watchPages[(addr+5) >> 12]) & Watchpoints.write:
+			self.watchAccess(addr, 6, True, valInt)
+		self.mem[addr:addr+6] = valInt.to_bytes(6, "big")
+		self.dirtyPages[addr >> 12] = self.dirtyPages[(addr+5) >> 12] = 0xFF
+		if any(self.decodeRefs[addr:addr+6]):
+			self.invalidateDecoded(addr, 6)
 
 	"""
 
@@ -232,12 +408,12 @@ class Machine():
 	val = s * f * (2 ^ (e - 1024)) = 6.5
 
 		m = Machine()
-		m.mem[0] = b'\x40'
-		m.mem[1] = b'\x2a'
-		m.mem[2] = b'\x00'
-		m.mem[3] = b'\x00'
-		m.mem[4] = b'\x00'
-		m.mem[5] = b'\x00'
+		m.mem[0] = 0x40
+		m.mem[1] = 0x2a
+		m.mem[2] = 0x00
+		m.mem[3] = 0x00
+		m.mem[4] = 0x00
+		m.mem[5] = 0x00
 		m.getFloat(0)
 
 		m = Machine()
@@ -253,26 +429,120 @@ class Machine():
 
 	def getDevice(self, num: int) -> Device|None:
 
-		if not (0 <= num <= 256):
+		if not (0 <= num <= 0xFF):
 			logger.error("invalid device number (" + str(num) + ")")
 			return None
 		return self.devices[num]
 
 	def setDevice(self, num: int, device: Device):
-		if not (0 <= num <= 256):
+		if not (0 <= num <= 0xFF):
 			logger.error("invalid device number (" + str(num) + ")")
 		else:
+			if self.flushPolicy is not None:
+				device.setFlushPolicy(self.flushPolicy, self.flushBufferSize)
 			self.devices[num] = device
 
-	def addInstructionString(self, instruction: str):
-		if len(self.instructionsStr) >= self.instructionsStrSize:
-			self.instructionsStr.popleft()
-			self.instructionsStr.append(instruction.ljust(40))
-		else:
-			self.instructionsStr.append(instruction.ljust(40))
+	# executed instructions and cycles, including those of a run in progress (that updates counters when it returns)
+	def getCurrentCounts(self) -> tuple[int, int]:
+		instructions, cycles = self.pendingCounts()
+		return (self.counters.instructions + instructions, self.counters.cycles + cycles)
+	@staticmethod
+	def noPendingCounts() -> tuple[int, int]:
+		return (0, 0)
+
+	def getTimerMode(self) -> TimerMode:
+		return self.timerMode
+	# restart stdtimer (device 4) with given time source
+	def setTimerMode(self, timerMode: TimerMode):
+		self.timerMode = timerMode
+		clock: Callable[[], int]
+		match timerMode:
+			case TimerMode.HOST:
+				clock = time.perf_counter_ns
+			case TimerMode.INSTRUCTIONS:
+				clock = lambda: self.getCurrentCounts()[0] * Machine.virtualClockPeriodNs
+			case TimerMode.CYCLES:
+				clock = lambda: self.getCurrentCounts()[1] * Machine.virtualClockPeriodNs
+		self.setDevice(4, FileDevice("stdtimer", clock))
+
+	def getRngSeed(self) -> int|None:
+		return self.rngSeed
+	# restart stdrng (device 3) with given seed, so random bytes are the same in every run
+	def setRngSeed(self, seed: int|None):
+		self.rngSeed = seed
+		self.setDevice(3, InputDevice("stdrng", seed))
+
+	def getFlushPolicy(self) -> FlushPolicy|None:
+		return self.flushPolicy
+	# set flush policy (and buffer size) of current and future devices
+	def setFlushPolicy(self, flushPolicy: FlushPolicy, bufferSize: int|None = None):
+		self.flushPolicy = flushPolicy
+		self.flushBufferSize = bufferSize
+		for device in self.devices:
+			if device is not None:
+				device.setFlushPolicy(flushPolicy, bufferSize)
+
+	# write out buffered output of all devices (and changes of mapped files)
+	def flushDevices(self):
+		for device in self.devices:
+			if device is not None:
+				device.flush()
+		if self.mappedRegions:
+			self.syncMapped()
+
+	def getMappedRegions(self) -> list[MappedRegion]:
+		return self.mappedRegions
+	# map host file into memory window [start, start+size) (size None = size of the file)
+	# loads and store instructions on the window work with contents of the file,
+	# changes are written to the file when the machine stops (see flushDevices) or on syncMapped/unmapFile
+	def mapFile(self, fileName: str, start: int, size: int|None = None, writable: bool = True) -> MappedRegion|None:
+		try:
+			region: MappedRegion = MappedRegion(fileName, start, size, writable)
+		except (OSError, ValueError) as error:
+			logger.error("file can't be mapped (" + str(error) + ")")
+			return None
+		if not (Machine.minAddress <= region.getStart() and region.getEnd() <= Machine.maxAddress + 1):
+			logger.error("mapped window doesn't fit into memory (" + hex(region.getStart()) + ", " + hex(region.getEnd()) + ")")
+			region.close()
+			return None
+		for other in self.mappedRegions:
+			if other.overlaps(region.getStart(), region.getEnd()):
+				logger.error("mapped window overlaps " + other.getFileName())
+				region.close()
+				return None
+		region.load(self.mem)
+		# cached instructions may be overwritten, loop detection must see new contents (the file already has them)
+		self.flushDecoded()
+		for page in range(region.getStart() >> Watchpoints.pageBits, ((region.getEnd() - 1) >> Watchpoints.pageBits) + 1):
+			self.dirtyPages[page] |= Machine.dirtyLoop
+		self.mappedRegions.append(region)
+		return region
+	# write changes of the window back to the file and remove the mapping (memory keeps its contents)
+	def unmapFile(self, region: MappedRegion):
+		region.sync(self.mem)
+		region.close()
+		self.mappedRegions.remove(region)
+	# write changes of all windows back to their files
+	# only pages stored to since the last sync are compared, so it is cheap when the guest doesn't touch the windows
+	def syncMapped(self):
+		dirtyPages: bytearray = self.dirtyPages
+		pages: list[int] = [page for page in range(len(dirtyPages)) if dirtyPages[page] & Machine.dirtyMapped]
+		if not pages:
+			return
+		for region in self.mappedRegions:
+			region.sync(self.mem, pages)
+		for page in pages:
+			dirtyPages[page] &= ~Machine.dirtyMapped
+
+	# look again for device files that were missing (e.g. created after the machine first used them)
+	def rescanDevices(self):
+		for device in self.devices:
+			if device is not None:
+				device.rescan()
 
 	def getInstructionsString(self) -> str:
-		return ("\n".join(self.instructionsStr) + "\n").upper()
+		lines: list[str] = [self.createInstructionString(decoded).ljust(40) for decoded in self.history]
+		return ("\n".join(lines) + "\n").upper()
 
 	def fetch(self) -> Mem:
 		valPC: int = self.getPC()					# get value of PC
@@ -281,287 +551,524 @@ class Machine():
 		return byte
 
 	def fetchUint8(self) -> int:
-		fetchedByte: Machine.Mem = self.fetch()
-		return int.from_bytes(bytes=fetchedByte, byteorder="big", signed=False)
+		valPC: int = self.getPC()
+		self.setPC(valPC + 1)
+		return self.peekUint8(valPC)
 
-	def execute(self):
-		int1: int = self.fetchUint8()				# get first byte
+	# decode instruction at address addr without changing PC
+	def decode(self, addr: int) -> Decoded:
+		int1: int = self.peekUint8(addr)				# get first byte
 		logger.debug("byte1: " + hex(int1))
+		entry: DispatchEntry = dispatchTable[int1]
+		decoded: Decoded = entry.decoder(self, entry, addr, int1)
+		return decoded._replace(cost=self.costModel.cost(decoded))
+
+	def decodeInvalid(self, entry: DispatchEntry, addr: int, int1: int) -> Decoded:
+		return Decoded(entry.handler, entry.executor, "", entry.opcode, None, None, (int1, 0), 1)
+
+	def decodeF1(self, entry: DispatchEntry, addr: int, int1: int) -> Decoded:
+		logger.info("instruction format: F1")
+		return Decoded(entry.handler, entry.executor, "F1", entry.opcode, None, None, (0, 0), 1)
+
+	def decodeF2(self, entry: DispatchEntry, addr: int, int1: int) -> Decoded:
+		logger.info("instruction format: F2")
+		int2: int = self.peekUint8(addr+1)			# get second byte
+		logger.debug("byte2: " + hex(int2))
+		r1: int = int2 >> 4							# extract r1
+		r2: int = int2 % 0x10						# extract r2
+		return Decoded(entry.handler, entry.executor, "F2", entry.opcode, None, None, (r1, r2), 2)
+
+	def decodeSIC(self, entry: DispatchEntry, addr: int, int1: int) -> Decoded:
+		logger.info("instruction format: SIC")
+		int2: int = self.peekUint8(addr+1)			# get second byte
+		logger.debug("byte2: " + hex(int2))
+		int3: int = self.peekUint8(addr+2)
+		logger.debug("byte3: " + hex(int3))
+
+		# n = i = 0, x is the MSb of second byte
+		bits: int = (int2 & 0x80) >> 4
+		address: int = ((int2 & 0x7F) << 8) + int3
+		addressSigned: int = (-0x4000 if address & 0x4000 else 0) + (address & 0x3FF)
+		return Decoded(entry.handler, entry.executor, "SIC", entry.opcode, Nixbpe(bits), addressingTable[entry.addressingClass | bits], (address, addressSigned), 3)
+
+	def decodeF3F4(self, entry: DispatchEntry, addr: int, int1: int) -> Decoded:
+		int2: int = self.peekUint8(addr+1)
+		logger.debug("byte2: " + hex(int2))
+		int3: int = self.peekUint8(addr+2)
+		logger.debug("byte3: " + hex(int3))
+
+		# bits n and i from first byte, bits x, b, p and e from second byte
+		bits: int = ((int1 & 0x03) << 4) | (int2 >> 4)
+		addressing: AddressingMode = addressingTable[entry.addressingClass | bits]
+
+		# F4
+		if bits & Nixbpe.E:
+
+			logger.info("instruction format: F4")
+			int4: int = self.peekUint8(addr+3)
+			logger.debug("byte4: " + hex(int4))
+
+			address: int = ((int2 & 0x0F) << 16) + (int3 << 8) + int4
+			addressSigned: int = (-0x80000 if address & 0x80000 else 0) + (address & 0x7FFFF)
+			return Decoded(entry.handler, entry.executor, "F4", entry.opcode, Nixbpe(bits), addressing, (address, addressSigned), 4)
+
+		# F3
+		logger.info("instruction format: F3")
+		offset: int = ((int2 & 0x0F) << 8) + int3
+		offsetSigned: int = (-0x800 if offset & 0x800 else 0) + (offset & 0x7FF)
+		return Decoded(entry.handler, entry.executor, "F3", entry.opcode, Nixbpe(bits), addressing, (offset, offsetSigned), 3)
+
+	# get decoded instruction at address addr (decode it on first visit)
+	def getDecoded(self, addr: int) -> Decoded:
+		decoded: Decoded|None = self.decodeCache.get(addr)
+		if decoded is None:
+			decoded = self.decode(addr)
+			if self.fusion and decoded.opcode in setOpcodesFusedFirst:
+				decoded = self.fuse(addr, decoded)
+			if addr + decoded.length <= Machine.maxAddress + 1:
+				self.decodeCache[addr] = decoded
+				for i in range(addr, addr + decoded.length):
+					self.decodeRefs[i] += 1
+		return decoded
+
+	# combine instruction with the next one if they form a superinstruction
+	def fuse(self, addr: int, first: Decoded) -> Decoded:
+		second: Decoded = self.decode(addr + first.length)
+		if (first.opcode, second.opcode) not in setOpcodesFused:
+			return first
+		logger.debug("fusing " + str(first.opcode) + " and " + str(second.opcode) + " at " + hex(addr))
+		return Decoded(None, Machine.execFused, "fused", first.opcode, first.nixbpe, first.addressing, (first, second), first.length + second.length, first.cost.plus(second.cost))
+
+	# drop all cached instructions (and translated blocks)
+	def flushDecoded(self):
+		self.decodeCache.clear()
+		self.decodeRefs[:] = bytes(len(self.decodeRefs))
+		self.translator.flush()
+
+	# drop cached instructions that overlap bytes [addr, addr+length)
+	def invalidateDecoded(self, addr: int, length: int):
+		decodeCache: dict[int, Decoded] = self.decodeCache
+		decodeRefs: bytearray = self.decodeRefs
+		# longest cached record (superinstruction of two F4 instructions) is 8 bytes long
+		for start in range(max(addr - 7, Machine.minAddress), addr + length):
+			decoded: Decoded|None = decodeCache.get(start)
+			if decoded is not None and start + decoded.length > addr:
+				logger.debug("invalidating decoded instruction at " + hex(start))
+				del decodeCache[start]
+				for i in range(start, start + decoded.length):
+					decodeRefs[i] -= 1
+		# translated blocks are built from cached instructions
+		if self.translator.blocks:
+			self.translator.invalidate(addr, length)
+
+	# returns address of the last executed instruction
+	def execute(self) -> int:
+		registers: Registers = self.registers
+		valPC: int = registers.PC
+		decoded: Decoded = self.getDecoded(valPC)
+		self.waitingDevice = None
+
+		# PC points to the next instruction during execution
+		nextPC: int = (valPC + decoded.length) & Machine.regMaxVal
+		registers.PC = nextPC
+		decoded.executor(self, decoded)
+		# RD without input is executed again later (see waitForDevice), so it isn't counted
+		if self.waitingDevice is not None:
+			return valPC
+		self.counters.count(decoded, registers.PC != nextPC)
+
+		if decoded.format == "fused":
+			# second instruction of the pair was executed last
+			return valPC + decoded.operand[0].length
+		return valPC
+
+	# run up to maxSteps instructions (superinstructions count as two)
+	# stops earlier if the machine halts, PC reaches a breakpoint, (with stopOnDevice) after RD/WD
+	# or when an asynchronous device has no input yet (WAIT, PC stays at RD or the TD/JEQ loop)
+	# buffered device output is flushed when the machine halts or stops at a breakpoint or watchpoint
+	# conditions of Breakpoints are evaluated only when PC matches their address
+	# with watchpoints set, superinstructions are split and stops after an access are reported in watchHit
+	# returns the reason and the number of executed instructions
+	def run(self, maxSteps: int, breakpoints: Collection[int] = (), translate: bool = False, stopOnDevice: bool = False) -> tuple[StopReason, int]:
+
+		# cache everything used by the loop in local variables
+		registers: Registers = self.registers
+		decodeCache: dict[int, Decoded] = self.decodeCache
+		getDecoded: Callable[[int], Decoded] = self.getDecoded
+		translator: Translator = self.translator
+		maxBlockLength: int = Translator.maxBlockLength
+		regMaxVal: int = Machine.regMaxVal
+		breakpointSet: frozenset[int] = frozenset(breakpoints)
+		watching: bool = len(self.watchpoints) > 0
+		self.watchHit = None
+		self.waitingDevice = None
+		conditional: Breakpoints|None = breakpoints if isinstance(breakpoints, Breakpoints) and breakpoints.conditional else None
+		steps: int = 0
+		# counters of interpreted instructions are kept in local variables until run returns
+		# (translated blocks update them on their own)
+		counters: Counters = self.counters
+		formats: dict[str, int] = counters.formats
+		interpreted: int = 0
+		cycles: int = 0
+		reads: int = 0
+		writes: int = 0
+		taken: int = 0
+		# devices can see them while the run is in progress (see getCurrentCounts)
+		def pending() -> tuple[int, int]:
+			return (interpreted, cycles)
+		self.pendingCounts = pending
 
-		# check if it is a valid op. code (ignore lowest 2 bits)
-		if not ((int1 & 0xFC) in setOpcodesInt):
-			logger.error("invalid opcode (" + str(int1) + ")")
-			return
-
-		# F1
-		if Opcode((int1 & 0xFC)) in setOpcodesF1:
-			logger.info("instruction format: F1")
-			self.execF1(Opcode(int1))			# execute F1
-		
-		# F2
-		elif Opcode((int1 & 0xFC)) in setOpcodesF2:
-			logger.info("instruction format: F2")
-			int2: int = self.fetchUint8()			# get second byte
-			logger.debug("byte2: " + hex(int2))
-			r1: int = int2 >> 4						# extract r1
-			r2: int = int2 % 0x10					# extract r2
-			self.execF2(Opcode(int1), r1, r2)	# execute F2
-
-		# SIC, F3 or F4
-		else:
-			# SIC
-			if int1 % 4 == 0:
-
-				logger.info("instruction format: SIC")
-				# initialize nixbpe
-				nixbpe = Nixbpe()
-				# nixbpe.setN(0)	# default is 0
-				# nixbpe.setI(0)	# default is 0
-
-				int2: int = self.fetchUint8()		# get second byte
-				logger.debug("byte2: " + hex(int2))
-				if int2 & 0x80:						# check MSb
-					nixbpe.setX(1)					# set X accordingly
-
-				int3: int = self.fetchUint8()
-				logger.debug("byte3: " + hex(int3))
-				address: int = ((int2 & 0x7F) << 8) + int3
-				addressSigned: int = (-0x4000 if address & 0x4000 else 0) + (address & 0x3FF)
-
-				self.execSICF3F4(Opcode(int1), nixbpe, address, addressSigned)
-			
-			# F3 or F4
-			else:
-				
-				# initialize nixbpe
-				nixbpe = Nixbpe()
-
-				# read bits n and i from first byte
-				if int1 & 0x01:
-					nixbpe.setI(1)
-				if int1 & 0x02:
-					nixbpe.setN(1)
-
-				# read bits x, b, p and e from second byte
-				int2: int = self.fetchUint8()
-				logger.debug("byte2: " + hex(int2))
-				if int2 & 0x80:
-					nixbpe.setX(1)
-				if int2 & 0x40:
-					nixbpe.setB(1)
-				if int2 & 0x20:
-					nixbpe.setP(1)
-				if int2 & 0x10:
-					nixbpe.setE(1)
-
-				int3: int = self.fetchUint8()
-				logger.debug("byte3: " + hex(int3))
-				
-				# F4
-				if nixbpe.getE():
-					
-					logger.info("instruction format: F4")
-					int4: int = self.fetchUint8()
-					logger.debug("byte4: " + hex(int4))
-					
-					address: int = ((int2 & 0x0F) << 16) + (int3 << 8) + int4
-					addressSigned: int = (-0x80000 if address & 0x80000 else 0) + (address & 0x7FFFF)
-
-					self.execSICF3F4(Opcode(int1 & 0xFC), nixbpe, address, addressSigned)
-				
-				# F3
+		try:
+			while steps < maxSteps:
+				valPC: int = registers.PC
+				decoded: Decoded|None
+				lastPC: int
+
+				# whole translated block (only if it can't exceed maxSteps)
+				if translate and not watching and steps + maxBlockLength <= maxSteps:
+					lastPC = translator.execute(breakpoints)
+					steps += translator.lastCount
+					decoded = decodeCache.get(lastPC)
+
+				# single instruction (see execute)
 				else:
+					decoded = decodeCache.get(valPC)
+					if decoded is None:
+						decoded = getDecoded(valPC)
+					# report the instruction that made the access, not the pair,
+					# stop at breakpoints on the second instruction and don't exceed maxSteps
+					if decoded.format == "fused" and (watching or steps + 2 > maxSteps or valPC + decoded.operand[0].length in breakpointSet):
+						decoded = decoded.operand[0]
+					nextPC: int = (valPC + decoded.length) & regMaxVal
+					registers.PC = nextPC
+					decoded.executor(self, decoded)
+					# RD without input is executed again later (see waitForDevice), so it isn't counted
+					if registers.PC == valPC and self.waitingDevice is not None:
+						return (StopReason.WAIT, steps)
+					if decoded.format == "fused":
+						lastPC = valPC + decoded.operand[0].length
+						steps += 2
+						interpreted += 2
+						formats[decoded.operand[0].format] += 1
+						formats[decoded.operand[1].format] += 1
+					else:
+						lastPC = valPC
+						steps += 1
+						interpreted += 1
+						formats[decoded.format] += 1
+					cost: Cost = decoded.cost
+					cycles += cost.cycles
+					reads += cost.reads
+					writes += cost.writes
+					if registers.PC != nextPC:
+						taken += 1
+
+				# TD/JEQ loops jump back by a single instruction (see fastForwardSpin)
+				# (not if a breakpoint is set on TD or JEQ, they must stop every iteration)
+				if 0 < lastPC - registers.PC <= 4 and not watching and registers.PC not in breakpointSet and lastPC not in breakpointSet:
+					steps += self.fastForwardSpin(lastPC, maxSteps - steps, decoded is not None and decoded.format == "fused")
+					if self.waitingDevice is not None:
+						return (StopReason.WAIT, steps)
+
+				if watching and self.watchHit is not None:
+					self.watchHit = self.watchHit._replace(PC=lastPC, decoded=decodeCache.get(lastPC))
+					self.flushDevices()
+					return (StopReason.WATCHPOINT, steps)
+				if registers.PC == lastPC:
+					# RD of a translated block is executed again when its device gets input
+					if self.waitingDevice is not None:
+						return (StopReason.WAIT, steps)
+					logger.info("infinite loop -> halt")
+					self.isRunning = False
+					self.flushDevices()
+					return (StopReason.HALT, steps)
+				if registers.PC in breakpointSet and (conditional is None or conditional.triggered(registers)):
+					self.flushDevices()
+					return (StopReason.BREAKPOINT, steps)
+				if stopOnDevice and decoded is not None and decoded.opcode in opcodesDevice:
+					return (StopReason.DEVICE, steps)
+
+			return (StopReason.STEPS, steps)
+
+		finally:
+			self.pendingCounts = Machine.noPendingCounts
+			counters.instructions += interpreted
+			counters.cycles += cycles
+			counters.memoryReads += reads
+			counters.memoryWrites += writes
+			counters.branchesTaken += taken
+
+	# run in batches (see run) until the machine stops or one of the limits is reached
+	# returns the reason (HALT, BUDGET, TIMEOUT, LOOP or a reason of run other than STEPS) and the number of executed instructions
+	def runLimited(self, limits: Limits, translate: bool = False) -> tuple[StopReason, int]:
+		deadline: float|None = time.perf_counter() + limits.timeout if limits.timeout is not None else None
+		detector: LoopDetector|None = LoopDetector() if limits.loopCheckInterval > 0 else None
+		steps: int = 0
+
+		while True:
+			batch: int|None = self.nextBatch(limits, steps)
+			if batch is None:
+				return (StopReason.BUDGET, steps)
+
+			reason, executed = self.run(batch, (), translate)
+			steps += executed
+			if reason != StopReason.STEPS:
+				return (reason, steps)
+
+			reason = self.checkLimits(steps, deadline, detector)
+			if reason != StopReason.STEPS:
+				return (reason, steps)
+
+	# coroutine version of runLimited, doesn't block the event loop:
+	# other tasks run between batches and the machine waits for input of asynchronous devices (see StreamInputDevice)
+	# returns the reason (HALT, BUDGET, TIMEOUT, LOOP or a reason of run other than STEPS and WAIT) and the number of executed instructions
+	async def runAsync(self, limits: Limits, translate: bool = False) -> tuple[StopReason, int]:
+		deadline: float|None = time.perf_counter() + limits.timeout if limits.timeout is not None else None
+		detector: LoopDetector|None = LoopDetector() if limits.loopCheckInterval > 0 else None
+		steps: int = 0
+
+		while True:
+			batch: int|None = self.nextBatch(limits, steps)
+			if batch is None:
+				return (StopReason.BUDGET, steps)
+
+			reason, executed = self.run(batch, (), translate)
+			steps += executed
+			if reason == StopReason.WAIT:
+				# output (e.g. a prompt) should be visible while waiting
+				self.flushDevices()
+				try:
+					await asyncio.wait_for(self.waitingDevice.wait(), None if deadline is None else max(deadline - time.perf_counter(), 0))
+				except asyncio.TimeoutError:
+					pass
+				# waiting machine doesn't change, which is not a loop
+				if detector is not None:
+					detector.reset()
+			elif reason != StopReason.STEPS:
+				return (reason, steps)
+			else:
+				await asyncio.sleep(0)
+
+			reason = self.checkLimits(steps, deadline, detector)
+			if reason != StopReason.STEPS:
+				return (reason, steps)
+
+	# number of instructions of the next batch of runLimited or runAsync, None if the budget is exhausted
+	def nextBatch(self, limits: Limits, steps: int) -> int|None:
+		batch: int = limits.getBatchSteps()
+		if limits.maxInstructions is not None:
+			if steps >= limits.maxInstructions:
+				self.flushDevices()
+				return None
+			batch = min(batch, limits.maxInstructions - steps)
+		return batch
+
+	# time and loop limits of runLimited and runAsync, returns STEPS if the run can continue
+	def checkLimits(self, steps: int, deadline: float|None, detector: LoopDetector|None) -> StopReason:
+		if deadline is not None and time.perf_counter() >= deadline:
+			self.flushDevices()
+			return StopReason.TIMEOUT
+		if detector is not None:
+			first: int|None = detector.check(self, steps)
+			if first is not None:
+				logger.info("state after " + str(steps) + " instructions was already reached after " + str(first))
+				self.flushDevices()
+				return StopReason.LOOP
+		return StopReason.STEPS
+
+	# RD found no input on an asynchronous device: PC goes back to RD (its length is given),
+	# so it is executed again when the device has input, and run stops with WAIT
+	def waitForDevice(self, device: Device, length: int):
+		self.waitingDevice = device
+		self.registers.PC = (self.registers.PC - length) & Machine.regMaxVal
+
+	# called after JEQ at address lastPC jumped back to the instruction before it
+	# if that is TD on a device that is not ready (TD/JEQ spin loop), the loop would spin until the device becomes ready:
+	# wait for the device (at most spinTimeout), if it is still not ready skip whole iterations within maxSteps in bulk
+	# (state and counters end up the same as if they were executed, superinstructions are counted if fused is set)
+	# returns the number of skipped instructions
+	def fastForwardSpin(self, lastPC: int, maxSteps: int, fused: bool) -> int:
+		registers: Registers = self.registers
+		valPC: int = registers.PC
+		test: Decoded|None = self.decodeCache.get(valPC)
+		jump: Decoded|None = self.decodeCache.get(lastPC)
+		if test is not None and test.format == "fused":
+			test, jump = test.operand
+		if test is None or jump is None or test.opcode != Opcode.TD or jump.opcode != Opcode.JEQ or valPC + test.length != lastPC:
+			return 0
+		if test.addressing is None or test.addressing.targetAddress is None:
+			return 0
+
+		# device of TD (PC points after TD while its operand is calculated)
+		registers.PC = lastPC
+		deviceId: int = isicf3f4.deviceNumber(test.nixbpe, test.addressing.finalize(self, self.getTargetAddress(test)))
+		registers.PC = valPC
+		device: Device|None = self.devices[deviceId] if 0 <= deviceId < len(self.devices) else None
+		if device is None or device.waitReady(0 if self.clockPeriod > 0 else Machine.spinTimeout):
+			return 0
+		# input comes from the event loop, so run must return to let it run (see runAsync)
+		if device.asynchronous:
+			self.waitingDevice = device
+			return 0
+
+		iterations: int = maxSteps // 2
+		if iterations <= 0:
+			return 0
+		logger.debug("TD/JEQ loop at " + hex(valPC) + " skips " + str(iterations) + " iterations")
+		cost: Cost = test.cost.plus(jump.cost)
+		formats: dict[str, int] = {test.format: iterations}
+		formats[jump.format] = formats.get(jump.format, 0) + iterations
+		self.counters.add(2 * iterations, cost.times(iterations), formats, iterations)
+		self.counters.devicePolls += iterations
+		if fused:
+			self.fusionCount += iterations
+		for i in range(min(iterations, (self.history.maxlen + 1) // 2)):
+			self.history.extend((test, jump))
+		return 2 * iterations
+
+	# tracing engine: same as execute, but reports every instruction to the tracer
+	# superinstructions are executed (and reported) as separate instructions
+	def executeTraced(self) -> int:
+		registers: Registers = self.registers
+		valPC: int = registers.PC
+		decoded: Decoded = self.getDecoded(valPC)
+		if decoded.format == "fused":
+			decoded = decoded.operand[0]
+
+		self.waitingDevice = None
+
+		nextPC: int = (valPC + decoded.length) & Machine.regMaxVal
+		registers.PC = nextPC
+		targetAddress: int|None = None
+		parameter: int|None = None
+		if decoded.addressing is not None and decoded.addressing.targetAddress is not None:
+			targetAddress = self.getTargetAddress(decoded)
+			parameter = decoded.addressing.finalize(self, targetAddress)
+		decoded.executor(self, decoded)
+		# RD without input is reported when it is executed again (see waitForDevice)
+		if self.waitingDevice is not None:
+			return valPC
+		self.counters.count(decoded, registers.PC != nextPC)
+
+		self.tracer(TraceEvent(valPC, decoded, targetAddress, parameter))
+		return valPC
 
-					logger.info("instruction format: F3")
-					offset: int = ((int2 & 0x0F) << 8) + int3
-					offsetSigned: int = (-0x800 if offset & 0x800 else 0) + (offset & 0x7FF)
-					self.execSICF3F4(Opcode(int1 & 0xFC), nixbpe, offset, offsetSigned)
-
-	def execF1(self, opcode: Opcode):
-
-		logger.debug("opcode: " + str(opcode))
-
-		# get instruction from opcode
-		instruction: Callable[[Machine], None]
-		try:
-			instruction = if1.opcode2instructionF1[opcode]
-		except KeyError:
-			logger.error("invalid op. code (" + str(opcode) + ")")
-			return
-		logger.info("instruction: " + str(instruction))
-		self.addInstructionString("{:3s}: {:6s}".format("F1", opcode))
+	@staticmethod
+	def logTraceEvent(event: TraceEvent):
+		if logger.isEnabledFor(logging.DEBUG):
+			s: str = "{:06x}: {:s}".format(event.address, Machine.createInstructionString(event.decoded))
+			if event.targetAddress is not None:
+				s += " TA={:06x} parameter={:06x}".format(event.targetAddress, event.parameter)
+			logger.debug(s)
+
+	# execute translated basic block from PC (stops before breakpoints)
+	# returns address of the last executed instruction
+	def executeBlock(self, breakpoints: Collection[int] = ()) -> int:
+		self.waitingDevice = None
+		return self.translator.execute(breakpoints)
+
+	# run both instructions of a superinstruction with a single dispatch
+	def execFused(self, decoded: Decoded):
+		first, second = decoded.operand
+		# PC after the first instruction (first instructions never jump)
+		registers: Registers = self.registers
+		valPC: int = registers.PC - second.length
+		registers.PC = valPC
+		first.executor(self, first)
+		registers.PC = valPC + second.length
+		second.executor(self, second)
+		self.fusionCount += 1
+
+	def execInvalid(self, decoded: Decoded):
+		logger.error("invalid opcode (" + str(decoded.operand[0]) + ")")
+
+	def execF1(self, decoded: Decoded):
+
+		self.history.append(decoded)
 
 		# execute the instruction
-		instruction(self)
+		decoded.handler(self)
 
-	def execF2(self, opcode: Opcode, r1: int, r2: int):
+	def execF2(self, decoded: Decoded):
 
-		logger.debug("opcode: " + str(opcode) + ", r1: " + str(r1) + ", r2: " + str(r2))
-		
-		# get instruction from opcode
-		instruction: Callable[[Machine, int, int], None]
-		try:
-			instruction = if2.opcode2instructionF2[opcode]
-		except KeyError:
-			logger.error("invalid op. code (" + str(opcode) + ")")
-			return
-		logger.info("instruction: " + str(instruction))
-		self.addInstructionString("{:3s}: {:6s} r1={:1d} r2={:1d}".format("F2", opcode, r1, r2))
+		r1, r2 = decoded.operand
+		self.history.append(decoded)
 
 		# execute the instruction
-		instruction(self, r1, r2)
+		decoded.handler(self, r1, r2)
 
 	def baseRelative(self, uOperand: int, sOperand: int):
-		return (self.getB() + uOperand)
+		return (self.registers.B + uOperand)
 
 	def PCRelative(self, uOperand: int, sOperand: int):
-		return (self.getPC() + sOperand)
+		return (self.registers.PC + sOperand)
 
 	def directAddressing(self, uOperand: int, sOperand: int):
 		return uOperand
 
-	# returns function that will calculate the TA
-	def getTA(self, nixbpe: Nixbpe) -> Callable[[int, int], int]:
-		match nixbpe.getTuple():
-			case (0, 0, _, _, _, _):			# legacy SIC
-				logger.info("using direct addressing (legacy SIC)")
-				return self.directAddressing
-			case (_, _, _, 1, 0, _):
-				logger.info("using base-relative addressing")
-				return self.baseRelative
-			case (_, _, _, 0, 1, _):
-				logger.info("using PC-relative addressing")
-				return self.PCRelative
-			case (_, _, _, 0, 0, _):
-				logger.info("using direct addressing")
-				return self.directAddressing
-			case _:
-				logger.error("invalid combination of b and p bits (b=" + str(nixbpe.getB()) + ", p=" + str(nixbpe.getP()) + ")")
-				return (lambda x, y: 0)
+	def invalidAddressing(self, uOperand: int, sOperand: int):
+		logger.error("invalid combination of b and p bits (b=1, p=1)")
+		return 0
 
 	# 2 steps of dereferencing
-	def indirectAddressing(self, targetAddress: int) -> bytes:
-		singleDereference: int = bytes2int(self.getWord(targetAddress))
+	def indirectAddressing(self, targetAddress: int) -> int:
+		singleDereference: int = self.getUint24(targetAddress)
 		if singleDereference > Machine.maxAddress:
 			logger.error("value after single dereference is over 20 bits (" + hex(singleDereference) + ")")
-			return bytes(3)
-		return self.getWord(singleDereference)
+			return 0
+		return self.getUint24(singleDereference)
 
-	# 0 steps of dereferencing
-	def immediateAddressing(self, targetAddress: int) -> bytes:
-		try:
-			return int.to_bytes(targetAddress, byteorder="big", length=3, signed=False)
-		except OverflowError:
-			logger.error("targetAddress too big (" + hex(targetAddress) + ")")
-			return bytes(3)
+	# 0 steps of dereferencing (TA is already limited to 20 bits)
+	def immediateAddressing(self, targetAddress: int) -> int:
+		return targetAddress
 
 	# 1 step of dereferencing
-	def simpleAddressing(self, targetAddress: int) -> bytes:
-		return self.getWord(targetAddress)
-
-	# returns the function that will use the TA
-	def getFP(self, opcode: Opcode, nixbpe: Nixbpe) -> Callable[[int], bytes]:
-			
-		# store/jump instructions
-		if opcode in isicf3f4.opcodeStoreJump:
-			logger.info("store/jump instructions -> implicit level of indirection")
-			match nixbpe.getTuple():
-				case (1, 0, _, _, _, _):
-					logger.info("using simple addressing")
-					return self.simpleAddressing
-				case _:
-					logger.info("using immediate addressing")
-					return self.immediateAddressing
-
-		# other instructions
-		match nixbpe.getTuple():
-			case (1, 0, _, _, _, _):
-				logger.info("using indirect addressing")
-				return self.indirectAddressing
-			case (0, 1, _, _, _, _):
-				logger.info("using immediate addressing")
-				return self.immediateAddressing
-			case _:
-				logger.info("using simple addressing")
-				return self.simpleAddressing
-
-	def execSICF3F4(self, opcode: Opcode, nixbpe: Nixbpe, uOperand: int, sOperand: int):
-
-		# check if indexing with # or @ is used
-		match nixbpe.getTuple():
-			case (n, i, x, _, _, _) if x and n != i:
-				logger.error("indexing cannot be used with immediate or indirect addressing modes")
-				return
-			case _:
-				pass
-		
-		logger.debug("uOperand (" + hex(uOperand) + ")")
-		logger.debug("sOperand (" + hex(sOperand) + ")")
-
-		# get targetAddress
-		targetAddress: int = (self.getTA(nixbpe))(uOperand, sOperand)
+	def simpleAddressing(self, targetAddress: int) -> int:
+		return self.getUint24(targetAddress)
+
+	# TA of SIC/F3/F4 instruction (PC must already point to the next instruction)
+	def getTargetAddress(self, decoded: Decoded) -> int:
+		addressing: AddressingMode = decoded.addressing
+		uOperand, sOperand = decoded.operand
+		targetAddress: int = addressing.targetAddress(self, uOperand, sOperand)
 		# indexed addressing
-		if nixbpe.getX():
-			targetAddress += self.getX()
+		if addressing.indexed:
+			targetAddress += self.registers.X
 		# target address must be 20 bits since memory is addressed with 20 bits
-		targetAddress %= 0x100000
-		logger.debug("targetAddress (" + hex(targetAddress) + ")")
+		return targetAddress % 0x100000
 
-		# the parameter that will actually be used in instructions
-		finalizedParameter: bytes = (self.getFP(opcode, nixbpe))(targetAddress)
-		logger.debug("finalizedParameter: " + str(finalizedParameter))
+	def execSICF3F4(self, decoded: Decoded):
 
-		# get instruction from opcode
-		instruction: Callable[[Machine, Nixbpe, bytes], None]
-		try:
-			instruction = isicf3f4.opcode2instructionSICF3F4[opcode]
-		except KeyError:
-			logger.error("invalid op. code (" + str(opcode) + ")")
+		# check if indexing with # or @ is used
+		addressing: AddressingMode = decoded.addressing
+		if addressing.targetAddress is None:
+			logger.error("indexing cannot be used with immediate or indirect addressing modes")
 			return
-		logger.info("instruction: " + str(instruction))
 
-		# create disassebmly-like instruction string
-		self.addInstructionString(self.createInstructionString(nixbpe, opcode, uOperand))
+		# the parameter that will actually be used in instructions
+		finalizedParameter: int = addressing.finalize(self, self.getTargetAddress(decoded))
 
 		# execute the instruction
-		instruction(self, nixbpe, finalizedParameter)
+		decoded.handler(self, decoded.nixbpe, finalizedParameter)
 
-	def createInstructionString(self, nixbpe: Nixbpe, opcode: Opcode, operand: int):
-		
-		format: str = ""
-		match nixbpe.getTuple():
-			case (0, 0, _, _, _, _):
-				format = "SIC"
-			case (_, _, _, _, _, 1):
-				format = "F4"
+		# remember instruction for disassembly-like history (RD without input is executed again later)
+		if self.waitingDevice is None:
+			self.history.append(decoded)
+
+	# disassembly-like instruction string
+	@staticmethod
+	def createInstructionString(decoded: Decoded) -> str:
+		match decoded.format:
+			case "F1":
+				return "{:3s}: {:6s}".format("F1", decoded.opcode)
+			case "F2":
+				r1, r2 = decoded.operand
+				return "{:3s}: {:6s} r1={:1d} r2={:1d}".format("F2", decoded.opcode, r1, r2)
+			case "":
+				return "invalid opcode ({:02x})".format(decoded.operand[0])
 			case _:
-				format = "F3"
-
-		bpAddressing: str = ""
-		match nixbpe.getB(), nixbpe.getP():
-			case (1, 0):
-				bpAddressing = "B +"
-			case (0, 1):
-				bpAddressing = "PC +"
-			case (0, 0):
-				bpAddressing = "Abs:"
-		
-		niAddressing: str = ""
-		match nixbpe.getN(), nixbpe.getI():
-			case (1, 0):
-				niAddressing = "@Indirect"
-			case (0, 1):
-				niAddressing = "#Immediate"
-			case (1, 1):
-				niAddressing = " Simple"
-			case (0, 0):
-				niAddressing = " SIC"
-
-		xOffset: str = ""
-		if nixbpe.getX():
-			xOffset = ",X"
-
-		return "{:3s}: {:6s} {:s} {:06x}{:s}, {:s}".format(format, opcode, bpAddressing, operand, xOffset, niAddressing)
+				format, bpAddressing, niAddressing, xOffset = nixbpeStrings[decoded.nixbpe.getValue()]
+				return "{:3s}: {:6s} {:s} {:06x}{:s}, {:s}".format(format, decoded.opcode, bpAddressing, decoded.operand[0], xOffset, niAddressing)
 
 	def registers2str(self) -> str:
 		lineWidth: int = 30
@@ -626,7 +1133,7 @@ class Machine():
 		for i in range(rows):
 			addr = addrStart + i * rowWidth
 			s += "{:05x} ".format(addr)
-			s += " ".join([self.getByte(addr + i).hex() for i in range(rowWidth)])
+			s += self.mem[addr:addr+rowWidth].hex(" ")
 			s += "\n"
 
 		return s.upper()
@@ -668,6 +1175,103 @@ m.execute()
 
 	"""
 
+# first byte of instruction -> how to decode and execute it
+# built once at import time, invalid op. codes map to the fault entry
+def buildDispatchTable() -> list[DispatchEntry]:
+
+	fault: DispatchEntry = DispatchEntry(Machine.decodeInvalid, Machine.execInvalid, None, None, 0)
+	table: list[DispatchEntry] = [fault] * 256
+
+	for int1 in range(256):
+
+		# check if it is a valid op. code (ignore lowest 2 bits)
+		if not ((int1 & 0xFC) in setOpcodesInt):
+			continue
+		opcode: Opcode = Opcode(int1 & 0xFC)
+		# offset into addressingTable
+		addressingClass: int = 0x40 if opcode in isicf3f4.opcodeStoreJump or opcode in isicf3f4.opcodeFloatOperand else 0x00
+
+		if opcode in setOpcodesF1:
+			table[int1] = DispatchEntry(Machine.decodeF1, Machine.execF1, opcode, if1.opcode2instructionF1[opcode], 0)
+		elif opcode in setOpcodesF2:
+			table[int1] = DispatchEntry(Machine.decodeF2, Machine.execF2, opcode, if2.opcode2instructionF2[opcode], 0)
+		elif int1 % 4 == 0:
+			table[int1] = DispatchEntry(Machine.decodeSIC, Machine.execSICF3F4, opcode, isicf3f4.opcode2instructionSICF3F4[opcode], addressingClass)
+		else:
+			table[int1] = DispatchEntry(Machine.decodeF3F4, Machine.execSICF3F4, opcode, isicf3f4.opcode2instructionSICF3F4[opcode], addressingClass)
+
+	return table
+
+dispatchTable: list[DispatchEntry] = buildDispatchTable()
+
+# instructions that make Machine.run stop with StopReason.DEVICE
+opcodesDevice: set[Opcode] = {Opcode.RD, Opcode.WD}
+
+# addressing mode of SIC/F3/F4 instructions, indexed by (opcode class << 6) | nixbpe
+# opcode class: 0 for most instructions, 1 for instructions that take an address (store/jump/float)
+def buildAddressingTable() -> list[AddressingMode]:
+
+	table: list[AddressingMode] = []
+
+	for opcodeClass in range(2):
+		for bits in range(64):
+			n, i, x, b, p, e = Nixbpe(bits).getTuple()
+
+			# indexing cannot be used with # or @
+			if x and n != i:
+				table.append(AddressingMode(None, False, None))
+				continue
+
+			# function that will calculate the TA
+			targetAddress: Callable[[Machine, int, int], int]
+			match (n, i, b, p):
+				case (0, 0, _, _):			# legacy SIC
+					targetAddress = Machine.directAddressing
+				case (_, _, 1, 0):			# base-relative
+					targetAddress = Machine.baseRelative
+				case (_, _, 0, 1):			# PC-relative
+					targetAddress = Machine.PCRelative
+				case (_, _, 0, 0):			# direct
+					targetAddress = Machine.directAddressing
+				case _:
+					targetAddress = Machine.invalidAddressing
+
+			# function that will use the TA
+			# store/jump instructions -> implicit level of indirection
+			finalize: Callable[[Machine, int], int]
+			match (opcodeClass, n, i):
+				case (1, 1, 0):
+					finalize = Machine.simpleAddressing
+				case (1, _, _) | (0, 0, 1):
+					finalize = Machine.immediateAddressing
+				case (0, 1, 0):
+					finalize = Machine.indirectAddressing
+				case _:
+					finalize = Machine.simpleAddressing
+
+			table.append(AddressingMode(targetAddress, bool(x), finalize))
+
+	return table
+
+addressingTable: list[AddressingMode] = buildAddressingTable()
+
+# disassembly strings (format, b/p addressing, n/i addressing, indexing), indexed by nixbpe
+def buildNixbpeStrings() -> list[tuple[str, str, str, str]]:
+
+	table: list[tuple[str, str, str, str]] = []
+
+	for bits in range(64):
+		n, i, x, b, p, e = Nixbpe(bits).getTuple()
+		format: str = "SIC" if (n, i) == (0, 0) else ("F4" if e else "F3")
+		bpAddressing: str = {(1, 0): "B +", (0, 1): "PC +", (0, 0): "Abs:"}.get((b, p), "")
+		niAddressing: str = {(1, 0): "@Indirect", (0, 1): "#Immediate", (1, 1): " Simple", (0, 0): " SIC"}[(n, i)]
+		xOffset: str = ",X" if x else ""
+		table.append((format, bpAddressing, niAddressing, xOffset))
+
+	return table
+
+nixbpeStrings: list[tuple[str, str, str, str]] = buildNixbpeStrings()
+
 """
 
 m = Machine()
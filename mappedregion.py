@@ -0,0 +1,85 @@
+import mmap
+import os
+
+import logging
+logger = logging.getLogger(__name__)
+
+# host file mapped (through mmap) into guest memory [start, start+size)
+# guest memory stays a single bytearray (accessors and translated code index it directly),
+# so the window is loaded from the map and changed pages are written back to it on sync (see Machine.syncMapped)
+# pages are the 4 KiB pages of guest memory (the same as Machine.dirtyPages)
+class MappedRegion():
+
+	# granularity of writing back changes
+	pageSize: int = 4096
+
+	fileName: str
+	start: int
+	size: int
+	writable: bool
+	map: mmap.mmap
+
+	# size None = size of the file, a writable file is extended to size if it is shorter
+	# raises OSError if the file can't be mapped, ValueError if it is empty
+	def __init__(self, fileName: str, start: int, size: int|None = None, writable: bool = True):
+		self.fileName = fileName
+		self.start = start
+		self.writable = writable
+		with open(fileName, "r+b" if writable else "rb") as file:
+			fileSize: int = os.fstat(file.fileno()).st_size
+			if size is None:
+				size = fileSize
+			if size <= 0:
+				raise ValueError("nothing to map (" + fileName + " is empty)")
+			if fileSize < size:
+				if not writable:
+					raise ValueError("file is shorter than the window (" + fileName + ")")
+				file.truncate(size)
+			self.map = mmap.mmap(file.fileno(), size, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+		self.size = size
+
+	def getFileName(self) -> str:
+		return self.fileName
+	def getStart(self) -> int:
+		return self.start
+	def getSize(self) -> int:
+		return self.size
+	def getEnd(self) -> int:
+		return self.start + self.size
+	def isWritable(self) -> bool:
+		return self.writable
+
+	def overlaps(self, start: int, end: int) -> bool:
+		return start < self.start + self.size and self.start < end
+
+	# copy contents of the file into memory
+	def load(self, mem: bytearray):
+		mem[self.start:self.start+self.size] = self.map
+
+	# write pages changed by the guest back to the file, returns number of written bytes
+	# pages: numbers of memory pages that may have changed (None = all pages of the window)
+	def sync(self, mem: bytearray, pages: list[int]|None = None) -> int:
+		if not self.writable:
+			return 0
+		if pages is None:
+			pages = list(range(self.start // MappedRegion.pageSize, (self.start + self.size - 1) // MappedRegion.pageSize + 1))
+		written: int = 0
+		window: memoryview = memoryview(mem)[self.start:self.start+self.size]
+		try:
+			for page in pages:
+				# part of the memory page inside the window (as offsets into the file)
+				low: int = max(page * MappedRegion.pageSize - self.start, 0)
+				high: int = min((page + 1) * MappedRegion.pageSize - self.start, self.size)
+				if low < high and self.map[low:high] != window[low:high]:
+					self.map[low:high] = window[low:high]
+					written += high - low
+		finally:
+			window.release()
+		if written:
+			self.map.flush()
+			logger.debug("synced " + str(written) + " bytes of " + self.fileName)
+		return written
+
+	# unmap the file (without writing back changes, see sync)
+	def close(self):
+		self.map.close()
@@ -73,6 +73,25 @@ def float2bytes(val: float) -> list[bytes]:
 	
 	return byteList
 
+# ieee754 float48 as 48-bit int to python float type (same as bytes2float)
+def int2float(val: int) -> float:
+	if val == 0:
+		return 0
+	sign: int = -1 if val & 0x800000000000 else 1
+	exponent: int = (val >> 36) & 0x7FF
+	fraction: float = 1.0 + (val & 0xFFFFFFFFF) / float(1 << 36)
+	return (sign * fraction * float(2 ** (exponent - 1024)))
+
+# python float to ieee754 float48 as 48-bit int (same as float2bytes)
+def float2int(val: float) -> int:
+	if val == 0.0:
+		return 0
+	sign: int = 0x800000000000 if val < 0 else 0
+	val = -val if sign else val
+	exponent: int = floor(log2(val)) + 1024
+	fraction: float = (val / float(2 ** (exponent - 1024)) - 1.0) * float(1 << 36)
+	return sign | (exponent << 36) | int(fraction)
+
 # convert uint(length*8) to signed int
 def uns2sgn(val: int, length: int) -> int:
 	return int.from_bytes(bytes=int2bytes(val, length=length), byteorder="big", signed=True)
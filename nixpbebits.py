@@ -1,36 +1,58 @@
 class Nixbpe():
 
-	# list holding the actual values
-	bits: tuple[int, ...] = tuple([0] * 6)
+	# masks of the single bits
+	N: int = 0x20
+	I: int = 0x10
+	X: int = 0x08
+	B: int = 0x04
+	P: int = 0x02
+	E: int = 0x01
+
+	# the actual value (bits n, i, x, b, p, e from MSb to LSb)
+	bits: int = 0
+
+	def __init__(self, bits: int = 0):
+		self.bits = bits
+
+	# 6-bit value, used as index into lookup tables
+	def getValue(self) -> int:
+		return self.bits
 
 	# use for pattern matching and such
 	def getTuple(self) -> tuple[int, ...]:
-		return self.bits
+		bits: int = self.bits
+		return ((bits >> 5) & 1, (bits >> 4) & 1, (bits >> 3) & 1, (bits >> 2) & 1, (bits >> 1) & 1, bits & 1)
+
+	# n = 0, i = 1
+	def isImmediate(self) -> bool:
+		return (self.bits & (Nixbpe.N | Nixbpe.I)) == Nixbpe.I
 
 	# getters
 	def getN(self) -> int:
-		return self.bits[0]
+		return (self.bits >> 5) & 1
 	def getI(self) -> int:
-		return self.bits[1]
+		return (self.bits >> 4) & 1
 	def getX(self) -> int:
-		return self.bits[2]
+		return (self.bits >> 3) & 1
 	def getB(self) -> int:
-		return self.bits[3]
+		return (self.bits >> 2) & 1
 	def getP(self) -> int:
-		return self.bits[4]
+		return (self.bits >> 1) & 1
 	def getE(self) -> int:
-		return self.bits[5]
+		return self.bits & 1
 
 	# setters
+	def setBit(self, mask: int, val: int):
+		self.bits = (self.bits | mask) if val else (self.bits & ~mask)
 	def setN(self, val: int):
-		self.bits = self.bits[:0] + (val,) + self.bits[1:]
+		self.setBit(Nixbpe.N, val)
 	def setI(self, val: int):
-		self.bits = self.bits[:1] + (val,) + self.bits[2:]
+		self.setBit(Nixbpe.I, val)
 	def setX(self, val: int):
-		self.bits = self.bits[:2] + (val,) + self.bits[3:]
+		self.setBit(Nixbpe.X, val)
 	def setB(self, val: int):
-		self.bits = self.bits[:3] + (val,) + self.bits[4:]
+		self.setBit(Nixbpe.B, val)
 	def setP(self, val: int):
-		self.bits = self.bits[:4] + (val,) + self.bits[5:]
+		self.setBit(Nixbpe.P, val)
 	def setE(self, val: int):
-		self.bits = self.bits[:5] + (val,) + self.bits[6:]
+		self.setBit(Nixbpe.E, val)
@@ -67,4 +67,13 @@ setOpcodesInt:	set[int]	= set([x.value for x in Opcode])
 setOpcodesF1:	set[Opcode]	= {Opcode.FIX, Opcode.FLOAT, Opcode.HIO, Opcode.NORM, Opcode.SIO, Opcode.TIO}
 setOpcodesF2:	set[Opcode]	= {Opcode.ADDR, Opcode.CLEAR, Opcode.COMPR, Opcode.DIVR, Opcode.MULR, Opcode.RMO, Opcode.SHIFTL, Opcode.SHIFTR, Opcode.SUBR, Opcode.SVC, Opcode.TIXR}
 setOpcodesSIC:	set[Opcode]	= {Opcode.ADD, Opcode.AND, Opcode.COMP, Opcode.DIV, Opcode.J, Opcode.JEQ, Opcode.JGT, Opcode.JLT, Opcode.JSUB, Opcode.LDA, Opcode.LDCH, Opcode.LDL, Opcode.LDS, Opcode.LDT, Opcode.LDX, Opcode.MUL, Opcode.OR, Opcode.RD, Opcode.RSUB, Opcode.STA, Opcode.STCH, Opcode.STL, Opcode.STSW, Opcode.STX, Opcode.SUB, Opcode.TD, Opcode.TIX, Opcode.WD}
-setOpcodesF3F4:	set[Opcode]	= {Opcode.ADDF, Opcode.COMPF, Opcode.DIVF, Opcode.LDB, Opcode.LDF, Opcode.LPS, Opcode.MULF, Opcode.SSK, Opcode.STB, Opcode.STF, Opcode.STI, Opcode.STS, Opcode.STT, Opcode.SUBF}
\ No newline at end of file
+setOpcodesF3F4:	set[Opcode]	= {Opcode.ADDF, Opcode.COMPF, Opcode.DIVF, Opcode.LDB, Opcode.LDF, Opcode.LPS, Opcode.MULF, Opcode.SSK, Opcode.STB, Opcode.STF, Opcode.STI, Opcode.STS, Opcode.STT, Opcode.SUBF}
+# adjacent instructions that are executed as one superinstruction (first, second)
+setOpcodesFused:	set[tuple[Opcode, Opcode]]	= {
+	(Opcode.TIX, Opcode.JLT), (Opcode.TIXR, Opcode.JLT),
+	(Opcode.COMP, Opcode.JEQ), (Opcode.COMP, Opcode.JGT), (Opcode.COMP, Opcode.JLT),
+	(Opcode.COMPR, Opcode.JEQ), (Opcode.COMPR, Opcode.JGT), (Opcode.COMPR, Opcode.JLT),
+	(Opcode.LDCH, Opcode.STCH),
+	(Opcode.TD, Opcode.JEQ)
+}
+setOpcodesFusedFirst:	set[Opcode]	= {first for first, second in setOpcodesFused}
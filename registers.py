@@ -0,0 +1,31 @@
+# register file: 24-bit registers are kept as masked ints, F as python float
+# slots make attribute access cheap (used directly by instruction handlers and translated blocks)
+class Registers():
+
+	__slots__ = ("A", "X", "L", "B", "S", "T", "R6", "R7", "PC", "SW", "F")
+
+	# register index (as used by F2 instructions) -> slot
+	# 6 and 7 are placeholders, F is accessed via getF/setF
+	names: tuple[str, ...] = ("A", "X", "L", "B", "S", "T", "R6", "R7", "PC", "SW")
+
+	# all 24-bit registers are masked with this
+	mask: int = 0xFFFFFF
+
+	def __init__(self):
+		self.A = 0
+		self.X = 0
+		self.L = 0
+		self.B = 0
+		self.S = 0
+		self.T = 0
+		self.R6 = 0
+		self.R7 = 0
+		self.PC = 0
+		self.SW = 0
+		self.F = 0.0
+
+	# access via index (value is not checked)
+	def get(self, reg: int) -> int:
+		return getattr(self, Registers.names[reg])
+	def set(self, reg: int, val: int):
+		setattr(self, Registers.names[reg], val)
@@ -1,8 +1,17 @@
-from typing import TextIO
+from typing import TextIO, Collection
 from sys import argv
+import asyncio
 import time
 
 from machine import Machine
+from stopreason import StopReason
+from breakpoints import Breakpoints
+from throttle import Throttle
+from limits import Limits
+from flushpolicy import FlushPolicy
+from timermode import TimerMode
+from device import Device, FileDevice
+from streamdevice import StreamInputDevice, SocketDevice, FifoInputDevice, FifoOutputDevice
 from loader import loadObj
 from misc import freq2clockPeriod
 from ui import Ui
@@ -17,6 +26,12 @@ printMemAddr: int = 0
 printMemRows: int = 10
 # is tui paused
 paused: bool = False
+# instructions executed per Machine.run call (gui without clock limit)
+guiBatchSteps: int = 1000
+# longest time the gui waits for input of a device before updating the UI [s]
+guiWaitTimeout: float = 0.05
+# devices fed by the event loop (gui and async headless runs) by number, kept when the machine is reset
+streamDevices: dict[int, Device] = {}
 
 # key release handler for tui app
 def tuiReleaseKey(key):
@@ -33,6 +48,8 @@ def tuiReleaseKey(key):
 				printMemAddr += 16
 		case keyboard.Key.enter:								# type: ignore
 			paused = not paused
+			if not paused:
+				m.rescanDevices()
 		case keyboard.Key.space:								# type: ignore
 			pausedBefore: bool = paused
 			paused = False
@@ -50,50 +67,107 @@ def runOld(m: Machine, breakpoints: list[int]):
 	listener = keyboard.Listener(on_release=tuiReleaseKey)
 	listener.start()
 
-	dt: float = time.time()
+	throttle.setClockPeriod(m.getClockPeriod())
 
-	if not step(m):			# must do at least single step
+	if not stepTimed(m):	# must do at least single step
 		return
 
-	# check timer and wait for clock period to finish
-	dt = time.time() - dt
-	if m.getClockPeriod() - dt > 0:
-		time.sleep(m.getClockPeriod() - dt)
+	while (m.getPC() not in breakpoints) and stepTimed(m, breakpoints):
+		pass
+
+# run machine m until it halts or reaches one of the limits
+# headless version: no output and no clock limit, so instructions are executed in large batches
+def runHeadless(m: Machine, limits: Limits) -> StopReason:
+	reason, executed = m.runLimited(limits, jit)
+	logStop(reason, executed)
+	return reason
+
+# same as runHeadless, but standard input (and socket/fifo devices) are fed by the event loop
+# and the machine waits for them without blocking
+async def runHeadlessAsync(m: Machine, limits: Limits) -> StopReason:
+	await openStreamDevices(m)
+	try:
+		reason, executed = await m.runAsync(limits, jit)
+	finally:
+		closeStreamDevices()
+	logStop(reason, executed)
+	return reason
+
+# create standard input and devices given by device=... arguments (they need a running event loop)
+async def openStreamDevices(m: Machine):
+	streamDevices[0] = StreamInputDevice.stdin()
+	for num, kind, path in deviceSpecs:
+		device: SocketDevice|FifoInputDevice|FifoOutputDevice
+		try:
+			match kind:
+				case "unix":
+					device = SocketDevice(path)
+					await device.open()
+				case "fifoin":
+					device = FifoInputDevice(path)
+					await device.open()
+				case _:
+					device = FifoOutputDevice(path)
+		except OSError as error:
+			logger.error("device {:02X} can't be opened ({:s})".format(num, str(error)))
+			continue
+		streamDevices[num] = device
+	setStreamDevices(m)
+
+def setStreamDevices(m: Machine):
+	for num, device in streamDevices.items():
+		m.setDevice(num, device)
+
+def closeStreamDevices():
+	for device in streamDevices.values():
+		if isinstance(device, (SocketDevice, FifoInputDevice, FifoOutputDevice)):
+			device.close()
+
+def logStop(reason: StopReason, executed: int):
+	message: str = "run stopped ({:s}) after {:d} instructions".format(reason.name, executed)
+	if reason == StopReason.HALT:
+		logger.info(message)
+	else:
+		logger.warning(message)
 
-	dt = time.time()
-	while (m.getPC() not in breakpoints) and step(m):
-		# check timer and wait for clock period to finish
-		dt = time.time() - dt
-		if m.getClockPeriod() - dt > 0:
-			time.sleep(m.getClockPeriod() - dt)
-		dt = time.time()
+# let the event loop feed devices while the machine waits for input (UI is updated at least every guiWaitTimeout)
+async def waitForInput(m: Machine):
+	m.flushDevices()
+	try:
+		await asyncio.wait_for(m.getWaitingDevice().wait(), guiWaitTimeout)
+	except asyncio.TimeoutError:
+		pass
 
 # run machine m with breakpoints
-def run(m: Machine, ui: Ui, fileName: str):
+# runs in an event loop, so input of the guest doesn't freeze the UI
+async def run(m: Machine, ui: Ui, fileName: str):
+
+	await openStreamDevices(m)
 
 	objFileName: str = fileName
-	inBreakpoint: bool = False
+	# simulation was stopped by breakpoint at PC (its condition is already evaluated)
+	atBreakpoint: bool = False
+	# simulation was running in the previous iteration (output is flushed when it stops)
+	wasRunning: bool = False
 
 	while True:
 
 		# check for reset
 		if ui.getSimReset():
 			# reset machine
+			release(m)
 			m = Machine()
 			reset(m, objFileName, ui)
+			atBreakpoint = False
 
-		if m.getPC() in ui.getBreakpointsList():
+		# missing device files may have been created while the simulation was stopped
+		if (ui.getSimRunning() and not wasRunning) or ui.getStepFlag():
+			m.rescanDevices()
 
-			if ui.getSimRunning():
-				if inBreakpoint:
-					# reset to normal running state and make single step
-					ui.startStopUpdate(True)
-					inBreakpoint = False
-					stepTimed(m)
-					continue
-				else:
-					ui.startStopUpdate(False)
-					inBreakpoint = True
+		# simulation was restarted at breakpoint -> make single step to get past it
+		if atBreakpoint and ui.getSimRunning():
+			atBreakpoint = False
+			stepTimed(m)
 
 		if ui.getFrequency() >= 0:
 			m.setClockPeriod(freq2clockPeriod(ui.getFrequency(), clockPeriod))
@@ -102,23 +176,62 @@ def run(m: Machine, ui: Ui, fileName: str):
 		# single step
 		if ui.getStepFlag() and m.getIsRunning():
 			stepTimed(m)
+			m.flushDevices()
 			ui.setStepFlag(False)
+			atBreakpoint = False
 
 		# running simulation
 		elif ui.getSimRunning():
-			# check if PC is in breakpoints
-			if not (m.getPC() in ui.getBreakpointsList()):
-				if m.getIsRunning():
-					stepTimed(m)
+			breakpoints: Breakpoints = ui.getBreakpoints()
+			# started with PC at a breakpoint (e.g. one that was just set): stop there, next start gets past it
+			if not wasRunning and not atBreakpoint and m.getPC() in breakpoints and breakpoints.triggered(m.registers):
+				atBreakpoint = True
+				ui.startStopUpdate(False)
+			elif m.getIsRunning():
+				# run a burst (or without clock limit a batch) of instructions between UI updates
+				if m.getClockPeriod() > 0:
+					reason, executed = m.run(throttle.getBurstSize(), breakpoints, jit)
+					if throttleWait(m, executed):
+						ui.updateFrequencyHelp(throttle.getFrequency(), throttle.getTargetFrequency())
+				else:
+					reason, executed = m.run(guiBatchSteps, breakpoints, jit)
+				atBreakpoint = (reason == StopReason.BREAKPOINT)
+				# stop at breakpoint
+				if atBreakpoint:
+					ui.startStopUpdate(False)
+				# no input yet
+				elif reason == StopReason.WAIT:
+					await waitForInput(m)
 		else:
+			# stopped by user
+			if wasRunning:
+				m.flushDevices()
 			# check if user selected new obj file
 			if len(ui.getObjFile()) > 0:
+				release(m)
 				m = Machine()
 				objFileName = ui.getObjFile()
 				reset(m, ui.getObjFile(), ui)
+				atBreakpoint = False
+
+		wasRunning = ui.getSimRunning()
 
 		# update UI
 		ui.updateAll(m)
+		# let the event loop feed devices
+		await asyncio.sleep(0)
+
+def mapFiles(m: Machine):
+	for fileName, start, size in mappings:
+		m.mapFile(fileName, start, size)
+
+# machine m is replaced by a new one: write out its output and changes of mapped files, then unmap them
+# (stream devices are kept, the new machine gets them in reset)
+def release(m: Machine):
+	m.flushDevices()
+	m.syncMapped()
+	for region in list(m.getMappedRegions()):
+		m.unmapFile(region)
 
 def reset(m: Machine, objFileName: str, ui: Ui):
 	# open obj file
@@ -129,16 +242,25 @@ def reset(m: Machine, objFileName: str, ui: Ui):
 	objFile.close()
 	# set initial PC
 	m.setPC(m.getProgStart())
+	# new machine gets the same flush policy, standard input and stream devices, random bytes, time source and mapped files
+	if flushPolicy is not None:
+		m.setFlushPolicy(flushPolicy)
+	setStreamDevices(m)
+	mapFiles(m)
+	if rngSeed is not None:
+		m.setRngSeed(rngSeed)
+	m.setTimerMode(timerMode)
 	# reset UI flags
 	ui.setSimReset(False)
 	ui.startStopUpdate(False)
 	ui.setStepFlag(False)
 	ui.setObjFile("")
 
-def step(m: Machine) -> bool:
+# single instruction, or a whole translated block if breakpoints are given (jit)
+def step(m: Machine, breakpoints: Collection[int]|None = None) -> bool:
 
 	# use variables declared outside this function
-	global printMemRows, printMemAddr, tui, paused
+	global printMemRows, printMemAddr, tui, paused, jit, trace
 
 	if tui:
 		print(m.registers2str())
@@ -149,33 +271,46 @@ def step(m: Machine) -> bool:
 		time.sleep(m.getClockPeriod())
 		return True
 
-	# note PC and run single step/instruction
-	PCBefore: int = m.getPC()
-	m.execute()
-	logger.debug("\n")
-	logger.debug(m)
+	# run single step/instruction and note its PC
+	# (for blocks and superinstructions: PC of the last executed instruction)
+	PCBefore: int
+	if jit and breakpoints is not None:
+		PCBefore = m.executeBlock(breakpoints)
+	elif trace:
+		PCBefore = m.executeTraced()
+		logger.debug("\n")
+		logger.debug(m)
+	else:
+		PCBefore = m.execute()
 
 	# check if PC has changed
 	PCAfter: int = m.getPC()
 	if PCBefore == PCAfter:
 		logger.info("infinite loop -> halt")
 		m.setIsRunning(False)
+		m.flushDevices()
 		return False
 	else:
 		return True
 
-def stepTimed(m: Machine) -> bool:
-	# start timer
-	dt = time.time()
+def stepTimed(m: Machine, breakpoints: Collection[int]|None = None) -> bool:
 	# do a step
-	halt: bool = step(m)
-	# wait for clock period to finish
-	dt = time.time() - dt
-	dt = m.getClockPeriod() - dt
-	if dt > 0:
-		time.sleep(dt)
+	halt: bool = step(m, breakpoints)
+	# wait for clock period(s) to finish
+	executed: int = m.translator.lastCount if jit and breakpoints is not None else 1
+	throttleWait(m, executed)
 	return halt
 
+# wait until executed instructions are due at machine's clock frequency
+# returns True if a new achieved frequency was measured
+def throttleWait(m: Machine, executed: int) -> bool:
+	if throttle.getClockPeriod() != m.getClockPeriod():
+		throttle.setClockPeriod(m.getClockPeriod())
+	if not throttle.wait(executed):
+		return False
+	logger.info("frequency: {:.0f} Hz (target {:.0f} Hz)".format(throttle.getFrequency(), throttle.getTargetFrequency()))
+	return True
+
 # set simulation/machine frequency
 freq: int = 0
 clockPeriod: float = freq2clockPeriod(freq, 0)
@@ -183,6 +318,8 @@ clockPeriod: float = freq2clockPeriod(freq, 0)
 # create an instance ot the machine
 m: Machine = Machine()
 m.setClockPeriod(clockPeriod)
+# keeps the machine at its clock frequency
+throttle: Throttle = Throttle(clockPeriod)
 
 # initialize UI
 ui: Ui = Ui()
@@ -190,10 +327,72 @@ ui: Ui = Ui()
 # parse arguments
 tui: bool = False
 zeroOutput: bool = False
+jit: bool = False
+trace: bool = False
+# headless run in an event loop (see runHeadlessAsync)
+asynchronous: bool = False
+# limits of headless runs
+limits: Limits = Limits()
+# buffering of device output (None = default policy of each device)
+flushPolicy: FlushPolicy|None = None
+# seed of stdrng (None = different bytes in every run)
+rngSeed: int|None = None
+# time source of stdtimer
+timerMode: TimerMode = TimerMode.HOST
+# socket and fifo devices (number, kind, path)
+deviceSpecs: list[tuple[int, str, str]] = []
+# host files mapped into memory after loading the program (file name, start, size)
+mappings: list[tuple[str, int, int|None]] = []
 
 if len(argv) > 2:
 	tui = (argv[2] == "tui")
 	zeroOutput = (argv[2] == "none")
+for arg in argv[3:]:
+	name, _, value = arg.partition("=")
+	match name:
+		case "jit":
+			jit = True
+		case "async":
+			asynchronous = True
+		case "trace":
+			trace = True
+			logger.setLevel(logging.DEBUG)
+		case "budget":
+			limits.setMaxInstructions(int(value))
+		case "timeout":
+			limits.setTimeout(float(value))
+		case "loops":
+			limits.setLoopCheckInterval(int(value) if value else 1000000)
+		case "flush":
+			flushPolicy = FlushPolicy[value.upper()]
+			m.setFlushPolicy(flushPolicy)
+		case "seed":
+			rngSeed = int(value, 0)
+			m.setRngSeed(rngSeed)
+		case "timer":
+			timerMode = TimerMode[value.upper()]
+			m.setTimerMode(timerMode)
+		case "map":
+			# map=file@address[:size]
+			fileName, _, window = value.rpartition("@")
+			start, _, size = window.partition(":")
+			mappings.append((fileName, int(start, 0), int(size, 0) if size else None))
+		case "device":
+			# device=XX:unix|fifoin|fifoout:path
+			num, _, rest = value.partition(":")
+			kind, _, path = rest.partition(":")
+			try:
+				deviceId: int = int(num, 16)
+			except ValueError:
+				deviceId = -1
+			if not (0 <= deviceId <= 0xFF) or kind not in ("unix", "fifoin", "fifoout") or not path:
+				logger.warning("invalid device (" + value + "), use device=XX:unix|fifoin|fifoout:path with XX from 00 to FF")
+			else:
+				deviceSpecs.append((deviceId, kind, path))
+		case "rescan":
+			FileDevice.retryInterval = None if value == "never" else float(value)
+		case _:
+			logger.warning("unknown argument (" + arg + ")")
 
 if len(argv) > 1:
 	# open obj file
@@ -204,12 +403,26 @@ if len(argv) > 1:
 	objFile.close()
 	# set initial PC
 	m.setPC(m.getProgStart())
+	mapFiles(m)
 	if tui:
+		if deviceSpecs:
+			logger.warning("socket and fifo devices need the gui or none mode")
 		paused = False
 		runOld(m, [])
 	elif zeroOutput:
-		runOld(m, [])
+		# nobody is stepping through the program -> superinstructions are safe
+		m.setFusion(True)
+		# nobody reads the instructions history
+		m.setHistorySize(0)
+		if trace:
+			runOld(m, [])
+		elif asynchronous or deviceSpecs:
+			asyncio.run(runHeadlessAsync(m, limits))
+		else:
+			runHeadless(m, limits)
+		logger.info("superinstructions executed: " + str(m.getFusionCount()))
+		logger.info("counters: " + str(m.getCounters()))
 	else:
-		run(m, ui, argv[1])
+		asyncio.run(run(m, ui, argv[1]))
 else:
-	run(m, ui, "")
+	asyncio.run(run(m, ui, ""))
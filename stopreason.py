@@ -0,0 +1,12 @@
+# enum for reasons why Machine.run returned
+from enum import Enum
+class StopReason(Enum):
+	STEPS = 0			# maximum number of instructions executed
+	HALT = 1			# instruction jumped to itself (infinite loop)
+	BREAKPOINT = 2		# PC reached a breakpoint
+	DEVICE = 3			# RD or WD instruction was executed
+	WATCHPOINT = 4		# memory access hit a watchpoint (see Machine.getWatchHit)
+	BUDGET = 5			# instruction budget of the run exhausted (see Machine.runLimited)
+	TIMEOUT = 6			# wall time of the run exhausted
+	LOOP = 7			# machine came back to an earlier state (infinite loop)
+	WAIT = 8			# device has no input yet (see Machine.getWaitingDevice and Machine.runAsync)
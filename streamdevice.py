@@ -0,0 +1,330 @@
+import asyncio
+import errno
+import os
+import socket
+import stat
+import sys
+import threading
+from typing import BinaryIO
+
+from device import Device
+from flushpolicy import FlushPolicy
+from bufferedinput import singleBytes
+
+import logging
+logger = logging.getLogger(__name__)
+
+# input device fed by the asyncio event loop, RD and TD never block the machine
+# data comes from a StreamReader (attach) or from a blocking file descriptor read by a helper thread (attachFd)
+# TD reports readiness from buffered data, RD without data makes run stop with StopReason.WAIT,
+# so the RD is executed again when the device is ready (see Machine.runAsync)
+class StreamInputDevice(Device):
+
+	# bytes requested from the reader at once
+	chunkSize: int = 65536
+	# consumed bytes are dropped from the buffer when there are at least this many of them
+	compactSize: int = 65536
+
+	asynchronous: bool = True
+
+	buffer: bytearray
+	position: int					# next byte in buffer
+	eof: bool						# reader has no more data, RD reads zeros after the buffer
+	readyEvent: asyncio.Event		# set when data or end of input arrives
+	task: asyncio.Task|None			# task that feeds the device from a StreamReader
+
+	def __init__(self, interactive: bool = False):
+		self.buffer = bytearray()
+		self.position = 0
+		self.eof = False
+		self.readyEvent = asyncio.Event()
+		self.task = None
+		self.interactive = interactive
+
+	# connect standard input (read by a helper thread, so it stays blocking for other users of the terminal)
+	@staticmethod
+	def stdin() -> "StreamInputDevice":
+		device: StreamInputDevice = StreamInputDevice(interactive=True)
+		device.attachFd(sys.stdin.fileno())
+		return device
+
+	# feed the device from reader (must be called from a running event loop)
+	def attach(self, reader: asyncio.StreamReader) -> asyncio.Task:
+		self.task = asyncio.get_running_loop().create_task(self.pump(reader))
+		return self.task
+
+	# eof: end of reader is the end of input (not with more readers, see SocketDevice)
+	async def pump(self, reader: asyncio.StreamReader, eof: bool = True):
+		try:
+			while True:
+				chunk: bytes = await reader.read(StreamInputDevice.chunkSize)
+				if len(chunk) == 0:
+					break
+				self.feed(chunk)
+		except (OSError, asyncio.IncompleteReadError) as error:
+			logger.error("input of device failed (" + str(error) + ")")
+		if eof:
+			self.feedEof()
+
+	# feed the device from a blocking file descriptor (must be called from a running event loop)
+	# the thread is a daemon, so a read waiting for the user doesn't keep the program alive
+	# (it reads the descriptor directly, a buffered file would stay locked at exit)
+	def attachFd(self, fd: int):
+		loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+		def pumpFd():
+			try:
+				while True:
+					chunk: bytes = os.read(fd, StreamInputDevice.chunkSize)
+					if len(chunk) == 0:
+						break
+					loop.call_soon_threadsafe(self.feed, chunk)
+			except OSError as error:
+				logger.error("input of device failed (" + str(error) + ")")
+			try:
+				loop.call_soon_threadsafe(self.feedEof)
+			except RuntimeError:
+				pass		# event loop is already closed
+		threading.Thread(target=pumpFd, name="device input", daemon=True).start()
+
+	def feed(self, data: bytes):
+		if self.position >= StreamInputDevice.compactSize:
+			del self.buffer[:self.position]
+			self.position = 0
+		self.buffer += data
+		self.readyEvent.set()
+	def feedEof(self):
+		self.eof = True
+		self.readyEvent.set()
+
+	# number of buffered bytes
+	def getPending(self) -> int:
+		return len(self.buffer) - self.position
+	def isEof(self) -> bool:
+		return self.eof
+
+	def test(self) -> bool:
+		return self.position < len(self.buffer) or self.eof
+	def wouldBlock(self) -> bool:
+		return not self.test()
+	# readiness changes only while the event loop runs, so there is nothing to wait for here
+	def waitReady(self, timeout: float) -> bool:
+		return self.test()
+	# wait until the device is ready (without blocking the event loop)
+	async def wait(self):
+		while not self.test():
+			self.readyEvent.clear()
+			await self.readyEvent.wait()
+
+	# None if there is no data yet, b"" at the end of input
+	def read(self) -> bytes|None:
+		position: int = self.position
+		if position < len(self.buffer):
+			self.position = position + 1
+			return singleBytes[self.buffer[position]]
+		return b"" if self.eof else None
+	def readn(self, num: int) -> bytes|None:
+		if not self.test():
+			return None
+		position: int = self.position
+		val: bytes = bytes(self.buffer[position:position+num])
+		self.position = position + len(val)
+		return val
+
+# device bound to a local Unix socket, external programs connect to it to stream data in and out
+# RD/TD read data of all connected clients in order of arrival (input never ends, clients can come and go),
+# WD sends to all connected clients (output written before the first client connects is kept for it, up to maxOutput bytes)
+class SocketDevice(StreamInputDevice):
+
+	# bytes of output kept for clients, older bytes are dropped (also for a client that doesn't read)
+	maxOutput: int = 1 << 20
+
+	flushPolicy: FlushPolicy = FlushPolicy.LINE
+
+	path: str
+	server: asyncio.AbstractServer|None
+	writers: list[asyncio.StreamWriter]
+	output: bytearray				# written bytes not sent yet
+	dropped: int					# bytes dropped since output was last sent
+
+	def __init__(self, path: str):
+		super().__init__()
+		self.path = path
+		self.server = None
+		self.writers = []
+		self.output = bytearray()
+		self.dropped = 0
+
+	def getPath(self) -> str:
+		return self.path
+
+	# start listening (must be called from a running event loop), raises OSError if the socket can't be created
+	async def open(self):
+		# socket left behind by an earlier run (other files and sockets that are in use stay, listening fails on them)
+		if SocketDevice.isStale(self.path):
+			os.unlink(self.path)
+		# bound here, start_unix_server would replace any socket at path
+		listener: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			listener.bind(self.path)
+		except OSError:
+			listener.close()
+			raise
+		self.server = await asyncio.start_unix_server(self.connected, sock=listener)
+		logger.info("device listens on " + self.path)
+
+	async def connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		self.writers.append(writer)
+		self.flush()
+		try:
+			await self.pump(reader, eof=False)
+		except asyncio.CancelledError:
+			pass		# event loop is shutting down (streams would log the cancelled handler as an error)
+		finally:
+			self.writers.remove(writer)
+			writer.close()
+
+	def close(self):
+		if self.server is not None:
+			self.server.close()
+			self.server = None
+			if SocketDevice.isStale(self.path):
+				os.unlink(self.path)
+		for writer in self.writers:
+			writer.close()
+
+	# path is a socket nobody listens on
+	@staticmethod
+	def isStale(path: str) -> bool:
+		try:
+			if not stat.S_ISSOCK(os.stat(path).st_mode):
+				return False
+		except OSError:
+			return False
+		probe: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			probe.connect(path)
+		except ConnectionRefusedError:
+			return True
+		except OSError:
+			return False
+		finally:
+			probe.close()
+		return False
+
+	def write(self, val: bytes):
+		self.output += val
+		self.written(val)
+		# nobody takes the output: keep only the newest bytes
+		excess: int = len(self.output) - SocketDevice.maxOutput
+		if excess > 0:
+			del self.output[:excess]
+			if self.dropped == 0:
+				logger.warning("output of device is dropped, no client reads it (" + self.path + ")")
+			self.dropped += excess
+	# writers buffer the data, so this doesn't block
+	def flush(self):
+		self.pending = 0
+		if not self.output or not self.writers:
+			return
+		data: bytes = bytes(self.output)
+		self.output.clear()
+		self.dropped = 0
+		for writer in self.writers:
+			# buffer of a client that doesn't read would grow without limit
+			if writer.transport.get_write_buffer_size() < SocketDevice.maxOutput:
+				writer.write(data)
+			else:
+				logger.debug("output of device is dropped for a client that doesn't read (" + self.path + ")")
+
+# input device bound to a named pipe (created if missing), producers write into it
+# the pipe is also opened for writing, so input never ends and producers can come and go
+class FifoInputDevice(StreamInputDevice):
+
+	path: str
+	transport: asyncio.ReadTransport|None
+
+	def __init__(self, path: str):
+		super().__init__()
+		self.path = path
+		self.transport = None
+
+	def getPath(self) -> str:
+		return self.path
+
+	# start reading (must be called from a running event loop), raises OSError if the pipe can't be opened
+	async def open(self):
+		if not os.path.exists(self.path):
+			os.mkfifo(self.path)
+		pipe: BinaryIO = os.fdopen(os.open(self.path, os.O_RDWR | os.O_NONBLOCK), "rb", buffering=0)
+		reader: asyncio.StreamReader = asyncio.StreamReader()
+		self.transport, _ = await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+		self.attach(reader)
+
+	def close(self):
+		if self.transport is not None:
+			self.transport.close()
+			self.transport = None
+
+# output device bound to a named pipe (created if missing), consumers read from it
+# writes never block: bytes that don't fit into the pipe (or are written while nobody reads it) are kept and sent on flush,
+# TD reports the device as not ready while maxOutput bytes are waiting (older bytes are dropped if the guest writes anyway)
+class FifoOutputDevice(Device):
+
+	# bytes of output kept while nobody reads the pipe
+	maxOutput: int = 1 << 20
+
+	flushPolicy: FlushPolicy = FlushPolicy.LINE
+
+	path: str
+	fd: int|None					# None while there is no consumer
+	output: bytearray				# written bytes not sent yet
+	dropped: int					# bytes dropped since output was last sent
+
+	def __init__(self, path: str):
+		self.path = path
+		self.fd = None
+		self.output = bytearray()
+		self.dropped = 0
+		if not os.path.exists(path):
+			os.mkfifo(path)
+
+	def getPath(self) -> str:
+		return self.path
+
+	# a consumer may have read the pipe since the output filled up
+	def test(self) -> bool:
+		if len(self.output) >= FifoOutputDevice.maxOutput:
+			self.flush()
+		return len(self.output) < FifoOutputDevice.maxOutput
+
+	def write(self, val: bytes):
+		self.output += val
+		self.written(val)
+		excess: int = len(self.output) - FifoOutputDevice.maxOutput
+		if excess > 0:
+			del self.output[:excess]
+			if self.dropped == 0:
+				logger.warning("output of device is dropped, nobody reads it (" + self.path + ")")
+			self.dropped += excess
+	def flush(self):
+		self.pending = 0
+		if not self.output:
+			return
+		try:
+			if self.fd is None:
+				self.fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+			sent: int = os.write(self.fd, self.output)
+			del self.output[:sent]
+			self.dropped = 0
+		except BlockingIOError:
+			pass						# pipe is full, try again on next flush
+		except OSError as error:
+			# ENXIO: nobody reads the pipe yet, EPIPE: consumer went away
+			if error.errno not in (errno.ENXIO, errno.EPIPE):
+				logger.error("output of device failed (" + str(error) + ")")
+			self.close()
+
+	def close(self):
+		if self.fd is not None:
+			os.close(self.fd)
+			self.fd = None
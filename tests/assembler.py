@@ -0,0 +1,146 @@
+from misc import float2bytes
+
+# minimal SIC/XE assembler for test programs
+# supports labels, START, END, BASE, WORD, BYTE (C'', X'', F''), RESB, RESW,
+# +format 4, !SIC format, #immediate, @indirect, ,X indexing and label+offset operands
+
+opcodes: dict[str, int] = {
+	"ADD": 0x18, "ADDF": 0x58, "ADDR": 0x90, "AND": 0x40, "CLEAR": 0xB4, "COMP": 0x28, "COMPF": 0x88, "COMPR": 0xA0,
+	"DIV": 0x24, "DIVF": 0x64, "DIVR": 0x9C, "FIX": 0xC4, "FLOAT": 0xC0, "HIO": 0xF4, "J": 0x3C, "JEQ": 0x30,
+	"JGT": 0x34, "JLT": 0x38, "JSUB": 0x48, "LDA": 0x00, "LDB": 0x68, "LDCH": 0x50, "LDF": 0x70, "LDL": 0x08,
+	"LDS": 0x6C, "LDT": 0x74, "LDX": 0x04, "LPS": 0xD0, "MUL": 0x20, "MULF": 0x60, "MULR": 0x98, "NORM": 0xC8,
+	"OR": 0x44, "RD": 0xD8, "RMO": 0xAC, "RSUB": 0x4C, "SHIFTL": 0xA4, "SHIFTR": 0xA8, "SIO": 0xF0, "SSK": 0xEC,
+	"STA": 0x0C, "STB": 0x78, "STCH": 0x54, "STF": 0x80, "STI": 0xD4, "STL": 0x14, "STS": 0x7C, "STSW": 0xE8,
+	"STT": 0x84, "STX": 0x10, "SUB": 0x1C, "SUBF": 0x5C, "SUBR": 0x94, "SVC": 0xB0, "TD": 0xE0, "TIO": 0xF8,
+	"TIX": 0x2C, "TIXR": 0xB8, "WD": 0xDC
+}
+formatF1: set[str] = {"FIX", "FLOAT", "HIO", "NORM", "SIO", "TIO"}
+formatF2: set[str] = {"ADDR", "CLEAR", "COMPR", "DIVR", "MULR", "RMO", "SHIFTL", "SHIFTR", "SUBR", "SVC", "TIXR"}
+registers: dict[str, int] = {"A": 0, "X": 1, "L": 2, "B": 3, "S": 4, "T": 5, "F": 6, "PC": 8, "SW": 9}
+
+# source lines as (label, mnemonic, operand)
+def parse(source: str) -> list[tuple[str|None, str, str]]:
+	lines: list[tuple[str|None, str, str]] = []
+	for line in source.splitlines():
+		line = line.split(";")[0].rstrip()
+		if not line.strip():
+			continue
+		label: str|None = None
+		if not line[0].isspace():
+			label, _, line = line.partition(" ")
+		parts: list[str] = line.split(None, 1)
+		lines.append((label, parts[0], parts[1].strip() if len(parts) > 1 else ""))
+	return lines
+
+def size(mnemonic: str, operand: str) -> int:
+	match mnemonic:
+		case "WORD":
+			return 3 * len(operand.split(","))
+		case "BYTE":
+			if operand.startswith("X'"):
+				return len(operand[2:-1]) // 2
+			return 6 if operand.startswith("F'") else len(operand[2:-1])
+		case "RESW":
+			return 3 * int(operand, 0)
+		case "RESB":
+			return int(operand, 0)
+		case "START" | "END" | "BASE":
+			return 0
+	name: str = mnemonic.lstrip("+!")
+	if name in formatF1:
+		return 1
+	if name in formatF2:
+		return 2
+	return 4 if mnemonic.startswith("+") else 3
+
+def value(operand: str, symbols: dict[str, int]) -> int:
+	if "+" in operand:
+		left, right = operand.split("+")
+		return value(left, symbols) + value(right, symbols)
+	try:
+		return int(operand, 0)
+	except ValueError:
+		return symbols[operand]
+
+def encodeSICF3F4(mnemonic: str, operand: str, addr: int, base: int|None, symbols: dict[str, int]) -> bytes:
+	opcode: int = opcodes[mnemonic.lstrip("+!")]
+	x: int = 0
+	if operand.endswith(",X"):
+		x = 1
+		operand = operand[:-2]
+	ni: int = 3
+	if operand.startswith("#"):
+		ni = 1
+		operand = operand[1:]
+	elif operand.startswith("@"):
+		ni = 2
+		operand = operand[1:]
+	target: int = value(operand, symbols) if operand else 0
+	number: bool = operand == "" or operand[0].isdigit() or operand[0] == "-"
+
+	if mnemonic.startswith("!"):
+		return bytes([opcode, (x << 7) | ((target >> 8) & 0x7F), target & 0xFF])
+	if mnemonic.startswith("+"):
+		return bytes([opcode | ni, (x << 7) | 0x10 | ((target >> 16) & 0x0F), (target >> 8) & 0xFF, target & 0xFF])
+	# numbers are absolute, labels PC or base relative
+	bp: int
+	disp: int
+	if number and 0 <= target < 4096:
+		bp, disp = 0, target
+	elif -2048 <= target - (addr + 3) < 2048:
+		bp, disp = 1, (target - (addr + 3)) & 0xFFF
+	elif base is not None and 0 <= target - base < 4096:
+		bp, disp = 2, target - base
+	elif target < 4096:
+		bp, disp = 0, target
+	else:
+		raise ValueError("operand can't be addressed (" + operand + ")")
+	return bytes([opcode | ni, (x << 7) | (bp << 5) | (disp >> 8), disp & 0xFF])
+
+# returns code (address -> byte), entry point and symbol table
+def assemble(source: str) -> tuple[dict[int, int], int, dict[str, int]]:
+	lines: list[tuple[str|None, str, str]] = parse(source)
+
+	# first pass: addresses of labels
+	symbols: dict[str, int] = {}
+	start: int = 0
+	addr: int = 0
+	for label, mnemonic, operand in lines:
+		if mnemonic == "START":
+			start = addr = int(operand, 16)
+		if label is not None:
+			symbols[label] = addr
+		addr += size(mnemonic, operand)
+
+	# second pass: code
+	code: dict[int, int] = {}
+	entry: int = start
+	base: int|None = None
+	addr = start
+	for label, mnemonic, operand in lines:
+		data: bytes = b""
+		name: str = mnemonic.lstrip("+!")
+		if mnemonic == "BASE":
+			base = value(operand, symbols)
+		elif mnemonic == "END":
+			entry = value(operand, symbols) if operand else start
+		elif mnemonic == "WORD":
+			data = b"".join((value(item.strip(), symbols) & 0xFFFFFF).to_bytes(3, "big") for item in operand.split(","))
+		elif mnemonic == "BYTE":
+			if operand.startswith("C'"):
+				data = operand[2:-1].encode()
+			elif operand.startswith("X'"):
+				data = bytes.fromhex(operand[2:-1])
+			else:
+				data = b"".join(float2bytes(float(operand[2:-1])))
+		elif name in formatF1:
+			data = bytes([opcodes[name]])
+		elif name in formatF2:
+			operands: list[int] = [registers[r] if r in registers else int(r, 0) for r in operand.replace(" ", "").split(",") if r] + [0, 0]
+			data = bytes([opcodes[name], (operands[0] << 4) | operands[1]])
+		elif name in opcodes:
+			data = encodeSICF3F4(mnemonic, operand, addr, base, symbols)
+		for i, byte in enumerate(data):
+			code[addr + i] = byte
+		addr += size(mnemonic, operand)
+	return (code, entry, symbols)
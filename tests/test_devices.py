@@ -0,0 +1,291 @@
+import asyncio
+import io
+import os
+import socket
+import sys
+
+import pytest
+
+from assembler import assemble
+from device import Device, FileDevice, InputDevice, OutputDevice
+from flushpolicy import FlushPolicy
+from machine import Machine
+from stopreason import StopReason
+from streamdevice import FifoInputDevice, FifoOutputDevice, SocketDevice, StreamInputDevice
+
+# device numbers are 0x00-0xFF
+def test_device_numbers():
+	m: Machine = Machine()
+	device: Device = Device()
+	m.setDevice(0xFF, device)
+	assert m.getDevice(0xFF) is device
+	m.setDevice(0x100, Device())
+	assert m.getDevice(0x100) is None
+	assert m.getDevice(-1) is None
+	assert m.getDevice(0xFF) is device
+
+# file that counts writes that reach it
+class CountingFile(io.RawIOBase):
+	def __init__(self):
+		self.writes: int = 0
+		self.data: bytearray = bytearray()
+	def writable(self) -> bool:
+		return True
+	def write(self, val) -> int:
+		self.writes += 1
+		self.data += val
+		return len(val)
+
+# output device whose file counts writes
+def countingDevice(tmp_path) -> tuple[OutputDevice, CountingFile]:
+	device: OutputDevice = OutputDevice(str(tmp_path / "out.txt"))
+	raw: CountingFile = CountingFile()
+	device.file = io.BufferedWriter(raw)
+	return (device, raw)
+
+@pytest.mark.parametrize("flushPolicy, writes", [(FlushPolicy.UNBUFFERED, 10), (FlushPolicy.LINE, 2), (FlushPolicy.BLOCK, 1)])
+def test_flush_policies(flushPolicy: FlushPolicy, writes: int, tmp_path):
+	device, raw = countingDevice(tmp_path)
+	m: Machine = Machine()
+	m.setDevice(1, device)
+	m.setFlushPolicy(flushPolicy, 8)
+	for byte in b"abc\ndefgh\n":
+		device.write(bytes([byte]))
+	# LINE: after newlines, BLOCK: after 8 bytes (the rest waits for flushDevices)
+	assert raw.writes == writes
+	m.flushDevices()
+	assert raw.data == b"abc\ndefgh\n"
+
+# copies device 0 to device 1
+echo: str = """
+      START 0
+LOOP  RD #0
+      COMP #0
+      JEQ HALT
+      WD #1
+      J LOOP
+HALT  J HALT
+      END LOOP
+"""
+
+def load(source: str) -> Machine:
+	m: Machine = Machine()
+	code, entry, symbols = assemble(source)
+	for addr, byte in code.items():
+		m.setUint8(addr, byte)
+	m.setPC(entry)
+	return m
+
+# interactive input that is already buffered doesn't flush output before every RD
+def test_rd_flushes_only_before_waiting(monkeypatch, tmp_path):
+	monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BufferedReader(io.BytesIO(b"x" * 20000))))
+	m: Machine = load(echo)
+	m.setDevice(0, InputDevice("stdin"))
+	device, raw = countingDevice(tmp_path)
+	m.setDevice(1, device)
+	m.setFlushPolicy(FlushPolicy.BLOCK, 4096)
+	assert m.run(1000000)[0] == StopReason.HALT
+	assert raw.data == b"x" * 20000
+	assert raw.writes <= 20000 // 4096 + 2
+
+	# input ran out: output is flushed before the machine waits
+	m = load(echo)
+	stream: StreamInputDevice = StreamInputDevice(interactive=True)
+	stream.feed(b"hello")
+	m.setDevice(0, stream)
+	device, raw = countingDevice(tmp_path)
+	m.setDevice(1, device)
+	m.setFlushPolicy(FlushPolicy.BLOCK, 4096)
+	assert m.run(1000000)[0] == StopReason.WAIT
+	assert (raw.writes, raw.data) == (1, b"hello")
+
+# input is read ahead, a write goes where the guest stopped reading (not to the end of the read-ahead chunk)
+def test_read_ahead_write(monkeypatch, tmp_path):
+	monkeypatch.chdir(tmp_path)
+	(tmp_path / "05.dev").write_bytes(b"abcdef")
+	device: FileDevice = FileDevice("05.dev")
+	assert device.read() + device.read() == b"ab"
+	device.write(b"X")
+	assert device.read() == b"d"
+	device.write(b"YZ")
+	device.flush()
+	assert (tmp_path / "05.dev").read_bytes() == b"abXdYZ"
+	# end of file reads b"" (RD reads zeros), data appended later is picked up
+	assert device.read() == b""
+	with open(tmp_path / "05.dev", "ab") as file:
+		file.write(b"g")
+	assert device.read() == b"g"
+
+# waits for device 7E, then halts
+waitForFile: str = """
+      START 0
+LOOP  TD #0x7E
+      JEQ LOOP
+HALT  J HALT
+      END LOOP
+"""
+
+# reads a missing device forever
+readMissing: str = """
+      START 0
+LOOP  RD #0x7D
+      J LOOP
+      END LOOP
+"""
+
+# missing file is remembered and reported rarely
+def test_missing_file(monkeypatch, caplog, tmp_path):
+	monkeypatch.chdir(tmp_path)
+	m: Machine = load(readMissing)
+	assert m.run(2000) == (StopReason.STEPS, 2000)
+	errors: list[str] = [record.getMessage() for record in caplog.records if record.levelname == "ERROR"]
+	assert errors == ["file not found (7D.dev)", "device is not accessible (125)"]
+
+# file created later is found by the next attempt to open it
+def test_file_appears_later(monkeypatch, tmp_path):
+	monkeypatch.chdir(tmp_path)
+	monkeypatch.setattr(FileDevice, "retryInterval", 0.0)
+	m: Machine = load(waitForFile)
+	assert m.run(1000) == (StopReason.STEPS, 1000)
+	(tmp_path / "7E.dev").write_bytes(b"")
+	assert m.run(1000)[0] == StopReason.HALT
+
+# without retries the file is found after rescan
+def test_rescan_devices(monkeypatch, tmp_path):
+	monkeypatch.chdir(tmp_path)
+	monkeypatch.setattr(FileDevice, "retryInterval", None)
+	m: Machine = load(waitForFile)
+	assert m.run(1000) == (StopReason.STEPS, 1000)
+	(tmp_path / "7E.dev").write_bytes(b"")
+	assert m.run(1000) == (StopReason.STEPS, 1000)
+	m.rescanDevices()
+	assert m.run(1000)[0] == StopReason.HALT
+
+# file found later keeps the flush policy of the machine
+def test_file_appears_later_flush_policy(monkeypatch, tmp_path):
+	monkeypatch.chdir(tmp_path)
+	m: Machine = Machine()
+	m.setFlushPolicy(FlushPolicy.UNBUFFERED)
+	device: FileDevice = FileDevice("05.dev")
+	m.setDevice(5, device)
+	(tmp_path / "05.dev").write_bytes(b"")
+	m.rescanDevices()
+	assert device.isInitialized()
+	assert device.getFlushPolicy() == FlushPolicy.UNBUFFERED
+	device.write(b"a")
+	assert (tmp_path / "05.dev").read_bytes() == b"a"
+	# files are block buffered by default
+	assert FileDevice("05.dev").getFlushPolicy() == FlushPolicy.BLOCK
+
+# reads 16 random bytes into BUF
+readRandom: str = """
+      START 0
+      LDX #0
+LOOP  RD #3
+      STCH BUF,X
+      TIX #16
+      JLT LOOP
+HALT  J HALT
+BUF   RESB 16
+      END 0
+"""
+
+def randomBytes(seed: int|None) -> bytes:
+	m: Machine = load(readRandom)
+	m.setRngSeed(seed)
+	assert m.run(1000)[0] == StopReason.HALT
+	buffer: int = assemble(readRandom)[2]["BUF"]
+	return bytes(m.mem[buffer:buffer+16])
+
+# machines with the same seed read the same random bytes
+def test_rng_seed():
+	assert randomBytes(5) == randomBytes(5)
+	assert randomBytes(5) != randomBytes(6)
+	assert randomBytes(None) != randomBytes(None)
+
+# output waits for a consumer, TD reports the device as not ready while too much of it is waiting
+def test_fifo_output(monkeypatch, caplog, tmp_path):
+	monkeypatch.setattr(FifoOutputDevice, "maxOutput", 8)
+	path: str = str(tmp_path / "out.fifo")
+	device: FifoOutputDevice = FifoOutputDevice(path)
+	device.write(b"abc\n")
+	assert device.test()
+	device.write(b"defghi\n")
+	assert not device.test()
+	assert [record.levelname for record in caplog.records] == ["WARNING"]
+
+	consumer: int = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+	try:
+		assert device.test()
+		assert os.read(consumer, 100) == b"\ndefghi\n"
+		device.write(b"j\n")
+		assert os.read(consumer, 100) == b"j\n"
+	finally:
+		device.close()
+		os.close(consumer)
+
+# producers write into the pipe, RD reads what they wrote
+def test_fifo_input(tmp_path):
+	path: str = str(tmp_path / "in.fifo")
+	async def produce() -> bytes:
+		device: FifoInputDevice = FifoInputDevice(path)
+		await device.open()
+		try:
+			assert not device.test()
+			producer: int = os.open(path, os.O_WRONLY)
+			os.write(producer, b"xy")
+			os.close(producer)
+			await asyncio.wait_for(device.wait(), 5)
+			return device.readn(2)
+		finally:
+			device.close()
+	assert asyncio.run(produce()) == b"xy"
+
+# clients send input and get output (also output written before they connected)
+def test_socket_device(monkeypatch, tmp_path):
+	monkeypatch.setattr(SocketDevice, "maxOutput", 8)
+	path: str = str(tmp_path / "dev.sock")
+	async def talk() -> tuple[bytes, bytes]:
+		device: SocketDevice = SocketDevice(path)
+		await device.open()
+		try:
+			# only the newest bytes are kept until a client connects
+			device.write(b"0123456789\n")
+			reader, writer = await asyncio.open_unix_connection(path)
+			early: bytes = await asyncio.wait_for(reader.readexactly(8), 5)
+			writer.write(b"in")
+			await asyncio.wait_for(device.wait(), 5)
+			assert device.read() == b"i"
+			device.write(b"out\n")
+			late: bytes = await asyncio.wait_for(reader.readexactly(4), 5)
+			writer.close()
+			return (early, late)
+		finally:
+			device.close()
+	assert asyncio.run(talk()) == (b"3456789\n", b"out\n")
+	assert not os.path.exists(path)
+
+# only a socket nobody listens on is replaced
+def test_socket_path(tmp_path):
+	path: str = str(tmp_path / "dev.sock")
+	async def open() -> SocketDevice:
+		device: SocketDevice = SocketDevice(path)
+		await device.open()
+		return device
+
+	(tmp_path / "dev.sock").write_bytes(b"data")
+	with pytest.raises(OSError):
+		asyncio.run(open())
+	assert (tmp_path / "dev.sock").read_bytes() == b"data"
+	os.unlink(path)
+
+	listening: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	listening.bind(path)
+	listening.listen()
+	with pytest.raises(OSError):
+		asyncio.run(open())
+	listening.close()
+	# socket file is left behind
+	assert os.path.exists(path)
+	asyncio.run(open()).close()
+	assert not os.path.exists(path)
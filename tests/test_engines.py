@@ -0,0 +1,674 @@
+import asyncio
+
+import pytest
+
+from assembler import assemble
+from breakpoints import Breakpoints
+from costmodel import CostModel
+from counters import Counters
+from device import OutputDevice
+from limits import Limits
+from machine import Machine
+from mappedregion import MappedRegion
+from misc import float2bytes
+from opc import Opcode
+from stopreason import StopReason
+from timermode import TimerMode
+from streamdevice import StreamInputDevice
+from watchpoints import WatchHit
+
+# all engines (execute, run, translated blocks, superinstructions, tracing) must end in the same state
+
+programs: dict[str, str] = {}
+
+# addressing modes, formats, subroutines and self-modifying code
+programs["basic"] = """
+      START 0
+MAIN  LDX #0
+      LDT #11
+CPY   LDCH SRC,X
+      STCH DST,X
+      TIXR T
+      JLT CPY
+      LDX #0
+SUMLP LDA SUM
+      ADD ARR,X
+      STA SUM
+      LDA #3
+      ADDR A,X
+      RMO X,A
+      COMP #15
+      JLT SUMLP
+      JSUB SUB1
+      +LDA BIGV
+      LDB #TBL
+      BASE TBL
+      LDS TBL
+      LDA @PTR
+      STA RES1
+      !LDA VAL
+      !STA RES2
+      LDA #5
+      MUL #7
+      SUB #1
+      DIV #2
+      AND #0xFF
+      OR #0x100
+      STA RES3
+      LDA #1
+      SHIFTL A,4
+      SHIFTR A,1
+      LDS #9
+      MULR S,A
+      DIVR S,A
+      SUBR S,A
+      CLEAR X
+      COMPR A,X
+      STSW RES4
+      LDA #0
+      LDCH #0x41
+      STCH RES5
+      LDCH @CPTR
+      STX RES6
+      STT RES7
+      STB RES8
+      STS RES9
+      LDX #1
+      LDA #-1
+      COMP #1
+      JGT G1
+      LDA #2
+G1    TIX #5
+      JEQ G2
+      J G1
+G2    LDL #0x123
+      STL RES10
+      LDA #0
+      SUBR X,A
+      COMPR A,X
+      JLT G3
+      LDA #9
+G3    LDCH SRC+1
+      +JSUB SUB2
+      LDA #3
+      LDX #0
+      LDT #1
+      MULR T,X
+      J PATCHT
+PATCHT LDA #1
+      ADD COUNT
+      STA COUNT
+      LDA NEWI
+      STA PATCHT
+      LDA COUNT
+      COMP #5
+      JLT PATCHT
+HALT  J HALT
+SUB1  LDA #42
+      STA RES11
+      RSUB
+SUB2  STL RES12
+      LDA #77
+      RSUB
+COUNT WORD 0
+NEWI  WORD 0x010007
+SRC   BYTE C'HELLO WORLD'
+DST   RESB 11
+ARR   WORD 1,2,3,-4,100000
+SUM   WORD 0
+BIGV  WORD 0xABCDEF
+PTR   WORD VAL
+VAL   WORD 0x654321
+CPTR  WORD SRC+4
+RES1  WORD 0
+RES2  WORD 0
+RES3  WORD 0
+RES4  WORD 0
+RES5  WORD 0
+RES6  WORD 0
+RES7  WORD 0
+RES8  WORD 0
+RES9  WORD 0
+RES10 WORD 0
+RES11 WORD 0
+RES12 WORD 0
+TBL   WORD 0x111111
+      END MAIN
+"""
+
+# bubble sort, prints the result on device 1
+programs["sort"] = """
+      START 0x1000
+MAIN  LDA #0
+OUTER LDX #0
+      LDA #0
+      STA SWP
+INNER LDA ARR,X
+      STA TMP
+      LDA ARR+3,X
+      COMP TMP
+      JLT DOSWP
+      J NEXT
+DOSWP STA ARR,X
+      LDA TMP
+      STA ARR+3,X
+      LDA #1
+      STA SWP
+NEXT  RMO X,A
+      ADD #3
+      RMO A,X
+      COMP LASTI
+      JLT INNER
+      LDA SWP
+      COMP #0
+      JEQ DONE
+      J OUTER
+DONE  LDX #0
+      LDT #3
+PRT   LDA ARR,X
+WAIT  TD #1
+      JEQ WAIT
+      AND #0x3F
+      ADD #0x30
+      WD #1
+      RMO X,A
+      ADDR T,X
+      COMP LASTI
+      JLT PRT
+      LDA #10
+      WD #1
+HALT  J HALT
+SWP   WORD 0
+TMP   WORD 0
+LASTI WORD 57
+ARR   WORD 9,3,7,1,15,2,8,6,5,4,12,11,10,14,13,0,20,18,19,17
+      END MAIN
+"""
+
+# floating point
+programs["float"] = """
+      START 0
+MAIN  LDF ZERO
+      STF ACC
+      LDX #0
+LOOP  LDF VALS,X
+      MULF TWO
+      ADDF ACC
+      STF ACC
+      LDA #6
+      ADDR A,X
+      RMO X,A
+      COMP #24
+      JLT LOOP
+      LDF ACC
+      DIVF TWO
+      SUBF ONE
+      COMPF ONE
+      STSW SW1
+      FIX
+      STA RESI
+      LDA #7
+      FLOAT
+      STF RESF
+      LDF @FPTR
+      STF RESF2
+HALT  J HALT
+ZERO  BYTE F'0.0'
+ONE   BYTE F'1.0'
+TWO   BYTE F'2.0'
+VALS  BYTE F'1.5'
+      BYTE F'-2.25'
+      BYTE F'3.125'
+      BYTE F'100.0'
+ACC   RESB 6
+RESF  RESB 6
+RESF2 RESB 6
+SW1   WORD 0
+RESI  WORD 0
+FPTR  WORD VALS
+      END MAIN
+"""
+
+# nested loops made of fusable pairs (COMPR/JEQ, LDCH/STCH, TIXR/JLT, COMP/JLT)
+programs["loops"] = """
+      START 0
+MAIN  LDA #0
+      STA CNT
+OUTER LDX #0
+      LDT #50
+INNER LDA ACC
+      ADD DATA,X
+      STA ACC
+      LDCH SRC,X
+      STCH DST,X
+      COMPR A,T
+      JEQ SKIP
+SKIP  TIXR T
+      JLT INNER
+      LDA CNT
+      ADD #1
+      STA CNT
+      COMP #20
+      JLT OUTER
+HALT  J HALT
+CNT   WORD 0
+ACC   WORD 0
+DATA  WORD 1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20
+      RESB 90
+SRC   BYTE C'THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG'
+      RESB 7
+DST   RESB 50
+      END MAIN
+"""
+
+# copies device 0 to device 1 (not run by all engines, it reads input)
+echo: str = """
+      START 0
+MAIN  LDX #0
+LOOP  RD #0
+      COMP #0
+      JEQ HALT
+      WD #1
+      J LOOP
+HALT  J HALT
+      END MAIN
+"""
+
+# machine with the program loaded and PC at its entry point, device 1 writes to out.txt in tmp_path
+def load(source: str, tmp_path) -> Machine:
+	tmp_path.mkdir(exist_ok=True)
+	m: Machine = Machine()
+	m.setDevice(1, OutputDevice(str(tmp_path / "out.txt")))
+	# long enough to compare whole runs of the test programs
+	m.setHistorySize(10000)
+	code, entry, symbols = assemble(source)
+	for addr, byte in code.items():
+		m.setUint8(addr, byte)
+	m.setPC(entry)
+	return m
+
+# run until the machine halts with one of the engines
+def runEngine(m: Machine, engine: str):
+	match engine:
+		case "execute" | "fusion-execute":
+			m.setFusion(engine == "fusion-execute")
+			while True:
+				lastPC: int = m.execute()
+				if m.getPC() == lastPC:
+					break
+		case "traced":
+			m.setTracer(lambda event: None)
+			while True:
+				lastPC: int = m.executeTraced()
+				if m.getPC() == lastPC:
+					break
+		case _:
+			m.setFusion("fusion" in engine)
+			# small batches make superinstructions and blocks straddle batch boundaries
+			batch: int = 7 if "batches" in engine else 10_000_000
+			reason: StopReason = StopReason.STEPS
+			while reason == StopReason.STEPS:
+				reason, steps = m.run(batch, (), "jit" in engine)
+			assert reason == StopReason.HALT
+
+# state that all engines must agree on
+def state(m: Machine, tmp_path) -> tuple:
+	m.flushDevices()
+	registers: tuple = (m.getA(), m.getX(), m.getL(), m.getB(), m.getS(), m.getT(), m.getF(), m.getPC(), m.getSW())
+	counters: dict[str, int] = m.getCounters().export()
+	return (registers, bytes(m.mem), counters, (tmp_path / "out.txt").read_bytes(), m.getInstructionsString())
+
+engines: list[str] = ["run", "run-batches", "jit", "jit-batches", "fusion", "fusion-batches", "fusion-jit", "fusion-execute", "traced"]
+
+@pytest.mark.parametrize("program", programs.keys())
+@pytest.mark.parametrize("engine", engines)
+def test_engine_matches_execute(program: str, engine: str, tmp_path):
+	reference: Machine = load(programs[program], tmp_path / "reference")
+	runEngine(reference, "execute")
+	expected: tuple = state(reference, tmp_path / "reference")
+
+	m: Machine = load(programs[program], tmp_path / engine)
+	runEngine(m, engine)
+	registers, mem, counters, output, history = state(m, tmp_path / engine)
+	assert registers == expected[0]
+	assert mem == expected[1]
+	assert counters == expected[2]
+	assert output == expected[3]
+	assert history == expected[4]
+
+def test_sort_output(tmp_path):
+	m: Machine = load(programs["sort"], tmp_path)
+	runEngine(m, "fusion-jit")
+	m.flushDevices()
+	assert (tmp_path / "out.txt").read_bytes() == bytes(0x30 + i for i in range(21) if i != 16) + b"\n"
+
+# store into the second instruction of a superinstruction drops the whole pair
+@pytest.mark.parametrize("engine", ["fusion", "fusion-jit"])
+def test_store_into_fused_pair(engine: str, tmp_path):
+	m: Machine = load("""
+      START 0
+MAIN  COMP #0
+      JEQ 0x100
+      END MAIN
+""", tmp_path)
+	m.setUint24(0x100, 0x3F2FFD)		# J 0x100
+	m.setUint24(0x180, 0x3F2FFD)		# J 0x180
+	m.setFusion(True)
+	assert m.getDecoded(0).format == "fused"
+	# JEQ 0x100 -> JEQ 0x180
+	m.setUint8(5, 0x80)
+	m.run(100, (), engine == "fusion-jit")
+	assert m.getPC() == 0x180
+
+# timeout while waiting for input ends runAsync (wait_for raises asyncio.TimeoutError, not TimeoutError, before python 3.11)
+def test_async_wait_timeout(monkeypatch, tmp_path):
+	class WaitTimeout(Exception):
+		pass
+	waitFor = asyncio.wait_for
+	async def waitForOld(awaitable, timeout):
+		try:
+			return await waitFor(awaitable, timeout)
+		except TimeoutError:
+			raise WaitTimeout()
+	monkeypatch.setattr(asyncio, "TimeoutError", WaitTimeout)
+	monkeypatch.setattr(asyncio, "wait_for", waitForOld)
+
+	async def main() -> tuple[StopReason, int]:
+		m: Machine = load(echo, tmp_path)
+		m.setDevice(0, StreamInputDevice())
+		return await m.runAsync(Limits(timeout=0.05))
+	reason, steps = asyncio.run(main())
+	assert reason == StopReason.TIMEOUT
+	# LDX, RD waits for input
+	assert steps == 1
+
+# RD that waits for input is executed again later, retries don't count as executed instructions
+@pytest.mark.parametrize("engine", ["execute", "traced", "run", "jit"])
+def test_waiting_rd_is_not_counted(engine: str, tmp_path):
+	m: Machine = load(echo, tmp_path)
+	m.setTracer(lambda event: None)
+	device: StreamInputDevice = StreamInputDevice()
+	m.setDevice(0, device)
+	m.setPC(3)							# RD #0
+	for i in range(5):
+		match engine:
+			case "execute":
+				m.execute()
+			case "traced":
+				m.executeTraced()
+			case _:
+				assert m.run(100, (), engine == "jit") == (StopReason.WAIT, 0)
+		assert m.getWaitingDevice() is device
+		assert m.getPC() == 3
+	assert m.getCounters().export() == Counters().export()
+	assert m.getInstructionsString().strip() == ""
+
+	# the same as without waiting
+	device.feed(b"ab\x00")
+	runEngine(m, engine)
+	reference: Machine = load(echo, tmp_path / "reference")
+	reference.setDevice(0, StreamInputDevice())
+	reference.getDevice(0).feed(b"ab\x00")
+	reference.setPC(3)
+	runEngine(reference, "execute")
+	assert m.getCounters().export() == reference.getCounters().export()
+	m.flushDevices()
+	assert (tmp_path / "out.txt").read_bytes() == b"ab"
+
+# TD/JEQ loop on a device that never gets ready
+spin: str = """
+      START 0
+LOOP  TD #0x7E
+      JEQ LOOP
+HALT  J HALT
+      END LOOP
+"""
+
+# breakpoints on JEQ of a TD/JEQ loop stop every iteration (the loop isn't fast-forwarded)
+@pytest.mark.parametrize("engine", ["run", "jit", "fusion", "fusion-jit"])
+def test_breakpoint_in_spin_loop(engine: str, monkeypatch, tmp_path):
+	monkeypatch.chdir(tmp_path)
+	m: Machine = load(spin, tmp_path)
+	m.setFusion("fusion" in engine)
+	assert m.run(1000, {3}, "jit" in engine) == (StopReason.BREAKPOINT, 1)
+	for i in range(3):
+		assert m.run(1000, {3}, "jit" in engine) == (StopReason.BREAKPOINT, 2)
+	assert m.getCounters().getInstructions() == 7
+
+	m = load(spin, tmp_path)
+	m.setFusion("fusion" in engine)
+	assert m.run(100000, Breakpoints(["PC == 3 and hits == 100"]), "jit" in engine) == (StopReason.BREAKPOINT, 199)
+
+# run executes exactly maxSteps instructions, even if a superinstruction straddles the limit
+@pytest.mark.parametrize("engine", ["run", "jit", "fusion", "fusion-jit"])
+def test_exact_step_counts(engine: str, tmp_path):
+	reference: Machine = load(programs["loops"], tmp_path)
+	for steps in range(1, 100):
+		m: Machine = load(programs["loops"], tmp_path)
+		m.setFusion("fusion" in engine)
+		assert m.run(steps, (), "jit" in engine) == (StopReason.STEPS, steps)
+		assert m.getCounters().getInstructions() == steps
+		reference.execute()
+		assert m.getPC() == reference.getPC()
+
+	m = load(programs["loops"], tmp_path)
+	m.setFusion("fusion" in engine)
+	assert m.runLimited(Limits(maxInstructions=5), "jit" in engine) == (StopReason.BUDGET, 5)
+	assert m.getCounters().getInstructions() == 5
+
+# float operands are converted straight from memory, stores invalidate cached instructions
+def test_float_memory(tmp_path):
+	m: Machine = load(programs["float"], tmp_path)
+	m.setFloat(0x100, -6.5)
+	assert bytes(m.mem[0x100:0x106]) == b"".join(float2bytes(-6.5))
+	assert m.getFloat(0x100) == -6.5
+	# LDF ZERO -> AND (first byte of 6.5 is 0x40)
+	m.getDecoded(0)
+	m.setFloat(0, 6.5)
+	assert m.getDecoded(0).opcode == Opcode.AND
+
+# machine and symbols of a program
+def loadWithSymbols(source: str, tmp_path) -> tuple[Machine, dict[str, int]]:
+	return (load(source, tmp_path), assemble(source)[2])
+
+# run stops after the access that hit a watchpoint and reports it
+@pytest.mark.parametrize("engine", ["run", "jit", "fusion-jit"])
+def test_watchpoints(engine: str, tmp_path):
+	m, symbols = loadWithSymbols(programs["basic"], tmp_path)
+	m.setFusion("fusion" in engine)
+	m.addWatchpoint(symbols["RES1"], symbols["RES1"] + 3, read=False, write=True)
+	m.addWatchpoint(symbols["VAL"], symbols["VAL"] + 1, read=True, write=False)
+
+	# LDA @PTR reads VAL
+	reason, steps = m.run(100000, (), "jit" in engine)
+	assert reason == StopReason.WATCHPOINT
+	hit: WatchHit = m.getWatchHit()
+	assert (hit.write, hit.address, hit.length, hit.oldValue, hit.newValue) == (False, symbols["VAL"], 3, 0x654321, 0x654321)
+	assert m.getPC() == hit.PC + 3
+	assert m.getA() == 0x654321
+
+	# STA RES1
+	assert m.run(100000, (), "jit" in engine)[0] == StopReason.WATCHPOINT
+	hit = m.getWatchHit()
+	assert (hit.write, hit.address, hit.length, hit.oldValue, hit.newValue) == (True, symbols["RES1"], 3, 0, 0x654321)
+	assert hit.decoded.opcode == Opcode.STA
+
+	# !LDA VAL
+	assert m.run(100000, (), "jit" in engine)[0] == StopReason.WATCHPOINT
+	assert m.getWatchHit().PC == hit.PC + 3
+
+	m.clearWatchpoints()
+	assert m.run(100000, (), "jit" in engine)[0] == StopReason.HALT
+
+costs: str = """
+      START 0
+MAIN  LDA #5
+      STA RES
+      LDA @PTR
+      +LDA RES
+      MUL #2
+      MULR A,X
+      FIX
+      LDF FV
+HALT  J HALT
+RES   WORD 0
+PTR   WORD RES
+FV    BYTE F'1.5'
+      END MAIN
+"""
+
+# cycles and memory accesses follow from format, opcode and addressing (the same in all engines)
+@pytest.mark.parametrize("engine", ["execute", "run", "jit", "traced"])
+def test_cost_model(engine: str, tmp_path):
+	m: Machine = load(costs, tmp_path)
+	runEngine(m, engine)
+	counters: Counters = m.getCounters()
+	# LDA # 2, STA 2+1, LDA @ 2+2, +LDA 3+1, MUL # 2+3, MULR 1+3, FIX 1+1, LDF 2+1, J 2
+	assert counters.getCycles() == 29
+	assert (counters.getInstructions(), counters.getMemoryReads(), counters.getMemoryWrites(), counters.getBranchesTaken()) == (9, 4, 1, 1)
+	assert counters.getFormats() == {"F1": 1, "F2": 1, "SIC": 0, "F3": 6, "F4": 1, "": 0}
+
+def test_cost_model_file(tmp_path):
+	(tmp_path / "costs.txt").write_text("# cheap memory, slow MUL\nF3 1\nMUL 10\n\nmemory 0\n")
+	m: Machine = load(costs, tmp_path)
+	m.setCostModel(CostModel.load(str(tmp_path / "costs.txt")))
+	runEngine(m, "run")
+	# LDA # 1, STA 1, LDA @ 1, +LDA 3, MUL # 1+10, MULR 1+3, FIX 1+1, LDF 1, J 1
+	assert m.getCounters().getCycles() == 25
+
+	(tmp_path / "costs.txt").write_text("F3 fast\n")
+	with pytest.raises(ValueError):
+		CostModel.load(str(tmp_path / "costs.txt"))
+
+# loop that stores the same value every time (state repeats)
+storeSame: str = """
+      START 0
+MAIN  LDA #7
+LOOP  STA VAL
+      ADD #1
+      SUB #1
+      J LOOP
+VAL   WORD 0
+      END MAIN
+"""
+
+# loop that changes only memory (state never repeats)
+countInMemory: str = """
+      START 0
+LOOP  LDA CNT
+      ADD #1
+      STA CNT
+      LDA #0
+      J LOOP
+CNT   WORD 0
+      END LOOP
+"""
+
+# a state seen before is a loop, changes of memory and polls of a device that isn't ready are not
+@pytest.mark.parametrize("engine", ["run", "jit", "fusion-jit"])
+def test_loop_detection(engine: str, monkeypatch, tmp_path):
+	monkeypatch.chdir(tmp_path)
+	limits: Limits = Limits(maxInstructions=100000, loopCheckInterval=1000)
+
+	m: Machine = load(storeSame, tmp_path)
+	m.setFusion("fusion" in engine)
+	reason, steps = m.runLimited(limits, "jit" in engine)
+	assert reason == StopReason.LOOP
+	assert steps < 100000
+
+	m = load(countInMemory, tmp_path)
+	m.setFusion("fusion" in engine)
+	assert m.runLimited(limits, "jit" in engine) == (StopReason.BUDGET, 100000)
+	assert m.getWord(assemble(countInMemory)[2]["CNT"]) == (20000).to_bytes(3, "big")
+
+	# 7E.dev doesn't exist
+	m = load(spin, tmp_path)
+	m.setFusion("fusion" in engine)
+	assert m.runLimited(limits, "jit" in engine) == (StopReason.BUDGET, 100000)
+	assert m.getCounters().getDevicePolls() == 50000
+
+# fills pages 1 to 3 with words
+fillPages: str = """
+      START 0
+      LDX #0
+LOOP  +STA 0x1000,X
+      LDA #3
+      ADDR A,X
+      J LOOP
+      END 0
+"""
+
+# all stores mark the pages they changed
+@pytest.mark.parametrize("engine", ["execute", "run", "jit", "fusion-jit"])
+def test_dirty_pages(engine: str, tmp_path):
+	m: Machine = load(fillPages, tmp_path)
+	m.setFusion("fusion" in engine)
+	m.dirtyPages[:] = bytes(len(m.dirtyPages))
+	steps: int = 4 * 4096
+	if engine == "execute":
+		for i in range(steps):
+			m.execute()
+	else:
+		assert m.run(steps, (), "jit" in engine) == (StopReason.STEPS, steps)
+	assert [page for page in range(len(m.dirtyPages)) if m.dirtyPages[page]] == [1, 2, 3]
+	assert m.dirtyPages[1] == m.dirtyPages[2] == 0xFF
+
+# measures a loop of 5000 instructions with stdtimer
+timer: str = """
+      START 0
+MAIN  LDA #1
+      WD #4
+      LDX #0
+LOOP  TIX #2500
+      JLT LOOP
+      LDA #2
+      WD #4
+      RD #4
+      STCH TIME
+      RD #4
+      STCH TIME+1
+      RD #4
+      STCH TIME+2
+HALT  J HALT
+TIME  RESB 3
+      END MAIN
+"""
+
+# virtual time is the same in all engines (1 instruction or cycle = 1 us, TIX # and JLT take 2 cycles)
+@pytest.mark.parametrize("timerMode, milliseconds", [(TimerMode.INSTRUCTIONS, 5), (TimerMode.CYCLES, 10)])
+@pytest.mark.parametrize("engine", ["execute", "run", "jit", "fusion-jit", "traced"])
+def test_timer_modes(timerMode: TimerMode, milliseconds: int, engine: str, tmp_path):
+	m, symbols = loadWithSymbols(timer, tmp_path)
+	m.setTimerMode(timerMode)
+	runEngine(m, engine)
+	assert m.getUint24(symbols["TIME"]) == milliseconds
+
+# increments word of a mapped file at 0x2000 into the next word
+mapped: str = """
+      START 0
+MAIN  +LDA 0x2000
+      ADD #1
+      +STA 0x2003
+HALT  J HALT
+      END MAIN
+"""
+
+# loads and stores on a mapped window work with the file, syncing compares only pages stored to
+@pytest.mark.parametrize("engine", ["execute", "run", "jit", "fusion-jit"])
+def test_mapped_file(engine: str, tmp_path):
+	m: Machine = load(mapped, tmp_path)
+	(tmp_path / "data.bin").write_bytes(b"\x00\x00\x41" + bytes(13))
+	region: MappedRegion|None = m.mapFile(str(tmp_path / "data.bin"), 0x2000)
+	assert region is not None and region.getSize() == 16
+	runEngine(m, engine)
+	m.syncMapped()
+	assert (tmp_path / "data.bin").read_bytes() == b"\x00\x00\x41\x00\x00\x42" + bytes(10)
+
+	# nothing was stored since the last sync (a change that bypasses the accessors isn't seen)
+	m.mem[0x2006] = 0xFF
+	m.syncMapped()
+	assert (tmp_path / "data.bin").read_bytes()[6] == 0
+	# unmapping writes back everything
+	m.unmapFile(region)
+	assert (tmp_path / "data.bin").read_bytes()[6] == 0xFF
+	assert m.getMappedRegions() == []
@@ -0,0 +1,63 @@
+import time
+
+from throttle import Throttle
+
+# host clock that only moves when the throttle sleeps (or the test moves it)
+class FakeClock():
+
+	def __init__(self):
+		self.now = 0
+		self.sleeps: list[float] = []
+
+	def perfCounterNs(self) -> int:
+		return self.now
+	def sleep(self, seconds: float):
+		self.sleeps.append(seconds)
+		self.now += round(seconds * 1e9)
+
+def fakeClock(monkeypatch) -> FakeClock:
+	clock: FakeClock = FakeClock()
+	monkeypatch.setattr(time, "perf_counter_ns", clock.perfCounterNs)
+	monkeypatch.setattr(time, "sleep", clock.sleep)
+	return clock
+
+# bursts are scheduled at the clock frequency and the achieved frequency is measured
+def test_throttle_rate(monkeypatch):
+	clock: FakeClock = fakeClock(monkeypatch)
+	throttle: Throttle = Throttle(1e-6)
+	assert throttle.getBurstSize() == 10_000
+	assert throttle.getTargetFrequency() == 1e6
+
+	measured: bool = False
+	for i in range(100):
+		# a burst takes 2 ms on the host
+		clock.now += 2_000_000
+		measured = throttle.wait(throttle.getBurstSize())
+	assert measured
+	assert clock.now == 1_000_000_000
+	assert all(abs(seconds - 0.008) < 1e-9 for seconds in clock.sleeps)
+	assert throttle.getFrequency() == 1e6
+
+# short waits are left for the next burst, a machine that falls far behind doesn't try to catch up
+def test_throttle_lag(monkeypatch):
+	clock: FakeClock = fakeClock(monkeypatch)
+	throttle: Throttle = Throttle(1e-6)
+	clock.now += 500_000
+	throttle.wait(1000)
+	assert clock.sleeps == []
+
+	# paused for a second
+	clock.now += 1_000_000_000
+	throttle.wait(1000)
+	assert clock.sleeps == []
+	clock.now += 1_000
+	throttle.wait(10_000)
+	assert len(clock.sleeps) == 1 and abs(clock.sleeps[0] - 0.009999) < 1e-9
+
+# clock period 0 doesn't throttle
+def test_throttle_disabled(monkeypatch):
+	clock: FakeClock = fakeClock(monkeypatch)
+	throttle: Throttle = Throttle(0)
+	assert throttle.getBurstSize() == 1
+	assert not throttle.wait(1_000_000)
+	assert clock.sleeps == []
@@ -0,0 +1,82 @@
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+# keeps the machine at its clock frequency
+# instructions are executed in bursts and accounted against a perf_counter_ns schedule,
+# so there is at most one sleep per burst and sleep granularity doesn't accumulate
+class Throttle():
+
+	# length of a single burst [ns]
+	burstNs: int = 10_000_000
+	# shorter waits are left for the next burst
+	minSleepNs: int = 1_000_000
+	# falling behind by more than this (paused or too slow machine) restarts the schedule
+	maxLagNs: int = 250_000_000
+	# achieved frequency is measured over windows of this length [ns]
+	windowNs: int = 1_000_000_000
+
+	clockPeriod: float		# [s], 0 = no throttling
+	clockPeriodNs: int
+	startNs: int			# start of the schedule
+	executed: int			# instructions executed since startNs
+	windowStartNs: int
+	windowExecuted: int
+	frequency: float		# achieved frequency in the last window [Hz]
+
+	def __init__(self, clockPeriod: float = 0):
+		self.setClockPeriod(clockPeriod)
+
+	def getClockPeriod(self) -> float:
+		return self.clockPeriod
+	def getFrequency(self) -> float:
+		return self.frequency
+	def getTargetFrequency(self) -> float:
+		return 1e9 / self.clockPeriodNs if self.clockPeriodNs > 0 else 0.0
+
+	def setClockPeriod(self, clockPeriod: float):
+		self.clockPeriod = clockPeriod
+		self.clockPeriodNs = round(clockPeriod * 1e9)
+		self.restart()
+
+	def restart(self):
+		now: int = time.perf_counter_ns()
+		self.startNs = now
+		self.executed = 0
+		self.windowStartNs = now
+		self.windowExecuted = 0
+		self.frequency = 0.0
+
+	# number of instructions that take about burstNs at the clock frequency
+	def getBurstSize(self) -> int:
+		if self.clockPeriodNs <= 0:
+			return 1
+		return max(1, Throttle.burstNs // self.clockPeriodNs)
+
+	# account for executed instructions and sleep until they are due
+	# returns True if a new achieved frequency was measured
+	def wait(self, executed: int) -> bool:
+		if self.clockPeriodNs <= 0:
+			return False
+
+		self.executed += executed
+		self.windowExecuted += executed
+		now: int = time.perf_counter_ns()
+		ahead: int = self.startNs + self.executed * self.clockPeriodNs - now
+		if ahead >= Throttle.minSleepNs:
+			time.sleep(ahead / 1e9)
+			now += ahead
+		elif -ahead > Throttle.maxLagNs:
+			# don't try to catch up, just continue at the clock frequency from now on
+			logger.debug("throttle is " + str(-ahead // 1_000_000) + " ms behind, restarting schedule")
+			self.startNs = now
+			self.executed = 0
+
+		elapsed: int = now - self.windowStartNs
+		if elapsed < Throttle.windowNs:
+			return False
+		self.frequency = self.windowExecuted * 1e9 / elapsed
+		self.windowStartNs = now
+		self.windowExecuted = 0
+		return True
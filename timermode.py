@@ -0,0 +1,7 @@
+# enum for time sources of stdtimer (see Machine.setTimerMode)
+# virtual time doesn't depend on the host or the engine, so guest timings are reproducible
+from enum import Enum
+class TimerMode(Enum):
+	HOST = 0			# host time (perf_counter_ns)
+	INSTRUCTIONS = 1	# executed instructions at the virtual clock period
+	CYCLES = 2			# modeled cycles (see CostModel) at the virtual clock period
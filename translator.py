@@ -0,0 +1,469 @@
+from typing import Callable, Collection
+
+from opc import Opcode
+from decoded import Decoded, Cost
+from registers import Registers
+import instructionsSICF3F4 as isicf3f4
+
+import logging
+logger = logging.getLogger(__name__)
+
+# translated basic block
+class Block():
+
+	start: int					# address of first instruction
+	end: int					# address after last instruction
+	function: Callable[[], int]	# runs the block, returns address of last executed instruction
+	index: dict[int, int]		# address of instruction -> its position in block
+	alive: list[bool]			# cleared when the block gets invalidated
+	# for every position in block: total cost and formats of instructions up to it
+	# and address of the instruction that follows it (see Counters)
+	profile: list[tuple[Cost, dict[str, int], int]]
+
+	def __init__(self, start: int, end: int, function: Callable[[], int], index: dict[int, int], alive: list[bool], decodedList: list[Decoded], addresses: list[int]):
+		self.start = start
+		self.end = end
+		self.function = function
+		self.index = index
+		self.alive = alive
+		self.profile = []
+		cost: Cost = Cost(0, 0, 0)
+		formats: dict[str, int] = {}
+		for decoded, address in zip(decodedList, addresses):
+			cost = cost.plus(decoded.cost)
+			formats = dict(formats)
+			formats[decoded.format] = formats.get(decoded.format, 0) + 1
+			self.profile.append((cost, formats, address + decoded.length))
+
+	# number of instructions executed if block returned lastAddress
+	def count(self, lastAddress: int) -> int:
+		return self.index[lastAddress] + 1
+
+# instructions that end a basic block
+blockEnd: set[Opcode] = {
+	Opcode.J,
+	Opcode.JEQ,
+	Opcode.JGT,
+	Opcode.JLT,
+	Opcode.JSUB,
+	Opcode.RSUB,
+	Opcode.RD,
+	Opcode.WD
+}
+
+# instructions that start a basic block
+blockStart: set[Opcode] = {
+	Opcode.RD,
+	Opcode.WD
+}
+
+# register (by index) in generated code
+def reg(index: int) -> str:
+	return "r." + Registers.names[index]
+
+# register index used by load/store instructions
+opcodeLoadReg: dict[Opcode, int] = {
+	Opcode.LDA: 0, Opcode.LDX: 1, Opcode.LDL: 2, Opcode.LDB: 3, Opcode.LDS: 4, Opcode.LDT: 5
+}
+opcodeStoreReg: dict[Opcode, int] = {
+	Opcode.STA: 0, Opcode.STX: 1, Opcode.STL: 2, Opcode.STB: 3, Opcode.STS: 4, Opcode.STT: 5, Opcode.STSW: 9
+}
+# A = A <op> operand
+opcodeArithmetic: dict[Opcode, str] = {
+	Opcode.ADD: "(r.A + {:s}) & 0xFFFFFF",
+	Opcode.SUB: "(r.A - {:s}) & 0xFFFFFF",
+	Opcode.MUL: "(r.A * {:s}) & 0xFFFFFF",
+	Opcode.DIV: "r.A // {:s}",
+	Opcode.AND: "r.A & {:s}",
+	Opcode.OR: "r.A | {:s}"
+}
+# CC value the conditional jump checks
+opcodeJumpCC: dict[Opcode, int] = {
+	Opcode.JEQ: 0x00, Opcode.JGT: 0x80, Opcode.JLT: 0x40
+}
+# r2 = r2 <op> r1 (F2)
+opcodeRegArithmetic: dict[Opcode, str] = {
+	Opcode.ADDR: "{r2:s} + {r1:s}",
+	Opcode.SUBR: "{r2:s} - {r1:s}",
+	Opcode.MULR: "{r2:s} * {r1:s}",
+	Opcode.DIVR: "{r2:s} // {r1:s}",
+	Opcode.RMO: "{r1:s}"
+}
+
+# compiles basic blocks of guest code into python functions
+# a block starts at the current PC and ends after a jump, JSUB, RSUB, RD or WD instruction,
+# before a breakpoint or before an instruction that can't be cached
+# generated code works directly on the machine's register list and memory buffer,
+# everything it can't handle falls back to the interpreter (decoded.executor)
+# with instructions history enabled, generated code records its instructions too (the interpreter does it on fallback)
+class Translator():
+
+	# maximum number of instructions in a single block
+	maxBlockLength: int = 64
+
+	def __init__(self, m):
+		self.m = m
+		# start address -> translated block
+		self.blocks: dict[int, Block] = {}
+		# breakpoints that current blocks were built with
+		self.breakpoints: frozenset[int] = frozenset()
+		self.breakpointsRef: Collection[int] = ()
+		# number of instructions executed by the last execute() call
+		self.lastCount: int = 0
+
+	# drop all translated blocks
+	def flush(self):
+		for block in self.blocks.values():
+			block.alive[0] = False
+		self.blocks.clear()
+
+	# drop translated blocks that overlap bytes [addr, addr+length)
+	def invalidate(self, addr: int, length: int):
+		for start in [start for start, block in self.blocks.items() if block.start < addr + length and addr < block.end]:
+			logger.debug("invalidating translated block at " + hex(start))
+			self.blocks.pop(start).alive[0] = False
+
+	def setBreakpoints(self, breakpoints: Collection[int]):
+		self.breakpointsRef = breakpoints
+		if frozenset(breakpoints) != self.breakpoints:
+			self.breakpoints = frozenset(breakpoints)
+			self.flush()
+
+	# execute single block from PC
+	# returns address of the last executed instruction
+	def execute(self, breakpoints: Collection[int] = ()) -> int:
+
+		if breakpoints is not self.breakpointsRef:
+			self.setBreakpoints(breakpoints)
+
+		valPC: int = self.m.getPC()
+		block: Block|None = None
+		# translated code doesn't check watchpoints
+		if not self.m.watchpoints:
+			block = self.blocks.get(valPC)
+			if block is None:
+				block = self.translate(valPC)
+		if block is None:
+			# nothing to translate -> interpret single instruction (or superinstruction)
+			lastAddress: int = self.m.execute()
+			if self.m.waitingDevice is not None:
+				self.lastCount = 0
+			else:
+				self.lastCount = 1 if lastAddress == valPC else 2
+			return lastAddress
+
+		lastAddress = block.function()
+		# RD without input (always first in its block) is executed again later, so it isn't counted
+		if self.m.waitingDevice is not None:
+			self.lastCount = 0
+			return lastAddress
+		count: int = block.count(lastAddress)
+		self.lastCount = count
+		cost, formats, pcNext = block.profile[count - 1]
+		self.m.counters.add(count, cost, formats, self.m.registers.PC != pcNext)
+		return lastAddress
+
+	def translate(self, start: int) -> Block|None:
+
+		m = self.m
+		decodedList: list[Decoded] = []
+		addresses: list[int] = []
+
+		addr: int = start
+		while len(decodedList) < Translator.maxBlockLength:
+			# stop before breakpoints (but not at the first instruction)
+			if addr != start and addr in self.breakpoints:
+				break
+			if addr > m.maxAddress:
+				break
+			decoded: Decoded = m.getDecoded(addr)
+			# only cached instructions are invalidated on stores
+			if m.decodeCache.get(addr) is not decoded or decoded.opcode is None:
+				break
+			# translate superinstructions one instruction at a time
+			if decoded.format == "fused":
+				decoded = decoded.operand[0]
+			# devices see counters without the rest of the block (see Machine.getCurrentCounts)
+			if addr != start and decoded.opcode in blockStart:
+				break
+			decodedList.append(decoded)
+			addresses.append(addr)
+			addr += decoded.length
+			if decoded.opcode in blockEnd or self.writesPC(decoded):
+				break
+
+		if len(decodedList) == 0:
+			return None
+
+		# generate source
+		lines: list[str] = ["def translated():"]
+		for i, decoded in enumerate(decodedList):
+			lines.append("\t# {:06x}: {:s}".format(addresses[i], str(decoded.opcode)))
+			lines += ["\t" + line for line in self.emit(decoded, addresses[i], i)]
+		# fall through to the next instruction (unreachable after jumps)
+		lines.append("\tr.PC = {:d}".format(addr))
+		lines.append("\treturn {:d}".format(addresses[-1]))
+		source: str = "\n".join(lines)
+		logger.debug("translated block:\n" + source)
+
+		# compile it into a closure over the machine state
+		alive: list[bool] = [True]
+		factory: str = "def factory(m, r, mem, refs, dirty, alive, decoded, record):\n"
+		factory += "\n".join(["\t" + line for line in source.split("\n")])
+		factory += "\n\treturn translated\n"
+		namespace: dict = {}
+		exec(compile(factory, "<block {:06x}>".format(start), "exec"), namespace)
+		function: Callable[[], int] = namespace["factory"](m, m.registers, m.mem, m.decodeRefs, m.dirtyPages, alive, decodedList, m.history.append)
+
+		block: Block = Block(start, addr, function, {a: i for i, a in enumerate(addresses)}, alive, decodedList, addresses)
+		self.blocks[start] = block
+		return block
+
+	# F2 instructions with PC as destination act like jumps
+	@staticmethod
+	def writesPC(decoded: Decoded) -> bool:
+		if decoded.format != "F2":
+			return False
+		r1, r2 = decoded.operand
+		match decoded.opcode:
+			case Opcode.CLEAR | Opcode.SHIFTL | Opcode.SHIFTR:
+				return r1 == 8
+			case Opcode.ADDR | Opcode.SUBR | Opcode.MULR | Opcode.DIVR | Opcode.RMO:
+				return r2 == 8
+			case _:
+				return False
+
+	# generate code for single instruction
+	def emit(self, decoded: Decoded, addr: int, i: int) -> list[str]:
+		pcNext: int = addr + decoded.length
+		lines: list[str]|None
+		match decoded.format:
+			case "F1":
+				lines = self.emitF1(decoded)
+			case "F2":
+				lines = self.emitF2(decoded, pcNext)
+			case _:
+				lines = self.emitSICF3F4(decoded, addr, pcNext)
+		if lines is None:
+			lines = self.emitFallback(decoded, addr, pcNext, i)
+		elif self.m.history.maxlen:
+			lines = ["record(decoded[{:d}])".format(i)] + lines
+		return lines
+
+	# let the interpreter execute the instruction
+	@staticmethod
+	def emitFallback(decoded: Decoded, addr: int, pcNext: int, i: int) -> list[str]:
+		return [
+			"r.PC = {:d}".format(pcNext),
+			"decoded[{:d}].executor(m, decoded[{:d}])".format(i, i),
+			"if not alive[0] or r.PC != {:d}:".format(pcNext),
+			"\treturn {:d}".format(addr)
+		]
+
+	@staticmethod
+	def emitF1(decoded: Decoded) -> list[str]|None:
+		match decoded.opcode:
+			case Opcode.FIX:
+				return ["r.A = int(r.F) & 0xFFFFFF"]
+			case Opcode.FLOAT:
+				return ["r.F = float(r.A)"]
+			case _:
+				return None
+
+	@staticmethod
+	def emitF2(decoded: Decoded, pcNext: int) -> list[str]|None:
+
+		r1, r2 = decoded.operand
+		# out of range registers and writes to PC are left to the interpreter
+		if r1 > 9 or r2 > 9 or Translator.writesPC(decoded):
+			return None
+		# PC is only updated at the end of the block
+		reg1: str = str(pcNext) if r1 == 8 else reg(r1)
+		reg2: str = str(pcNext) if r2 == 8 else reg(r2)
+
+		opcode: Opcode = decoded.opcode
+		if opcode in opcodeRegArithmetic:
+			# setReg ignores (and logs) values out of range
+			return [
+				"v = " + opcodeRegArithmetic[opcode].format(r1=reg1, r2=reg2),
+				"if 0 <= v <= 0xFFFFFF:",
+				"\t" + reg(r2) + " = v",
+				"else:",
+				"\tm.setReg({:d}, v)".format(r2)
+			]
+		match opcode:
+			case Opcode.CLEAR:
+				return [reg(r1) + " = 0"]
+			case Opcode.SHIFTL | Opcode.SHIFTR:
+				return [
+					"v = {:s} {:s} {:d}".format(reg1, "<<" if opcode == Opcode.SHIFTL else ">>", r2),
+					"if v <= 0xFFFFFF:",
+					"\t" + reg(r1) + " = v",
+					"else:",
+					"\tm.setReg({:d}, v)".format(r1)
+				]
+			case Opcode.COMPR:
+				return [
+					"a = ({:s} ^ 0x800000) - 0x800000".format(reg1),
+					"b = ({:s} ^ 0x800000) - 0x800000".format(reg2),
+					"r.SW = 0x80 if a > b else (0x40 if a < b else 0x00)"
+				]
+			case Opcode.TIXR:
+				return [
+					"r.X = (r.X + 1) & 0xFFFFFF",
+					"d = r.X - {:s}".format(reg1),
+					"r.SW = 0x80 if d > 0 else (0x40 if d < 0 else 0x00)"
+				]
+			case _:
+				return None
+
+	# target address: constant (int) or expression (str), None if the interpreter has to handle it
+	@staticmethod
+	def targetAddress(decoded: Decoded, pcNext: int) -> int|str|None:
+
+		n, i, x, b, p, e = decoded.nixbpe.getTuple()
+		uOperand, sOperand = decoded.operand
+
+		# indexing with # or @ is an error
+		if x and n != i:
+			return None
+
+		base: int|str
+		match (n, i, b, p):
+			case (0, 0, _, _):		# legacy SIC
+				base = uOperand
+			case (_, _, 1, 0):		# base-relative
+				base = "r.B + {:d}".format(uOperand)
+			case (_, _, 0, 1):		# PC-relative
+				base = pcNext + sOperand
+			case (_, _, 0, 0):		# direct
+				base = uOperand
+			case _:					# invalid combination of b and p
+				return None
+
+		if x:
+			return "({} + r.X) & 0xFFFFF".format(base)
+		if isinstance(base, int):
+			return base & 0xFFFFF
+		return "({:s}) & 0xFFFFF".format(base)
+
+	# load word at address (constant or local variable)
+	@staticmethod
+	def loadWord(address: int|str) -> str:
+		if isinstance(address, int):
+			if address <= 0xFFFFD:
+				return "(mem[{:d}] << 16 | mem[{:d}] << 8 | mem[{:d}])".format(address, address + 1, address + 2)
+			return "m.getUint24({:d})".format(address)
+		return "((mem[{a:s}] << 16 | mem[{a:s} + 1] << 8 | mem[{a:s} + 2]) if {a:s} <= 0xFFFFD else m.getUint24({a:s}))".format(a=address)
+
+	def emitSICF3F4(self, decoded: Decoded, addr: int, pcNext: int) -> list[str]|None:
+
+		opcode: Opcode = decoded.opcode
+		n, i = decoded.nixbpe.getN(), decoded.nixbpe.getI()
+		targetAddress: int|str|None = self.targetAddress(decoded, pcNext)
+		if targetAddress is None:
+			return None
+
+		lines: list[str] = []
+		# keep TA in a local variable if it has to be computed at runtime
+		ta: int|str = targetAddress
+		if isinstance(targetAddress, str):
+			lines.append("ta = " + targetAddress)
+			ta = "ta"
+
+		# store/jump instructions: operand is TA (or word at TA with @)
+		if opcode in isicf3f4.opcodeStoreJump:
+			operand: int|str = ta
+			if (n, i) == (1, 0):
+				lines.append("a = " + self.loadWord(ta))
+				operand = "a"
+
+			if opcode in opcodeStoreReg:
+				return lines + self.emitStoreWord(operand, reg(opcodeStoreReg[opcode]), addr, pcNext)
+			match opcode:
+				case Opcode.STCH:
+					return lines + self.emitStoreByte(operand, "r.A & 0xFF", addr, pcNext)
+				case Opcode.J:
+					return lines + ["r.PC = {}".format(operand), "return {:d}".format(addr)]
+				case Opcode.JEQ | Opcode.JGT | Opcode.JLT:
+					return lines + [
+						"r.PC = {} if r.SW == {:d} else {:d}".format(operand, opcodeJumpCC[opcode], pcNext),
+						"return {:d}".format(addr)
+					]
+				case Opcode.JSUB:
+					return lines + ["r.L = {:d}".format(pcNext), "r.PC = {}".format(operand), "return {:d}".format(addr)]
+				case _:
+					return None
+
+		if opcode == Opcode.RSUB:
+			return ["r.PC = r.L", "return {:d}".format(addr)]
+
+		# other instructions: operand is TA (#), word at TA or word at word at TA (@)
+		value: int|str
+		match (n, i):
+			case (0, 1):
+				value = ta
+			case (1, 0):
+				return None
+			case _:
+				lines.append("v = " + self.loadWord(ta))
+				value = "v"
+
+		if opcode in opcodeLoadReg:
+			return lines + ["{:s} = {}".format(reg(opcodeLoadReg[opcode]), value)]
+		if opcode in opcodeArithmetic:
+			return lines + ["r.A = " + opcodeArithmetic[opcode].format(str(value))]
+		match opcode:
+			case Opcode.LDCH:
+				byte: str = "{} & 0xFF".format(value) if (n, i) == (0, 1) else "{} >> 16".format(value)
+				return lines + ["r.A = (r.A & 0xFFFF00) | ({:s})".format(byte)]
+			case Opcode.COMP:
+				return lines + [
+					"a = (r.A ^ 0x800000) - 0x800000",
+					"b = ({} ^ 0x800000) - 0x800000".format(value),
+					"r.SW = 0x80 if a > b else (0x40 if a < b else 0x00)"
+				]
+			case Opcode.TIX:
+				return lines + [
+					"r.X = (r.X + 1) & 0xFFFFFF",
+					"d = r.X - {}".format(value),
+					"r.SW = 0x80 if d > 0 else (0x40 if d < 0 else 0x00)"
+				]
+			case _:
+				return None
+
+	# stores end the block if they overwrite (cached) code
+	@staticmethod
+	def emitStoreWord(address: int|str, value: str, addr: int, pcNext: int) -> list[str]:
+		if isinstance(address, int) and address > 0xFFFFD:
+			return ["m.setUint24({:d}, {:s})".format(address, value)]
+		lines: list[str] = [
+			"v = " + value,
+			"mem[{a}] = v >> 16",
+			"mem[{a} + 1] = (v >> 8) & 0xFF",
+			"mem[{a} + 2] = v & 0xFF",
+			"dirty[{a} >> 12] = dirty[({a} + 2) >> 12] = 0xFF",
+			"if refs[{a}] or refs[{a} + 1] or refs[{a} + 2]:",
+			"\tm.invalidateDecoded({a}, 3)",
+			"\tr.PC = {pcNext:d}",
+			"\treturn {addr:d}"
+		]
+		if isinstance(address, str):
+			lines = ["if {a} <= 0xFFFFD:"] + ["\t" + line for line in lines] + ["else:", "\tm.setUint24({a}, " + value + ")"]
+		return [line.format(a=address, pcNext=pcNext, addr=addr) for line in lines]
+
+	@staticmethod
+	def emitStoreByte(address: int|str, value: str, addr: int, pcNext: int) -> list[str]:
+		if isinstance(address, int) and address > 0xFFFFF:
+			return ["m.setUint8({:d}, {:s})".format(address, value)]
+		lines: list[str] = [
+			"mem[{a}] = " + value,
+			"dirty[{a} >> 12] = 0xFF",
+			"if refs[{a}]:",
+			"\tm.invalidateDecoded({a}, 1)",
+			"\tr.PC = {pcNext:d}",
+			"\treturn {addr:d}"
+		]
+		if isinstance(address, str):
+			lines = ["if {a} <= 0xFFFFF:"] + ["\t" + line for line in lines] + ["else:", "\tm.setUint8({a}, " + value + ")"]
+		return [line.format(a=address, pcNext=pcNext, addr=addr) for line in lines]
@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter.filedialog import askopenfilename
 from machine import Machine
+from breakpoints import Breakpoints
 
 import logging
 logger = logging.getLogger(__name__)
@@ -55,7 +56,7 @@ class Ui():
 	memoryIndex: int
 
 	# breakpoints from user input
-	breakpointsList: list[int]
+	breakpointsSet: Breakpoints
 
 	# used to check if simulation is running
 	simRunning: bool
@@ -137,7 +138,7 @@ class Ui():
 
 		self.breakpointsHelp = tk.Text(master=self.breakpointsLF, background=Ui.backgroundColor, height=2, highlightthickness=0, bd=0)
 		self.breakpointsHelp.pack(side=tk.TOP, fill=tk.X, expand=False)
-		self.breakpointsHelp.insert("1.0", "Breakpoints: enter comma separated addresses in decimal or hexadecimal form (e. g.: \"1234, 0xff, 96\")")
+		self.breakpointsHelp.insert("1.0", "Breakpoints: enter comma separated addresses in decimal or hexadecimal form or conditions (e. g.: \"1234, 0xff, PC == 0x30 and A > 10, PC == 96 and hits == 500\")")
 		self.breakpointsHelp.configure(state="disabled", wrap="word")
 
 		self.breakpointsInput = tk.Text(master=self.breakpointsLF, background=Ui.backgroundColorAlt, height=1)
@@ -152,7 +153,7 @@ class Ui():
 
 		self.breakpointsSubmit = tk.Button(master=self.breakpointsRF, text="Submit", bg=Ui.backgroundColorAlt, height=2, width=5, command=self.updateBreakpointsList)
 		self.breakpointsSubmit.pack(expand=True)
-		self.breakpointsList = []
+		self.breakpointsSet = Breakpoints()
 
 		self.interfaceButtons = tk.Frame(master=self.interface, background=Ui.backgroundColor, height=100)
 		self.interfaceButtons.pack(side=tk.TOP, fill=tk.X, expand=True)
@@ -216,8 +217,8 @@ class Ui():
 	def setFrequency(self, frequency: int):
 		self.frequency = frequency
 
-	def getBreakpointsList(self) -> list[int]:
-		return self.breakpointsList
+	def getBreakpoints(self) -> Breakpoints:
+		return self.breakpointsSet
 
 	def startStopUpdate(self, running: bool):
 		self.simRunning = running
@@ -231,23 +232,30 @@ class Ui():
 		except ValueError:
 			pass
 
+	# show achieved and target frequency of the running machine
+	def updateFrequencyHelp(self, achieved: float, target: float):
+		self.frequencyHelp.configure(state="normal")
+		self.frequencyHelp.delete("1.0", tk.END)
+		self.frequencyHelp.insert("1.0", "Frequency [Hz]: {:.0f} / {:.0f}".format(achieved, target))
+		self.frequencyHelp.configure(state="disabled")
+
 	def updateBreakpointsList(self, *event):
 		
-		# update breakpointsList values
+		# update breakpoints (new object, so hit counts start from zero)
 		strings = [x.strip() for x in self.breakpointsInput.get("1.0", tk.END).strip().split(",")]
 		if strings == [""]:
-			self.breakpointsList = []
+			self.breakpointsSet = Breakpoints()
 		else:
 			try:
-				self.breakpointsList = [(int(x, 16) if x.startswith("0x") else int(x)) for x in strings]
-			except ValueError:
-				logger.warn("invalid breakpoints in user input")
-				self.breakpointsList = []
+				self.breakpointsSet = Breakpoints(strings)
+			except ValueError as error:
+				logger.warn("invalid breakpoints in user input: " + str(error))
+				self.breakpointsSet = Breakpoints()
 
 		# show them on screen
 		self.breakpointsText.configure(state="normal")
 		self.breakpointsText.delete("1.0", tk.END)
-		self.breakpointsText.insert("1.0", str(self.breakpointsList))
+		self.breakpointsText.insert("1.0", str(self.breakpointsSet))
 		self.breakpointsText.update()
 		self.breakpointsText.configure(state="disabled")
 
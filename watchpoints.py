@@ -0,0 +1,70 @@
+from typing import NamedTuple
+
+from decoded import Decoded
+
+# memory range [start, end) watched for reads and/or writes
+class Watchpoint(NamedTuple):
+	start: int
+	end: int
+	read: bool
+	write: bool
+
+# memory access that hit a watchpoint (see Machine.run and StopReason.WATCHPOINT)
+class WatchHit(NamedTuple):
+	write: bool					# False for reads
+	address: int				# first accessed byte
+	length: int					# number of accessed bytes
+	oldValue: int				# value before the access
+	newValue: int				# value after the access (same as oldValue for reads)
+	PC: int|None = None			# address of the accessing instruction (filled in by Machine.run)
+	decoded: Decoded|None = None
+
+# watchpoints and per-page flags that tell memory accessors when to check them
+class Watchpoints():
+
+	# flags of a page
+	read: int = 0x01
+	write: int = 0x02
+
+	# 4 KiB pages
+	pageBits: int = 12
+
+	watchpoints: list[Watchpoint]
+	pages: bytearray
+
+	def __init__(self, memorySize: int):
+		self.watchpoints = []
+		self.pages = bytearray((memorySize >> Watchpoints.pageBits) + 1)
+
+	def __len__(self) -> int:
+		return len(self.watchpoints)
+
+	def getWatchpoints(self) -> list[Watchpoint]:
+		return self.watchpoints
+
+	def add(self, watchpoint: Watchpoint):
+		self.watchpoints.append(watchpoint)
+		self.updatePages()
+
+	def clear(self):
+		self.watchpoints.clear()
+		self.updatePages()
+
+	# recalculate flags in place (accessors keep a reference to pages)
+	def updatePages(self):
+		pages: bytearray = self.pages
+		pages[:] = bytes(len(pages))
+		for watchpoint in self.watchpoints:
+			flags: int = (Watchpoints.read if watchpoint.read else 0) | (Watchpoints.write if watchpoint.write else 0)
+			# accesses are up to 3 bytes long and are checked by the page of their first byte
+			first: int = max(watchpoint.start - 2, 0) >> Watchpoints.pageBits
+			last: int = min((watchpoint.end - 1) >> Watchpoints.pageBits, len(pages) - 1)
+			for page in range(first, last + 1):
+				pages[page] |= flags
+
+	# does access of bytes [address, address+length) hit any watchpoint
+	def match(self, address: int, length: int, write: bool) -> bool:
+		for watchpoint in self.watchpoints:
+			if (watchpoint.write if write else watchpoint.read) and watchpoint.start < address + length and address < watchpoint.end:
+				return True
+		return False